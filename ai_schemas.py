@@ -0,0 +1,286 @@
+"""Validation and repair of the JSON returned by the AI provider.
+
+Generated exams and grading results used to be trusted as-is, so one
+malformed reply meant paying for a full regeneration. Replies now go
+through `repair_json` (code fences, prose around the object, trailing
+commas, comments, Python literals, raw newlines in strings and truncated
+output) and are validated against the models below before the app sees
+them. `ExamQuestionStream` parses a streamed exam incrementally and reports
+every question as soon as it is complete.
+"""
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Type, TypeVar
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+Model = TypeVar("Model", bound=BaseModel)
+
+def _number(value):
+    """Accept 85, "85", "85/100" or "85,5" for a score"""
+    if isinstance(value, str):
+        match = re.search(r"-?\d+(?:[.,]\d+)?", value)
+        if match:
+            return float(match.group().replace(",", "."))
+    return value
+
+class MultipleChoiceQuestion(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    
+    question: str
+    options: List[str] = Field(min_length=2)
+    answer: Optional[str] = Field(default=None, validation_alias=AliasChoices("answer", "correct_answer", "jawaban"))
+    
+    @field_validator("options", mode="before")
+    @classmethod
+    def _lettered_options(cls, options):
+        """Options must start with their letter, the page grades on selected[0]"""
+        if isinstance(options, dict):
+            options = [f"{letter}. {text}" for letter, text in options.items()]
+        if isinstance(options, list) and all(isinstance(option, str) for option in options):
+            return [
+                option if re.match(r"^[A-Za-z][.)]\s", option) else f"{chr(65 + i)}. {option}"
+                for i, option in enumerate(options)
+            ]
+        return options
+    
+    @field_validator("answer", mode="before")
+    @classmethod
+    def _answer_letter(cls, answer):
+        if isinstance(answer, str):
+            answer = answer.strip()[:1].upper()
+        return answer or None
+
+class EssayQuestion(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    
+    question: str
+
+class ExamQuestions(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    
+    multiple_choice: List[MultipleChoiceQuestion] = Field(min_length=1)
+    essay_questions: List[EssayQuestion] = []
+    
+    @field_validator("essay_questions", mode="before")
+    @classmethod
+    def _essay_strings(cls, essays):
+        if isinstance(essays, list):
+            return [{"question": essay} if isinstance(essay, str) else essay for essay in essays]
+        return essays
+
+class ExamGrade(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    
+    total_score: float = Field(ge=0, le=100)
+    multiple_choice_score: float = 0
+    essay_score: float = 0
+    feedback: str = ""
+    
+    @field_validator("total_score", "multiple_choice_score", "essay_score", mode="before")
+    @classmethod
+    def _scores(cls, value):
+        return _number(value)
+
+class ReflectionGrade(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    
+    score: float = Field(ge=0, le=100)
+    correction: str = ""
+    feedback: str = ""
+    
+    @field_validator("score", mode="before")
+    @classmethod
+    def _score(cls, value):
+        return _number(value)
+
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+def repair_json(text: str) -> str:
+    """Turn a model's almost-JSON reply into parseable JSON.
+    
+    Scans once, keeping track of strings and open containers: text before
+    the first brace/bracket and after the top-level value is dropped,
+    comments and trailing commas are removed, Python literals become JSON
+    ones, raw newlines inside strings are escaped, and anything cut off at
+    the end (open string, dangling key, open containers) is closed.
+    """
+    text = re.sub(r"```(?:json)?", "", text)
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise ValueError("No JSON object in AI response")
+    
+    out: List[str] = []
+    stack: List[str] = []
+    quote = None  # delimiter of the string being copied
+    escaped = False
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+                if ch == "'":
+                    out.pop()  # \' is not a JSON escape
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+                ch = '"'
+            elif ch == '"':
+                ch = '\\"'  # inside a single-quoted string
+            elif ch == "\n":
+                ch = "\\n"
+            out.append(ch)
+            i += 1
+            continue
+        
+        if ch in "\"'":
+            quote = ch
+            ch = '"'
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            while out and out[-1] in " \n\t\r,":
+                out.pop()
+            if not stack:
+                break
+            ch = stack.pop()
+        elif text.startswith("//", i):
+            i = text.find("\n", i)
+            i = len(text) if i < 0 else i
+            continue
+        elif ch.isalpha() or ch == "_":
+            word = re.match(r"\w+", text[i:]).group()
+            i += len(word)
+            if text[i:].lstrip().startswith(":"):
+                word = f'"{word}"'  # unquoted key
+            out.append(_LITERALS.get(word, word))
+            continue
+        out.append(ch)
+        i += 1
+        if not stack:
+            break
+    
+    if quote:
+        if escaped:
+            out.pop()
+        out.append('"')
+    # Drop a dangling comma, colon or key left by truncation
+    repaired = re.sub(r'(,\s*"[^"]*"\s*:?\s*|,\s*|:\s*)$', "", "".join(out).rstrip())
+    repaired = re.sub(r'([{,]\s*)"[^"]*"\s*$', r"\1", repaired).rstrip().rstrip(",")
+    return repaired + "".join(reversed(stack))
+
+def load_json(raw: Any) -> Any:
+    """Parse a reply that may already be decoded, valid JSON, or repairable JSON"""
+    if not isinstance(raw, str):
+        return raw
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return json.loads(repair_json(raw))
+
+def parse_model(raw: Any, model: Type[Model]) -> Dict[str, Any]:
+    """Validate a reply against `model`; raises ValueError with a readable message"""
+    try:
+        return model.model_validate(load_json(raw)).model_dump()
+    except ValueError as e:  # ValidationError, JSONDecodeError or nothing to repair
+        raise ValueError(f"Respons AI tidak valid ({model.__name__}): {e}") from e
+
+def parse_exam_questions(raw: Any) -> Dict[str, Any]:
+    return parse_model(raw, ExamQuestions)
+
+def parse_exam_grade(raw: Any) -> Dict[str, Any]:
+    return parse_model(raw, ExamGrade)
+
+def parse_reflection_grade(raw: Any) -> Dict[str, Any]:
+    return parse_model(raw, ReflectionGrade)
+
+class ExamQuestionStream:
+    """Incremental parser for a streamed exam.
+    
+    feed() takes raw text chunks; whenever another question is complete it
+    calls `on_partial` with everything complete so far (same shape as the
+    final result). Only the new text is scanned, tracking strings and
+    nesting, and each question is parsed once its closing bracket or quote
+    arrives, so a whole reply costs O(n) however it is chunked.
+    """
+    
+    FIELDS = {"multiple_choice": MultipleChoiceQuestion, "essay_questions": EssayQuestion}
+    
+    def __init__(self, on_partial: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_partial = on_partial
+        self.text = ""
+        self._complete: Dict[str, List[Dict[str, Any]]] = {field: [] for field in self.FIELDS}
+        self._broken = set()  # lists with an invalid item: later items are not reported out of order
+        self._pos = 0
+        self._depth = 0
+        self._quote = None  # quote character closing the string being scanned
+        self._escaped = False
+        self._string_start = 0
+        self._last_string = None
+        self._key = None  # latest top-level key
+        self._field = None  # question list being scanned
+        self._item_start = None
+    
+    def feed(self, chunk: str):
+        self.text += chunk
+        if self.on_partial is None:
+            return
+        before = sum(map(len, self._complete.values()))
+        self._scan()
+        if sum(map(len, self._complete.values())) > before:
+            self.on_partial({field: list(items) for field, items in self._complete.items()})
+    
+    def _scan(self):
+        text = self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._quote:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == self._quote:
+                    self._quote = None
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1:i]
+                    elif self._depth == 2 and self._item_start == self._string_start:
+                        self._add_item(text[self._item_start:i + 1])
+            elif char in "\"'" and self._depth:
+                self._quote = char
+                self._string_start = i
+                if self._depth == 2 and self._field:
+                    self._item_start = i
+            elif char == ":" and self._depth == 1:
+                self._key = self._last_string
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2:
+                    self._field = self._key if char == "[" and self._key in self.FIELDS else None
+                elif self._depth == 3 and self._field:
+                    self._item_start = i
+            elif char in "}]" and self._depth:
+                if self._depth == 3 and self._item_start is not None:
+                    self._add_item(text[self._item_start:i + 1])
+                elif self._depth == 2:
+                    self._field = None
+                self._depth -= 1
+        self._pos = len(text)
+    
+    def _add_item(self, raw: str):
+        field, self._item_start = self._field, None
+        if field in self._broken:
+            return
+        try:
+            try:
+                item = json.loads(raw)
+            except ValueError:
+                item = json.loads(repair_json(raw)) if raw.startswith("{") else raw[1:-1]
+            if isinstance(item, str) and field == "essay_questions":
+                item = {"question": item}
+            self._complete[field].append(self.FIELDS[field].model_validate(item).model_dump())
+        except ValueError:  # ValidationError, JSONDecodeError or nothing to repair
+            self._broken.add(field)
+    
+    def finish(self) -> Dict[str, Any]:
+        return parse_exam_questions(self.text)
@@ -0,0 +1,202 @@
+import json
+import time
+from typing import Dict, Any, Callable, Optional, Tuple
+from ai_schemas import ExamQuestionStream, parse_exam_grade, parse_exam_questions, parse_reflection_grade
+from cache_manager import CacheManager
+from circuit_breaker import BreakerRegistry, provider_breakers
+from config import Config
+from metrics import track_ai_call, estimate_tokens
+from single_flight import SingleFlight
+from tenants import charge_tokens
+
+# Shared by every AIService in the process so identical requests coalesce across sessions
+ai_flights = SingleFlight()
+
+def create_ai_manager():
+    """Build the configured AI backend"""
+    if Config.AI_BACKEND == "fake":
+        from fake_ai import FakeAIManager
+        return FakeAIManager.from_env()
+    from ai_manager import AIManager
+    return AIManager()
+
+class AIService:
+    """Entry point for every AI call made by the app (caching + instrumentation)"""
+    
+    def __init__(self, ai=None, cache=None, flights=None, breakers: BreakerRegistry = None):
+        self.ai = ai or create_ai_manager()
+        self.cache = cache or CacheManager()
+        self.flights = flights or ai_flights
+        self.breakers = breakers or provider_breakers
+    
+    @property
+    def provider(self) -> str:
+        """Provider the backend will try first on the next call"""
+        return getattr(self.ai, "current_provider", None) or Config.AI_PROVIDERS[0]
+    
+    def _record_usage(self, record, prompt_text: str, output_text: str):
+        """Use provider-reported token usage when available, otherwise estimate"""
+        usage = getattr(self.ai, "last_usage", None) or {}
+        record.input_tokens = usage.get("input_tokens") or estimate_tokens(prompt_text)
+        record.output_tokens = usage.get("output_tokens") or estimate_tokens(output_text)
+        charge_tokens(record.input_tokens + record.output_tokens)
+    
+    def _call(self, record, fn: Callable, *args):
+        """Call the provider through its circuit breaker (fails fast while it is down).
+        
+        A backend that fails over internally reports the provider that
+        answered (or failed last) as `last_provider`. The outcome is charged
+        to that provider's breaker and `record.provider`; when it is not the
+        provider the call was reserved on, that one is charged a failure,
+        since the backend only moves on when it fails.
+        """
+        expected = self.provider
+        breaker = self.breakers.get(expected)
+        breaker.before_call()
+        started = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception:
+            self._settle(record, breaker, expected, True)
+            raise
+        self._settle(record, breaker, expected, False, time.perf_counter() - started)
+        return result
+    
+    def _settle(self, record, breaker, expected: str, failed: bool, elapsed: float = 0.0):
+        served = getattr(self.ai, "last_provider", None) or expected
+        record.provider = served
+        if served == expected:
+            breaker.record(failed, elapsed)
+        else:
+            breaker.record(True)
+            self.breakers.get(served).record(failed, elapsed)
+    
+    def get_response(self, prompt: str, subject: str, grade_level: str, question: Optional[str] = None) -> str:
+        """Get AI response, served from cache when possible.
+        
+        Chat replies pass the student's `question`: their cache entry is keyed
+        on the normalized question instead of the prompt, and only a reply
+        given without conversation context (prompt == question) is looked up
+        or stored, so an answer that depends on earlier turns is never
+        served to anyone else.
+        """
+        with track_ai_call("get_response", self.provider, subject) as record:
+            cached = self._cached(prompt, subject, grade_level, question)
+            if cached is not None:
+                record.cache_hit = True
+                record.mark_first_token()
+                return cached
+            
+            key = self.cache.cache_key(prompt, subject, grade_level)
+            response, shared = self.flights.do(
+                key, self._fetch_response, record, prompt, subject, grade_level, question
+            )
+            record.coalesced = shared
+            record.mark_first_token()
+            return response
+    
+    def _cached(self, prompt: str, subject: str, grade_level: str, question: Optional[str]) -> Optional[str]:
+        if question is None:
+            return self.cache.get_cached_response(prompt, subject, grade_level)
+        if prompt == question:
+            return self.cache.get_chat_response(question, subject, grade_level)
+        return None
+    
+    def _fetch_response(self, record, prompt: str, subject: str, grade_level: str,
+                        question: Optional[str] = None) -> str:
+        """Leader path of get_response: re-check the cache, call the provider, store the answer"""
+        cached = self._cached(prompt, subject, grade_level, question)
+        if cached is not None:
+            record.cache_hit = True
+            return cached
+        response = self._call(record, self.ai.get_response, prompt, subject, grade_level)
+        self._record_usage(record, prompt, response)
+        if question is None:
+            self.cache.save_to_cache(prompt, response, subject, grade_level)
+        elif prompt == question:
+            self.cache.save_chat_response(question, response, subject, grade_level)
+        return response
+    
+    def generate_response(self, prompt: str, subject: str, grade_level: str, operation: str = "generate_response") -> str:
+        """Call the provider directly, bypassing the cache (the caller stores the answer)"""
+        with track_ai_call(operation, self.provider, subject) as record:
+            response = self._call(record, self.ai.get_response, prompt, subject, grade_level)
+            record.mark_first_token()
+            self._record_usage(record, prompt, response)
+            return response
+    
+    def get_response_with_fallback(self, prompt: str, subject: str, grade_level: str,
+                                   question: str, user_id: Optional[str] = None) -> Tuple[str, bool]:
+        """Like get_response, but never waits on a failing provider.
+        
+        When the provider errors or its breaker is open, answers at once with
+        the nearest cached answer to `question` (or to one of `user_id`'s
+        earlier questions) or a canned reply. Returns (response, degraded).
+        """
+        try:
+            return self.get_response(prompt, subject, grade_level, question), False
+        except Exception:
+            with track_ai_call("get_response", self.provider, subject) as record:
+                record.degraded = True
+                record.mark_first_token()
+                cached = self.cache.find_similar_response(question, subject, grade_level, user_id=user_id)
+                return cached or self.canned_response(subject), True
+    
+    @staticmethod
+    def canned_response(subject: str) -> str:
+        return (f"Maaf, guru AI {subject} sedang tidak dapat dihubungi. Sambil menunggu, "
+                "coba baca kembali materi ini di buku pelajaran Anda dan kirim pertanyaan lagi dalam beberapa menit.")
+    
+    def grade_reflection(self, reflection_text: str, subject: str, grade_level: str) -> Dict[str, Any]:
+        """Grade a reflection"""
+        with track_ai_call("grade_reflection", self.provider, subject) as record:
+            raw = self._call(record, self.ai.grade_reflection, reflection_text, subject, grade_level)
+            record.mark_first_token()
+            result = parse_reflection_grade(raw)
+            self._record_usage(record, reflection_text, json.dumps(result, ensure_ascii=False))
+            return result
+    
+    def generate_exam_questions(self, subject: str, grade_level: str,
+                                on_partial: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Generate exam questions for a subject.
+        
+        When the backend can stream the exam, `on_partial` receives the
+        questions completed so far while the rest is still being generated.
+        Only FakeAIManager has stream_exam_questions; the live AIManager
+        returns the whole exam at once, so in production the page shows the
+        questions when all of them are ready and `on_partial` is not called.
+        """
+        with track_ai_call("generate_exam_questions", self.provider, subject) as record:
+            key = self.cache.cache_key("generate_exam_questions", subject, grade_level)
+            questions, shared = self.flights.do(key, self._fetch_exam_questions, record, subject, grade_level, on_partial)
+            record.coalesced = shared
+            record.mark_first_token()
+            return questions
+    
+    def _fetch_exam_questions(self, record, subject: str, grade_level: str, on_partial=None) -> Dict[str, Any]:
+        stream = getattr(self.ai, "stream_exam_questions", None)  # fake backend only
+        if stream is None:
+            questions = parse_exam_questions(self._call(record, self.ai.generate_exam_questions, subject, grade_level))
+        else:
+            def consume():
+                parser = ExamQuestionStream(on_partial)
+                for chunk in stream(subject, grade_level):
+                    record.mark_first_token()
+                    parser.feed(chunk)
+                return parser.finish()
+            questions = self._call(record, consume)
+        self._record_usage(record, f"{subject} {grade_level}", json.dumps(questions, ensure_ascii=False))
+        return questions
+    
+    def grade_exam(self, questions: Dict[str, Any], answers: Dict[str, str], subject: str = None) -> Dict[str, Any]:
+        """Grade a completed exam"""
+        with track_ai_call("grade_exam", self.provider, subject) as record:
+            raw = self._call(record, self.ai.grade_exam, questions, answers)
+            record.mark_first_token()
+            result = parse_exam_grade(raw)
+            self._record_usage(
+                record,
+                json.dumps(questions, ensure_ascii=False) + json.dumps(answers, ensure_ascii=False),
+                json.dumps(result, ensure_ascii=False)
+            )
+            return result
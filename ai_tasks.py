@@ -0,0 +1,138 @@
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, Any, Callable, List
+from chat_context import ChatContextManager
+from config import Config
+from export import export_records
+from job_queue import report_progress
+from prescreen import PrescreenManager, minhash
+from tenants import current_tenant
+
+def exam_question_scores(questions: Dict[str, Any], answers: Dict[str, str], result: Dict[str, Any]) -> List:
+    """Per-question scores (multiple choice first, then essays); None where unknown.
+    
+    Multiple choice is scored locally (2 points) when the question carries
+    its answer key; essay scores are taken from the grading result if the
+    provider returned them per question.
+    """
+    scores = []
+    for i, mc in enumerate(questions.get('multiple_choice', [])):
+        key = str(mc.get('answer') or mc.get('correct_answer') or "").strip()[:1].upper()
+        given = (answers.get(f"mc_{i}") or "")[:1].upper()
+        scores.append((2 if given == key else 0) if key else None)
+    essay_scores = result.get('essay_scores') or []
+    for i in range(len(questions.get('essay_questions', []))):
+        score = essay_scores[i] if i < len(essay_scores) else None
+        if isinstance(score, dict):
+            score = score.get('score')
+        scores.append(float(score) if isinstance(score, (int, float)) else None)
+    return scores
+
+def build_handlers(ai, db) -> Dict[str, Callable[[Dict[str, Any]], Any]]:
+    """Map job kinds to the work they perform.
+    
+    Handlers run on background worker threads, so they only receive the
+    JSON payload and must never touch st.session_state. Anything a page
+    needs later is returned (and stored in the job row); database writes
+    happen here so a finished generation is saved even if the student has
+    already left the page.
+    """
+    context = ChatContextManager(ai, db)
+    prescreen = PrescreenManager(db)
+    
+    def get_response(payload):
+        return ai.get_response(payload['prompt'], payload['subject'], payload['grade_level'])
+    
+    def chat_reply(payload):
+        conversation_id = payload.get('conversation_id')
+        prompt = context.build_prompt(payload['user_id'], payload['subject'], payload['message'], conversation_id)
+        response, degraded = ai.get_response_with_fallback(
+            prompt, payload['subject'], payload['grade_level'], payload['message'], payload['user_id']
+        )
+        provider = 'degraded' if degraded else ai.provider
+        db.save_chat({
+            'user_id': payload['user_id'],
+            'subject': payload['subject'],
+            'grade_level': payload['grade_level'],
+            'user_message': payload['message'],
+            'ai_response': response,
+            'ai_provider': provider,
+            'conversation_id': conversation_id
+        })
+        if not degraded:
+            try:
+                context.update_summary(payload['user_id'], payload['subject'], payload['grade_level'], conversation_id)
+            except Exception:
+                # The reply is already saved; summarization is retried on the next turn
+                pass
+        return {'response': response, 'provider': provider, 'degraded': degraded}
+    
+    def grade_reflection(payload):
+        signature = minhash(payload['reflection_text'])
+        result = None
+        if Config.PRESCREEN_ENABLED:
+            result = prescreen.screen_reflection(
+                payload['reflection_text'], payload.get('story'), payload['subject'], payload['user_id'], signature
+            )
+            if result and result.get('rejected'):
+                return result
+        if result is None:
+            result = ai.grade_reflection(payload['reflection_text'], payload['subject'], payload['grade_level'])
+        db.save_reflection({
+            'user_id': payload['user_id'],
+            'subject': payload['subject'],
+            'grade_level': payload.get('grade_level'),
+            'reflection_text': payload['reflection_text'],
+            'correction': result['correction'],
+            'score': result['score'],
+            'signature': signature
+        })
+        return result
+    
+    def generate_exam_questions(payload):
+        return ai.generate_exam_questions(payload['subject'], payload['grade_level'], on_partial=report_progress)
+    
+    def grade_exam(payload):
+        questions, answers = payload['questions'], payload['answers']
+        signatures = [
+            minhash(answers.get(f"essay_{i}", "")) for i in range(len(questions.get('essay_questions', [])))
+        ]
+        result = None
+        if Config.PRESCREEN_ENABLED:
+            reasons = prescreen.screen_essays(questions, answers, payload['user_id'], signatures)
+            result = prescreen.grade_exam_locally(questions, answers, payload['subject'], reasons)
+        if result is None:
+            result = ai.grade_exam(questions, answers, payload['subject'])
+        db.save_exam({
+            'user_id': payload['user_id'],
+            'subject': payload['subject'],
+            'grade_level': payload.get('grade_level'),
+            'exam_data': json.dumps(payload['questions'], ensure_ascii=False),
+            'answers': json.dumps(payload['answers'], ensure_ascii=False),
+            'question_scores': exam_question_scores(payload['questions'], payload['answers'], result),
+            'essay_signatures': signatures,
+            'score': result['total_score']
+        })
+        return result
+    
+    def export(payload):
+        """Export one dataset of the job's school to EXPORT_DIR"""
+        fmt = payload.get('format', 'csv')
+        path = os.path.join(Config.EXPORT_DIR, f"{payload['dataset']}-{uuid.uuid4().hex[:8]}.{fmt}")
+        rows = export_records(
+            db, payload['dataset'], path, fmt, current_tenant(),
+            datetime.fromisoformat(payload['since']) if payload.get('since') else None,
+            datetime.fromisoformat(payload['until']) if payload.get('until') else None
+        )
+        return {'path': path, 'rows': rows}
+    
+    return {
+        'get_response': get_response,
+        'chat_reply': chat_reply,
+        'grade_reflection': grade_reflection,
+        'generate_exam_questions': generate_exam_questions,
+        'grade_exam': grade_exam,
+        'export_records': export
+    }
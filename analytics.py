@@ -0,0 +1,101 @@
+"""Class-level analytics for the teacher dashboard.
+
+Everything here reads the activity_rollups table, which insert_rows keeps
+up to date in the same transaction as the raw chat/reflection/exam rows.
+A class view costs a few grouped reads over (hours or days) x subjects x
+score bins, however many students and attempts there are.
+
+Databases with chats/reflections/exams from before rollups existed need
+one rebuild (the app does not backfill on its own):
+
+    python analytics.py rebuild --tenant sman1   # recompute rollups from raw rows
+    python analytics.py summary --days 7 --grade SMP
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from config import Config
+
+KINDS = ("chat", "reflection", "exam")
+BIN_LABELS = tuple(f"{low}-{low + 9}" for low in range(0, 90, 10)) + ("90-100",)
+
+class AnalyticsManager:
+    def __init__(self, db):
+        self.db = db
+    
+    @staticmethod
+    def period_for(hours: int) -> str:
+        return "hour" if hours <= Config.DASHBOARD_HOURLY_WINDOW_HOURS else "day"
+    
+    def class_overview(self, tenant_id: Optional[str], hours: int, grade_level: Optional[str] = None,
+                       subject: Optional[str] = None) -> Dict:
+        """Activity, averages and score histograms of the last `hours` for one school"""
+        period = self.period_for(hours)
+        since = datetime.utcnow() - timedelta(hours=hours)
+        
+        def rollups(*group_by):
+            return self.db.get_rollups(tenant_id, period, since, group_by=group_by,
+                                       grade_level=grade_level, subject=subject)
+        
+        totals = {kind: {"events": 0, "scored": 0, "score_total": 0.0} for kind in KINDS}
+        for row in rollups("kind"):
+            totals[row["kind"]] = row
+        
+        activity: Dict[datetime, Dict[str, int]] = {}
+        for row in rollups("bucket_start", "kind"):
+            activity.setdefault(row["bucket_start"], dict.fromkeys(KINDS, 0))[row["kind"]] = row["events"]
+        
+        subjects: Dict[str, Dict] = {}
+        for row in rollups("subject", "kind"):
+            entry = subjects.setdefault(row["subject"], {"subject": row["subject"]})
+            entry[row["kind"]] = row["events"]
+            if row["kind"] != "chat":
+                entry[f"{row['kind']}_avg"] = _average(row)
+        
+        histograms = {kind: [0] * len(BIN_LABELS) for kind in ("reflection", "exam")}
+        for row in rollups("kind", "score_bin"):
+            if row["kind"] in histograms and row["score_bin"] >= 0:
+                histograms[row["kind"]][row["score_bin"]] += row["events"]
+        
+        return {
+            "period": period,
+            "since": since,
+            "totals": {kind: row["events"] for kind, row in totals.items()},
+            "averages": {kind: _average(totals[kind]) for kind in ("reflection", "exam")},
+            "activity": [dict(bucket_start=bucket, **counts) for bucket, counts in sorted(activity.items())],
+            "subjects": sorted(subjects.values(), key=lambda entry: entry["subject"]),
+            "histograms": histograms
+        }
+
+def _average(row: Dict) -> Optional[float]:
+    return row["score_total"] / row["scored"] if row["scored"] else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Class analytics rollups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("rebuild", help="Recompute activity_rollups from the raw tables")
+    rebuild.add_argument("--tenant", help="Only this school (default: all)")
+    summary = commands.add_parser("summary", help="Print a school's class overview as JSON")
+    summary.add_argument("--tenant", default=Config.DEFAULT_TENANT)
+    summary.add_argument("--days", type=int, default=7)
+    summary.add_argument("--grade", choices=list(Config.SUBJECTS))
+    summary.add_argument("--subject")
+    args = parser.parse_args(argv)
+    
+    from database import DatabaseManager
+    
+    db = DatabaseManager()
+    try:
+        if args.command == "rebuild":
+            print(f"Rebuilt {db.rebuild_rollups(args.tenant)} rollup rows")
+        else:
+            overview = AnalyticsManager(db).class_overview(args.tenant, args.days * 24, args.grade, args.subject)
+            print(json.dumps(overview, indent=2, default=str))
+    finally:
+        db.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
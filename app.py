@@ -1,18 +1,18 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import json
 import time
+import uuid
 from datetime import datetime, timedelta
 from typing import Dict, Any
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
-from config import Config
-from auth import AuthManager
-from database import DatabaseManager
-from ai_manager import AIManager
-from security import SecurityManager
-from cache_manager import CacheManager
+from config import Config, subjects_for
+from analytics import BIN_LABELS
+from database import Reminder
+from prescreen import check_text, reflection_languages
+from prompts import PromptBudgetError, prompts
+from resources import get_resources
+from session_budget import chat_replies
 
 # Set page config
 st.set_page_config(
@@ -24,11 +24,15 @@ st.set_page_config(
 
 class EducationPlatform:
     def __init__(self):
-        self.auth = AuthManager()
-        self.db = DatabaseManager()
-        self.ai = AIManager()
-        self.security = SecurityManager()
-        self.cache = CacheManager()
+        # Built once per process; only session_state is per user
+        resources = get_resources()
+        self.auth = resources.auth
+        self.db = resources.db
+        self.security = resources.security
+        self.cache = resources.cache
+        self.jobs = resources.jobs
+        self.analytics = resources.analytics
+        self.sessions = resources.sessions
         
         # Initialize session state
         if 'page' not in st.session_state:
@@ -41,9 +45,89 @@ class EducationPlatform:
             st.session_state.exam_questions = None
         if 'exam_answers' not in st.session_state:
             st.session_state.exam_answers = {}
+        self.sessions.touch()
+    
+    def _submit_job(self, state_key: str, kind: str, payload: Dict[str, Any], submission: str = None):
+        """Submit a background AI job and remember its id in the session"""
+        st.session_state[state_key] = self.jobs.submit(
+            kind, payload, st.session_state.user_id, st.session_state.get('tenant_id'), submission=submission
+        )
+    
+    @staticmethod
+    def _form_nonce(form: str) -> str:
+        """Id of the next submission of a form, generated when the form is first rendered.
+        
+        Repeats of that submission (double clicks, resent requests) reuse its
+        job. Forms and buttons are keyed on the nonce, so a click on a form
+        that was already submitted cannot land on its successor.
+        """
+        nonces = st.session_state.setdefault('form_nonces', {})
+        return nonces.setdefault(form, uuid.uuid4().hex)
+    
+    @staticmethod
+    def _next_form_nonce(form: str):
+        """Start a new submission once the current one has been handed to a job"""
+        st.session_state.form_nonces[form] = uuid.uuid4().hex
+    
+    @staticmethod
+    def _render_prompt(name: str, **values):
+        """Render a prompt template, or show an error and return None when it is over its token budget"""
+        try:
+            return prompts.render(name, **values)
+        except PromptBudgetError:
+            st.error("Teks terlalu panjang untuk diproses. Persingkat lalu coba lagi.")
+            return None
+    
+    @staticmethod
+    def _rerun_panel():
+        """Rerun only the fragment being run, or the whole page during a full run"""
+        ctx = get_script_run_ctx()
+        st.rerun(scope="fragment" if ctx and ctx.fragment_ids_this_run else "app")
+    
+    def _poll_job(self, state_key: str, spinner_text: str, consume: bool = False, on_partial=None):
+        """Return the result of the job stored under state_key, rerunning while it is still running.
+        
+        on_partial renders the partial result a running job has stored so far.
+        """
+        job_id = st.session_state.get(state_key)
+        if not job_id:
+            return None
+        
+        # Back off while the job runs: each rerun waits twice as long (the wait ends as soon as
+        # the job finishes), except when partial results are shown as they arrive
+        polls = st.session_state.setdefault('job_polls', {})
+        timeout = Config.JOB_POLL_SECONDS
+        if not on_partial:
+            timeout = min(Config.JOB_POLL_SECONDS * 2 ** polls.get(job_id, 0), Config.JOB_POLL_MAX_SECONDS)
+        with st.spinner(spinner_text):
+            job = self.jobs.wait(job_id, timeout)
+        
+        if not job or job['status'] in ('done', 'failed'):
+            polls.pop(job_id, None)
+        if not job:
+            del st.session_state[state_key]
+            return None
+        if job['status'] == 'failed':
+            del st.session_state[state_key]
+            st.error(f"Error: {job['error']}")
+            return None
+        if job['status'] != 'done':
+            # Still generating: the job keeps running even if this rerun is interrupted
+            polls[job_id] = polls.get(job_id, 0) + 1
+            if on_partial and job['result']:
+                on_partial(job['result'])
+            self._rerun_panel()
+        
+        if consume:
+            del st.session_state[state_key]
+        return job['result']
     
     def send_otp_email(self, email: str, otp: str):
         """Send OTP email"""
+        import smtplib
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+        
         try:
             msg = MIMEMultipart()
             msg['From'] = Config.SMTP_USERNAME
@@ -99,11 +183,14 @@ class EducationPlatform:
                     # Check if user exists in DB
                     user = self.db.get_user_by_email(email)
                     if not user:
-                        self.db.add_user({
+                        user_data = {
                             'id': user_info['id'],
                             'email': email,
                             'name': user_info['name']
-                        })
+                        }
+                        user = self.db.add_user(user_data)
+                    st.session_state.tenant_id = user.tenant_id
+                    st.session_state.is_teacher = user.role == 'teacher' or email.lower() in Config.TEACHER_EMAILS
                     
                     st.session_state.page = 'select_grade'
                     st.rerun()
@@ -177,6 +264,11 @@ class EducationPlatform:
                         st.session_state.page = 'reminder'
                     st.rerun()
         
+        if st.session_state.get('is_teacher'):
+            if st.button("🏫 Dasbor Kelas", use_container_width=True, key="menu_class_dashboard"):
+                st.session_state.page = 'class_dashboard'
+                st.rerun()
+        
         st.markdown("---")
         if st.button("Logout"):
             self.auth.logout_user()
@@ -192,61 +284,157 @@ class EducationPlatform:
         if st.button("← Kembali ke Menu Utama"):
             st.session_state.page = 'main_menu'
             st.session_state.current_subject = None
-            st.session_state.chat_history = []
+            self._reset_chat()
+            st.session_state.pop('chat_job', None)
             st.rerun()
         
         if not st.session_state.current_subject:
             # Show subject selection
             st.subheader("Pilih Mata Pelajaran")
             
-            subjects = Config.SUBJECTS.get(st.session_state.grade_level, [])
+            subjects = subjects_for(st.session_state.grade_level)
             cols = st.columns(4)
             
             for idx, subject in enumerate(subjects):
                 with cols[idx % 4]:
                     if st.button(subject, use_container_width=True, key=f"subj_{idx}"):
                         st.session_state.current_subject = subject
-                        st.session_state.chat_history = []
+                        self._reset_chat()
                         st.rerun()
         else:
             # Show chat interface
             self._show_chat_interface()
+            self._show_chat_search()
+    
+    @staticmethod
+    def _reset_chat():
+        # Context sent to the model only covers turns of this conversation
+        st.session_state.chat_conversation = uuid.uuid4().hex
+        st.session_state.chat_history = []
+        st.session_state.pop('chat_history_spilled', None)
+        st.session_state.pop('chat_reloaded_turns', None)
     
+    @st.fragment
+    def _show_chat_search(self):
+        """Search the student's past questions and answers in this subject"""
+        page_size = 10
+        with st.expander("🔎 Cari Riwayat Chat"):
+            with st.form("chat_search_form", border=False):
+                query = st.text_input("Kata kunci", key="chat_search_query")
+                if st.form_submit_button("Cari"):
+                    st.session_state.chat_search_offset = 0
+            
+            if not query:
+                return
+            offset = st.session_state.get('chat_search_offset', 0)
+            results = self.db.search_chats(
+                st.session_state.user_id, query, st.session_state.current_subject,
+                limit=page_size + 1, offset=offset
+            )
+            if not results:
+                st.info("Tidak ada hasil.")
+                return
+            
+            for result in results[:page_size]:
+                st.markdown(f"**{result['created_at']:%d/%m/%Y %H:%M}** · {result['message_snippet']}")
+                st.caption(result['response_snippet'])
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if offset and st.button("← Sebelumnya", key="chat_search_prev"):
+                    st.session_state.chat_search_offset = max(0, offset - page_size)
+                    self._rerun_panel()
+            with col2:
+                if len(results) > page_size and st.button("Berikutnya →", key="chat_search_next"):
+                    st.session_state.chat_search_offset = offset + page_size
+                    self._rerun_panel()
+    
+    def _show_spilled_chats(self):
+        """Turns of this conversation dropped from memory, reloaded from the database on request"""
+        spilled = st.session_state.get('chat_history_spilled', 0)
+        if not spilled:
+            return
+        reloaded = min(spilled, st.session_state.get('chat_reloaded_turns', 0))
+        if reloaded < spilled:
+            more = min(Config.SESSION_CHAT_RELOAD_TURNS, spilled - reloaded)
+            if st.button(f"⬆️ Tampilkan {more} percakapan sebelumnya", key="chat_reload_older"):
+                st.session_state.chat_reloaded_turns = reloaded + more
+                self._rerun_panel()
+        if not reloaded:
+            return
+        
+        # Spilled turns are the ones just before those still in memory
+        user_id = st.session_state.user_id
+        subject = st.session_state.current_subject
+        conversation_id = st.session_state.get('chat_conversation')
+        in_memory = chat_replies(st.session_state.chat_history)
+        end = self.db.count_user_chats(user_id, subject, conversation_id) - in_memory
+        for chat in self.db.get_chat_range(user_id, subject, max(0, end - reloaded), min(reloaded, end),
+                                           conversation_id):
+            with st.chat_message("user", avatar="👨‍🎓"):
+                st.markdown(chat.user_message)
+            with st.chat_message("assistant", avatar="👨‍🏫"):
+                st.markdown(chat.ai_response)
+                if chat.ai_provider == 'degraded':
+                    st.caption("Layanan AI sedang gangguan, ini jawaban sementara dari arsip.")
+        st.caption("— percakapan terbaru —")
+    
+    @st.fragment
     def _show_chat_interface(self):
-        """Show chat interface for selected subject"""
+        """Show chat interface for selected subject (reruns on its own, not the whole page)"""
         st.subheader(f"💬 Chat dengan Guru {st.session_state.current_subject}")
+        self.sessions.touch()
         
         # Initialize AI greeting
         if not st.session_state.chat_history:
             greeting = f"Halo! Saya guru {st.session_state.current_subject} untuk jenjang {st.session_state.grade_level}. Ada yang bisa saya bajar?"
-            st.session_state.chat_history.append({"role": "assistant", "content": greeting})
+            st.session_state.chat_history.append({"role": "assistant", "content": greeting, "greeting": True})
         
         # Display chat history
         chat_container = st.container()
         with chat_container:
+            self._show_spilled_chats()
             for message in st.session_state.chat_history:
                 if message["role"] == "assistant":
                     with st.chat_message("assistant", avatar="👨‍🏫"):
                         st.markdown(message["content"])
+                        if message.get("degraded"):
+                            st.caption("Layanan AI sedang gangguan, ini jawaban sementara dari arsip.")
                 else:
                     with st.chat_message("user", avatar="👨‍🎓"):
                         st.markdown(message["content"])
         
-        # Chat input
-        st.markdown("---")
-        col1, col2 = st.columns([6, 1])
-        
-        with col1:
-            user_input = st.text_area(
-                "Pesan Anda:",
-                key="chat_input",
-                height=100,
-                placeholder="Ketik pesan Anda di sini... (Shift+Enter untuk baris baru, Enter untuk mengirim)",
-                label_visibility="collapsed"
-            )
+        # Pick up the pending reply, if any
+        if 'chat_job' in st.session_state:
+            result = self._poll_job('chat_job', "Guru sedang mengetik...", consume=True)
+            if result:
+                st.session_state.chat_history.append({
+                    "role": "assistant",
+                    "content": result['response'],
+                    "degraded": result.get('degraded', False)
+                })
+                
+                # Update rate limit
+                self.security.update_rate_limit(st.session_state.user_id, "chat")
+                self._rerun_panel()
         
-        with col2:
-            send_button = st.button("Kirim", type="primary", use_container_width=True)
+        # Chat input (a form: typing does not rerun the script, only sending does)
+        st.markdown("---")
+        nonce = self._form_nonce('chat')
+        with st.form(f"chat_form_{nonce}", clear_on_submit=True, border=False):
+            col1, col2 = st.columns([6, 1])
+            
+            with col1:
+                user_input = st.text_area(
+                    "Pesan Anda:",
+                    key="chat_input",
+                    height=100,
+                    placeholder="Ketik pesan Anda di sini... (Shift+Enter untuk baris baru, Enter untuk mengirim)",
+                    label_visibility="collapsed"
+                )
+            
+            with col2:
+                send_button = st.form_submit_button("Kirim", type="primary", use_container_width=True)
         
         # Handle send
         if send_button and user_input:
@@ -254,45 +442,31 @@ class EducationPlatform:
             if not self.security.check_rate_limit(st.session_state.user_id, "chat"):
                 st.error(f"Tunggu {Config.RATE_LIMIT_SECONDS} detik sebelum mengirim pesan lagi.")
                 time.sleep(1)
-                st.rerun()
+                self._rerun_panel()
             
             # Sanitize input
             sanitized_input = self.security.sanitize_input(user_input)
             if not self.security.validate_sql_input(sanitized_input):
                 st.error("Input tidak valid.")
-                st.rerun()
+                self._rerun_panel()
             
-            # Add user message to history
-            st.session_state.chat_history.append({"role": "user", "content": sanitized_input})
-            
-            # Get AI response
-            with st.spinner("Guru sedang mengetik..."):
-                try:
-                    response = self.ai.get_response(
-                        sanitized_input,
-                        st.session_state.current_subject,
-                        st.session_state.grade_level
-                    )
-                    
-                    # Save to database
-                    self.db.save_chat({
-                        'user_id': st.session_state.user_id,
-                        'subject': st.session_state.current_subject,
-                        'grade_level': st.session_state.grade_level,
-                        'user_message': sanitized_input,
-                        'ai_response': response,
-                        'ai_provider': 'gemini'  # You can track which provider was used
-                    })
-                    
-                    st.session_state.chat_history.append({"role": "assistant", "content": response})
-                    
-                    # Update rate limit
-                    self.security.update_rate_limit(st.session_state.user_id, "chat")
-                    
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
+            # Get AI response in the background (saved to database by the job)
+            job_id = self.jobs.submit('chat_reply', {
+                'user_id': st.session_state.user_id,
+                'subject': st.session_state.current_subject,
+                'grade_level': st.session_state.grade_level,
+                'message': sanitized_input,
+                'conversation_id': st.session_state.get('chat_conversation')
+            }, st.session_state.user_id, st.session_state.get('tenant_id'), submission=nonce)
+            self._next_form_nonce('chat')
             
-            st.rerun()
+            # A double submit gets the job already answering this message back
+            if job_id != st.session_state.get('chat_last_job'):
+                st.session_state.chat_last_job = job_id
+                st.session_state.chat_job = job_id
+                st.session_state.chat_history.append({"role": "user", "content": sanitized_input})
+            
+            self._rerun_panel()
     
     def reflection_page(self):
         """Reflection page"""
@@ -303,12 +477,7 @@ class EducationPlatform:
             st.session_state.page = 'main_menu'
             st.rerun()
         
-        subjects = Config.SUBJECTS.get(st.session_state.grade_level, [])
-        
-        # Handle religion subjects
-        if "AGAMA" in subjects:
-            subjects.remove("AGAMA")
-            subjects.extend(Config.RELIGIONS)
+        subjects = subjects_for(st.session_state.grade_level, expand_religions=True)
         
         cols = st.columns(4)
         for idx, subject in enumerate(subjects):
@@ -325,23 +494,29 @@ class EducationPlatform:
         
         if st.button("← Kembali"):
             st.session_state.page = 'reflection'
+            st.session_state.pop('reflection_grade_job', None)
             st.rerun()
         
         # Generate reflection story
-        with st.spinner("Membuat cerita refleksi..."):
-            story_prompt = f"""
-            Buatkan cerita pendek atau skenario untuk refleksi siswa {st.session_state.grade_level} 
-            tentang mata pelajaran {st.session_state.current_subject}.
-            
-            Cerita harus memicu pemikiran kritis dan refleksi diri.
-            Panjang: 150-200 kata.
-            """
-            
-            story = self.ai.get_response(
-                story_prompt,
-                st.session_state.current_subject,
-                st.session_state.grade_level
+        story_key = f"story_job_{st.session_state.current_subject}"
+        if story_key not in st.session_state:
+            story_prompt = self._render_prompt(
+                "reflection_story",
+                grade_level=st.session_state.grade_level,
+                subject=st.session_state.current_subject
             )
+            if story_prompt is None:
+                return
+            
+            self._submit_job(story_key, 'get_response', {
+                'prompt': story_prompt.text,
+                'subject': st.session_state.current_subject,
+                'grade_level': st.session_state.grade_level
+            })
+        
+        story = self._poll_job(story_key, "Membuat cerita refleksi...")
+        if story is None:
+            return
         
         st.subheader("Cerita untuk Refleksi:")
         st.markdown(f"> {story}")
@@ -354,33 +529,41 @@ class EducationPlatform:
             placeholder="Apa yang Anda pelajari? Bagaimana hubungannya dengan pengalaman Anda? Apa yang akan Anda lakukan berbeda?"
         )
         
-        if st.button("Kirim Refleksi", type="primary"):
-            if reflection_text:
-                with st.spinner("Mengoreksi refleksi..."):
-                    # Grade reflection
-                    result = self.ai.grade_reflection(
-                        reflection_text,
-                        st.session_state.current_subject,
-                        st.session_state.grade_level
-                    )
-                    
-                    # Save to database
-                    self.db.save_reflection({
-                        'user_id': st.session_state.user_id,
-                        'subject': st.session_state.current_subject,
-                        'reflection_text': reflection_text,
-                        'correction': result['correction'],
-                        'score': result['score']
-                    })
-                    
-                    # Show results
-                    st.success("Refleksi telah disimpan!")
-                    st.subheader("Hasil Koreksi:")
-                    st.markdown(f"**Nilai:** {result['score']}/100")
-                    st.markdown(f"**Koreksi:** {result['correction']}")
-                    st.markdown(f"**Feedback:** {result['feedback']}")
-            else:
+        nonce = self._form_nonce('reflection')
+        if st.button("Kirim Refleksi", type="primary", key=f"reflection_submit_{nonce}"):
+            # Trivial reflections get feedback at once, without a grading job
+            problem = check_text(
+                reflection_text, Config.PRESCREEN_REFLECTION_MIN_WORDS,
+                reflection_languages(st.session_state.current_subject)
+            ) if Config.PRESCREEN_ENABLED and reflection_text else None
+            if not reflection_text:
                 st.error("Silakan tulis refleksi terlebih dahulu.")
+            elif problem:
+                st.session_state.pop('reflection_grade_job', None)
+                st.warning(problem['message'])
+            else:
+                # Grade reflection (saved to database by the job)
+                self._submit_job('reflection_grade_job', 'grade_reflection', {
+                    'user_id': st.session_state.user_id,
+                    'subject': st.session_state.current_subject,
+                    'grade_level': st.session_state.grade_level,
+                    'reflection_text': reflection_text,
+                    'story': story
+                }, submission=nonce)
+                self._next_form_nonce('reflection')
+        
+        result = self._poll_job('reflection_grade_job', "Mengoreksi refleksi...")
+        if result and result.get('rejected'):
+            st.warning(result['feedback'])
+        elif result:
+            # Show results
+            st.success("Refleksi telah disimpan!")
+            st.subheader("Hasil Koreksi:")
+            st.markdown(f"**Nilai:** {result['score']}/100")
+            st.markdown(f"**Koreksi:** {result['correction']}")
+            st.markdown(f"**Feedback:** {result['feedback']}")
+            if result.get('prescreen'):
+                st.caption("Dinilai otomatis tanpa AI.")
     
     def idea_validation_page(self):
         """Idea validation page"""
@@ -400,32 +583,20 @@ class EducationPlatform:
         
         if st.button("Validasi Ide", type="primary"):
             if idea:
-                with st.spinner("Membuat POC (Proof of Concept)..."):
-                    prompt = f"""
-                    Buatkan POC (Proof of Concept) sederhana untuk ide berikut:
-                    
-                    Ide: {idea}
-                    
-                    POC harus mencakup:
-                    1. Komponen yang dibutuhkan
-                    2. Langkah-langkah implementasi
-                    3. Sketsa/diagram sederhana (dalam bentuk deskripsi)
-                    4. Estimasi biaya dan waktu
-                    5. Cara replikasi di dunia nyata
-                    
-                    Format dengan jelas dan mudah diikuti.
-                    """
-                    
-                    response = self.ai.get_response(
-                        prompt,
-                        "Teknologi",
-                        "Umum"
-                    )
-                    
-                    st.subheader("POC (Proof of Concept):")
-                    st.markdown(response)
+                prompt = self._render_prompt("idea_poc", idea=idea)
+                if prompt is not None:
+                    self._submit_job('idea_job', 'get_response', {
+                        'prompt': prompt.text,
+                        'subject': "Teknologi",
+                        'grade_level': "Umum"
+                    })
             else:
                 st.error("Silakan jelaskan ide Anda terlebih dahulu.")
+        
+        response = self._poll_job('idea_job', "Membuat POC (Proof of Concept)...")
+        if response:
+            st.subheader("POC (Proof of Concept):")
+            st.markdown(response)
     
     def exam_page(self):
         """Exam page"""
@@ -436,12 +607,7 @@ class EducationPlatform:
             st.session_state.page = 'main_menu'
             st.rerun()
         
-        subjects = Config.SUBJECTS.get(st.session_state.grade_level, [])
-        
-        # Handle religion subjects
-        if "AGAMA" in subjects:
-            subjects.remove("AGAMA")
-            subjects.extend(Config.RELIGIONS)
+        subjects = subjects_for(st.session_state.grade_level, expand_religions=True)
         
         if not st.session_state.exam_questions:
             # Show subject selection
@@ -452,112 +618,131 @@ class EducationPlatform:
                 with cols[idx % 4]:
                     if st.button(subject, use_container_width=True, key=f"exam_{idx}"):
                         st.session_state.current_subject = subject
-                        with st.spinner("Membuat soal ujian..."):
-                            # Generate exam questions
-                            questions = self.ai.generate_exam_questions(
-                                subject,
-                                st.session_state.grade_level
-                            )
-                            st.session_state.exam_questions = questions
-                            st.session_state.exam_answers = {}
+                        # Generate exam questions in the background
+                        self._submit_job('exam_job', 'generate_exam_questions', {
+                            'subject': subject,
+                            'grade_level': st.session_state.grade_level
+                        })
                         st.rerun()
+            
+            questions = self._poll_job('exam_job', "Membuat soal ujian...", consume=True,
+                                       on_partial=self._show_exam_preview)
+            if questions:
+                st.session_state.exam_questions = questions
+                st.session_state.exam_answers = {}
+                st.rerun()
         else:
             # Show exam questions
             self._show_exam_questions()
     
+    @staticmethod
+    def _show_exam_preview(partial):
+        """Questions generated so far, shown read-only while the rest of the exam is streaming (fake backend only)"""
+        mc = partial.get('multiple_choice', [])
+        essays = partial.get('essay_questions', [])
+        st.caption(f"{len(mc) + len(essays)} soal sudah siap, sisanya sedang dibuat...")
+        for idx, question in enumerate(mc):
+            st.markdown(f"**{idx + 1}. {question['question']}**")
+            for option in question['options']:
+                st.markdown(f"- {option}")
+        for idx, question in enumerate(essays):
+            st.markdown(f"**Esai {idx + 1}. {question['question']}**")
+    
+    @st.fragment
     def _show_exam_questions(self):
-        """Display exam questions"""
+        """Display exam questions in a form, so answering reruns nothing until it is submitted"""
         st.subheader(f"Ujian: {st.session_state.current_subject}")
         st.markdown("---")
         
         questions = st.session_state.exam_questions
         answers = st.session_state.exam_answers
+        total_mc = len(questions['multiple_choice'])
+        total_essay = len(questions['essay_questions'])
         
-        # Multiple choice questions
-        st.markdown("### Soal Pilihan Ganda")
-        for idx, mc in enumerate(questions['multiple_choice']):
-            st.markdown(f"**{idx + 1}. {mc['question']}**")
-            
-            # Create answer options
-            options = mc['options']
-            answer_key = f"mc_{idx}"
-            
-            # Use radio buttons for single selection
-            selected = st.radio(
-                f"Pilih jawaban untuk soal {idx + 1}:",
-                options,
-                key=answer_key,
-                index=None
-            )
+        nonce = self._form_nonce('exam')
+        with st.form(f"exam_form_{nonce}", border=False):
+            # Multiple choice questions
+            st.markdown("### Soal Pilihan Ganda")
+            for idx, mc in enumerate(questions['multiple_choice']):
+                st.markdown(f"**{idx + 1}. {mc['question']}**")
+                
+                # Create answer options
+                options = mc['options']
+                answer_key = f"mc_{idx}"
+                
+                # Use radio buttons for single selection
+                selected = st.radio(
+                    f"Pilih jawaban untuk soal {idx + 1}:",
+                    options,
+                    key=answer_key,
+                    index=None
+                )
+                
+                # Store answer
+                if selected:
+                    # Extract letter from selected option (e.g., "A" from "A. Jawaban")
+                    answer_letter = selected[0] if selected[0].isalpha() else "A"
+                    answers[answer_key] = answer_letter
             
-            # Store answer
-            if selected:
-                # Extract letter from selected option (e.g., "A" from "A. Jawaban")
-                answer_letter = selected[0] if selected[0].isalpha() else "A"
-                answers[answer_key] = answer_letter
-        
-        st.markdown("---")
-        
-        # Essay questions
-        st.markdown("### Soal Esai")
-        for idx, essay in enumerate(questions['essay_questions']):
-            st.markdown(f"**Esai {idx + 1}. {essay['question']}**")
-            essay_key = f"essay_{idx}"
+            st.markdown("---")
             
-            answer = st.text_area(
-                f"Jawaban Anda untuk esai {idx + 1}:",
-                height=150,
-                key=essay_key
-            )
+            # Essay questions
+            st.markdown("### Soal Esai")
+            for idx, essay in enumerate(questions['essay_questions']):
+                st.markdown(f"**Esai {idx + 1}. {essay['question']}**")
+                essay_key = f"essay_{idx}"
+                
+                answer = st.text_area(
+                    f"Jawaban Anda untuk esai {idx + 1}:",
+                    height=150,
+                    key=essay_key
+                )
+                
+                if answer:
+                    answers[essay_key] = answer
             
-            if answer:
-                answers[essay_key] = answer
-        
-        st.markdown("---")
+            st.markdown("---")
+            submitted = st.form_submit_button("Kirim Jawaban", type="primary", use_container_width=True)
         
-        col1, col2 = st.columns([1, 1])
+        if submitted:
+            # Check if all questions answered
+            answered_mc = sum(1 for i in range(total_mc) if f"mc_{i}" in answers)
+            answered_essay = sum(1 for i in range(total_essay) if f"essay_{i}" in answers)
+            
+            if answered_mc == total_mc and answered_essay == total_essay:
+                # Grade the exam in the background (saved to database by the job)
+                self._submit_job('exam_grade_job', 'grade_exam', {
+                    'user_id': st.session_state.user_id,
+                    'subject': st.session_state.current_subject,
+                    'grade_level': st.session_state.grade_level,
+                    'questions': questions,
+                    'answers': dict(answers)
+                }, submission=nonce)
+                self._next_form_nonce('exam')
+            else:
+                st.error(f"Harap jawab semua soal! ({answered_mc}/{total_mc} PG, {answered_essay}/{total_essay} Esai)")
         
-        with col1:
-            if st.button("Kembali ke Daftar Mapel", use_container_width=True):
-                st.session_state.exam_questions = None
-                st.session_state.exam_answers = {}
-                st.rerun()
+        if st.button("Kembali ke Daftar Mapel", use_container_width=True):
+            st.session_state.exam_questions = None
+            st.session_state.exam_answers = {}
+            st.session_state.pop('exam_grade_job', None)
+            st.rerun()
         
-        with col2:
-            if st.button("Kirim Jawaban", type="primary", use_container_width=True):
-                # Check if all questions answered
-                total_mc = len(questions['multiple_choice'])
-                total_essay = len(questions['essay_questions'])
-                
-                answered_mc = sum(1 for i in range(total_mc) if f"mc_{i}" in answers)
-                answered_essay = sum(1 for i in range(total_essay) if f"essay_{i}" in answers)
-                
-                if answered_mc == total_mc and answered_essay == total_essay:
-                    with st.spinner("Mengoreksi jawaban..."):
-                        # Grade the exam
-                        result = self.ai.grade_exam(questions, answers)
-                        
-                        # Save to database
-                        self.db.save_exam({
-                            'user_id': st.session_state.user_id,
-                            'subject': st.session_state.current_subject,
-                            'exam_data': json.dumps(questions, ensure_ascii=False),
-                            'answers': json.dumps(answers, ensure_ascii=False),
-                            'score': result['total_score']
-                        })
-                        
-                        # Show results
-                        st.success("Ujian telah dikoreksi!")
-                        st.subheader("Hasil Ujian:")
-                        st.markdown(f"**Total Nilai:** {result['total_score']}/100")
-                        st.markdown(f"**Nilai PG:** {result['multiple_choice_score']}/{(total_mc * 2)}")
-                        st.markdown(f"**Nilai Esai:** {result['essay_score']}/{(total_essay * 10)}")
-                        
-                        # Show corrections
-                        with st.expander("Lihat Detail Koreksi"):
-                            st.json(result)
-                else:
-                    st.error(f"Harap jawab semua soal! ({answered_mc}/{total_mc} PG, {answered_essay}/{total_essay} Esai)")
+        result = self._poll_job('exam_grade_job', "Mengoreksi jawaban...")
+        if result:
+            # Show results
+            st.success("Ujian telah dikoreksi!")
+            st.subheader("Hasil Ujian:")
+            st.markdown(f"**Total Nilai:** {result['total_score']}/100")
+            st.markdown(f"**Nilai PG:** {result['multiple_choice_score']}/{(total_mc * 2)}")
+            st.markdown(f"**Nilai Esai:** {result['essay_score']}/{(total_essay * 10)}")
+            if result.get('prescreen'):
+                st.warning(result['feedback'])
+                st.caption("Dinilai otomatis tanpa AI.")
+            
+            # Show corrections
+            with st.expander("Lihat Detail Koreksi"):
+                st.json(result)
     
     def knowledge_level_page(self):
         """Knowledge level page"""
@@ -579,12 +764,11 @@ class EducationPlatform:
             return
         
         # Get reflections
-        reflections = self.db.get_session().query(Reflection).filter_by(user_id=user_id).all()
-        exams = self.db.get_session().query(Exam).filter_by(user_id=user_id).all()
+        reflections, exams = self.db.get_user_scores(user_id)
         
         # Calculate average scores
-        reflection_scores = [r.score for r in reflections if r.score]
-        exam_scores = [e.score for e in exams if e.score]
+        reflection_scores = [score for score in reflections if score]
+        exam_scores = [score for score in exams if score]
         
         all_scores = reflection_scores + exam_scores
         
@@ -627,26 +811,105 @@ class EducationPlatform:
                 if exam_scores:
                     st.metric("Rata-rata Ujian", f"{sum(exam_scores)/len(exam_scores):.1f}")
             
-            # Generate AI feedback
-            with st.spinner("Membuat catatan..."):
-                feedback_prompt = f"""
-                Berikan catatan konstruktif untuk siswa dengan:
-                - Rata-rata nilai: {avg_score:.2f}/100
-                - Level pengetahuan: {level}
-                - Jenjang: {user.grade_level}
-                - Jumlah refleksi: {len(reflections)}
-                - Jumlah ujian: {len(exams)}
-                
-                Berikan saran untuk meningkatkan pembelajaran.
-                """
-                
-                feedback = self.ai.get_response(feedback_prompt, "Evaluasi", "Umum")
-                
+            # Generate AI feedback (one job per distinct set of results)
+            feedback_key = f"feedback_job_{len(reflections)}_{len(exams)}"
+            if feedback_key not in st.session_state:
+                feedback_prompt = self._render_prompt(
+                    "knowledge_feedback",
+                    avg_score=f"{avg_score:.2f}",
+                    level=level,
+                    grade_level=user.grade_level,
+                    reflection_count=len(reflections),
+                    exam_count=len(exams)
+                )
+                if feedback_prompt is not None:
+                    self._submit_job(feedback_key, 'get_response', {
+                        'prompt': feedback_prompt.text,
+                        'subject': "Evaluasi",
+                        'grade_level': "Umum"
+                    })
+            
+            feedback = self._poll_job(feedback_key, "Membuat catatan...")
+            if feedback:
                 st.subheader("📝 Catatan dan Saran:")
                 st.markdown(feedback)
         else:
             st.info("Belum ada data penilaian. Selesaikan beberapa refleksi dan ujian terlebih dahulu.")
     
+    def class_dashboard_page(self):
+        """Class-level analytics for teachers (reads only the rollup tables)"""
+        st.title("🏫 Dasbor Kelas")
+        st.markdown("---")
+        
+        if st.button("← Kembali ke Menu Utama"):
+            st.session_state.page = 'main_menu'
+            st.rerun()
+        
+        if not st.session_state.get('is_teacher'):
+            st.error("Halaman ini hanya untuk guru.")
+            return
+        
+        ranges = {"24 jam terakhir": 24, "7 hari terakhir": 24 * 7, "30 hari terakhir": 24 * 30, "90 hari terakhir": 24 * 90}
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            range_label = st.selectbox("Rentang waktu", list(ranges), index=1)
+        with col2:
+            grade_level = st.selectbox("Jenjang", ["Semua"] + list(Config.SUBJECTS))
+        with col3:
+            # Chats use AGAMA, reflections and exams the individual religions
+            subjects = dict.fromkeys(subjects_for(grade_level) + subjects_for(grade_level, expand_religions=True))
+            subject = st.selectbox("Mata pelajaran", ["Semua"] + list(subjects))
+        
+        overview = self.analytics.class_overview(
+            st.session_state.get('tenant_id'), ranges[range_label],
+            None if grade_level == "Semua" else grade_level,
+            None if subject == "Semua" else subject
+        )
+        totals = overview['totals']
+        if not any(totals.values()):
+            st.info("Belum ada aktivitas siswa pada rentang ini.")
+            return
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Pertanyaan Chat", totals['chat'])
+        col2.metric("Refleksi", totals['reflection'])
+        col3.metric("Ujian", totals['exam'])
+        col1, col2 = st.columns(2)
+        for col, kind, label in ((col1, 'reflection', "Rata-rata Refleksi"), (col2, 'exam', "Rata-rata Ujian")):
+            average = overview['averages'][kind]
+            col.metric(label, f"{average:.1f}" if average is not None else "-")
+        
+        st.subheader("📈 Aktivitas " + ("per Jam" if overview['period'] == 'hour' else "per Hari"))
+        time_format = "%d/%m %H:00" if overview['period'] == 'hour' else "%d/%m"
+        st.bar_chart({
+            "Waktu": [row['bucket_start'].strftime(time_format) for row in overview['activity']],
+            "Chat": [row['chat'] for row in overview['activity']],
+            "Refleksi": [row['reflection'] for row in overview['activity']],
+            "Ujian": [row['exam'] for row in overview['activity']]
+        }, x="Waktu", y=["Chat", "Refleksi", "Ujian"])
+        
+        st.subheader("📊 Sebaran Nilai")
+        st.bar_chart({
+            "Rentang Nilai": list(BIN_LABELS),
+            "Refleksi": overview['histograms']['reflection'],
+            "Ujian": overview['histograms']['exam']
+        }, x="Rentang Nilai", y=["Refleksi", "Ujian"], stack=False)
+        
+        st.subheader("📚 Per Mata Pelajaran")
+        
+        def average_cell(value):
+            return round(value, 1) if value is not None else None
+        
+        st.dataframe([{
+            "Mata Pelajaran": entry['subject'],
+            "Chat": entry.get('chat', 0),
+            "Refleksi": entry.get('reflection', 0),
+            "Rata-rata Refleksi": average_cell(entry.get('reflection_avg')),
+            "Ujian": entry.get('exam', 0),
+            "Rata-rata Ujian": average_cell(entry.get('exam_avg'))
+        } for entry in overview['subjects']], use_container_width=True, hide_index=True)
+        st.caption(f"Data sejak {overview['since']:%d/%m/%Y %H:%M} UTC.")
+    
     def reminder_page(self):
         """Reminder page"""
         st.title("⏰ Pengingat Belajar")
@@ -852,6 +1115,8 @@ class EducationPlatform:
             self.knowledge_level_page()
         elif st.session_state.page == 'reminder':
             self.reminder_page()
+        elif st.session_state.page == 'class_dashboard':
+            self.class_dashboard_page()
 
 # Run the application
 if __name__ == "__main__":
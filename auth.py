@@ -1,9 +1,12 @@
 import streamlit as st
-from google.oauth2 import id_token
-from google.auth.transport import requests
 from config import Config
+from lazy_imports import lazy_module
 from security import SecurityManager
 
+# google-auth is only needed when a Google sign-in token is verified
+id_token = lazy_module("google.oauth2.id_token")
+requests = lazy_module("google.auth.transport.requests")
+
 class AuthManager:
     def __init__(self):
         self.security = SecurityManager()
@@ -41,7 +44,7 @@ class AuthManager:
     
     def logout_user(self):
         """Logout user and clear session"""
-        for key in ['authenticated', 'user_id', 'user_email', 'user_name', 'session_token', 'grade_level']:
+        for key in ['authenticated', 'user_id', 'user_email', 'user_name', 'session_token', 'grade_level', 'is_teacher']:
             if key in st.session_state:
                 del st.session_state[key]
     
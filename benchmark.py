@@ -0,0 +1,547 @@
+"""Offline benchmarks for the Streamlit app.
+
+    python benchmark.py load --users 50 --concurrency 10 --latency-ms 800
+    
+    python benchmark.py importtime --budget-ms 1500
+    python benchmark.py reruns --exams 3
+    python benchmark.py search --rows 1000000
+
+`load` drives EducationPlatform pages through Streamlit's AppTest with the
+fake AI backend (no network, no API keys) and reports throughput, latency
+percentiles, database query counts and memory per simulated user. AppTest
+cannot run several apps at once in one process, so every concurrent slot
+is a worker process of its own (sharing one database), which runs its
+students one after another like a server process would.
+
+`reruns` counts how many times the whole script runs while a student takes
+an exam and chats, replaying widget changes the way a browser sends them:
+a change outside a form triggers a run, one inside a form waits for submit.
+AppTest always runs the whole script, so reruns scoped to a fragment are
+counted as full runs here (an upper bound).
+
+`search` fills a SQLite database with synthetic chats through the FTS5
+triggers and times DatabaseManager.search_chats per user and per tenant,
+with a LIKE scan of the same rows as the baseline.
+
+`importtime` imports app.py in a fresh interpreter under `python -X importtime`
+and fails when the cold import exceeds the budget or pulls in a module that
+is supposed to load lazily (provider SDKs, google-auth, bcrypt, jwt).
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 of a list of seconds, in milliseconds"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+class QueryCounter:
+    """Count SQL statements executed on any SQLAlchemy engine"""
+    
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def install(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, "before_cursor_execute", self._on_execute)
+    
+    def _on_execute(self, *args, **kwargs):
+        with self._lock:
+            self.count += 1
+
+class SimulatedStudent:
+    """One student walking through login, chat and an exam via AppTest"""
+    
+    def __init__(self, index: int, messages: int, same_prompt: bool, timeout: float):
+        self.index = index
+        self.messages = messages
+        self.same_prompt = same_prompt
+        self.timeout = timeout
+        self.steps: Dict[str, List[float]] = {}
+        self.app = None
+    
+    def _step(self, name: str, element):
+        started = time.perf_counter()
+        element.run(timeout=self.timeout)
+        self.steps.setdefault(name, []).append(time.perf_counter() - started)
+        if self.app.exception:
+            raise RuntimeError(f"{name}: {self.app.exception[0].message}")
+    
+    def _button(self, label: str):
+        return next(b for b in self.app.button if b.label == label)
+    
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+        
+        self.app = AppTest.from_file("app.py", default_timeout=self.timeout)
+        self._step("open", self.app)
+        
+        self.app.text_input[0].input(f"siswa{self.index}@sekolah.id")
+        self._step("login", self._button("Login dengan Google").click())
+        self._step("select_grade", self._button("SD").click())
+        
+        # Interactive chat
+        self._step("open_chat", self.app.button(key="menu_0").click())
+        self._step("pick_subject", self.app.button(key="subj_0").click())
+        for n in range(self.messages):
+            prompt = "Apa itu pecahan?" if self.same_prompt else f"Pertanyaan {n} dari siswa {self.index}"
+            self.app.text_area(key="chat_input").input(prompt)
+            self._step("chat_message", self._button("Kirim").click())
+        self._step("back_to_menu", self._button("← Kembali ke Menu Utama").click())
+        
+        # Exam
+        self._step("open_exam", self.app.button(key="menu_3").click())
+        self._step("generate_exam", self.app.button(key="exam_0").click())
+        for radio in self.app.radio:
+            radio.set_value(radio.options[0])
+        for area in self.app.text_area:
+            if area.key and area.key.startswith("essay_"):
+                # Distinct per student, so the local pre-screen forwards it to the provider
+                area.input(f"Menurut siswa {self.index}, konsep ini sering dipakai dalam kehidupan sehari-hari.")
+        self._step("submit_exam", self._button("Kirim Jawaban").click())
+
+class ScriptRunCounter:
+    """Count full runs of app.py (each builds one EducationPlatform via get_resources)"""
+    
+    def __init__(self):
+        self.count = 0
+    
+    def install(self):
+        import resources
+        original = resources.get_resources
+        
+        def counted():
+            self.count += 1
+            return original()
+        resources.get_resources = counted
+
+def _use_offline_backend(latency_ms: float, jitter: float, seed=None, workdir=None) -> str:
+    """Point Config at the fake AI backend and a throwaway database; returns the work dir"""
+    os.environ["AI_BACKEND"] = "fake"
+    os.environ["FAKE_AI_LATENCY_MS"] = str(latency_ms)
+    os.environ["FAKE_AI_JITTER"] = str(jitter)
+    if seed is not None:
+        os.environ["FAKE_AI_SEED"] = str(seed)
+    
+    from config import Config
+    workdir = workdir or tempfile.mkdtemp(prefix="bench_")
+    Config.AI_BACKEND = "fake"
+    Config.DATABASE_URL = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    Config.METRICS_FILE = os.path.join(workdir, f"metrics-{os.getpid()}.prom")
+    Config.RATE_LIMIT_SECONDS = 0
+    return workdir
+
+def _interact(app, widget, value, timeout: float):
+    """Set a widget like a browser would: outside a form the change reruns the script"""
+    widget.set_value(value)
+    if not widget.form_id:
+        app.run(timeout=timeout)
+
+def run_reruns(args) -> Dict:
+    from streamlit.testing.v1 import AppTest
+    _use_offline_backend(args.latency_ms, 0.0)
+    counter = ScriptRunCounter()
+    counter.install()
+    
+    app = AppTest.from_file("app.py", default_timeout=args.timeout)
+    app.run()
+    app.text_input[0].input("reruns@sekolah.id")
+    next(b for b in app.button if b.label == "Login dengan Google").click().run()
+    next(b for b in app.button if b.label == "SD").click().run()
+    
+    app.button(key="menu_0").click().run()
+    app.button(key="subj_0").click().run()
+    started = counter.count
+    for n in range(args.messages):
+        _interact(app, app.text_area(key="chat_input"), f"Pertanyaan {n}", args.timeout)
+        next(b for b in app.button if b.label == "Kirim").click().run()
+    chat_runs = counter.count - started
+    
+    next(b for b in app.button if b.label == "← Kembali ke Menu Utama").click().run()
+    
+    exam_runs, exam_widgets = [], 0
+    for n in range(args.exams):
+        app.button(key="menu_3").click().run()
+        app.button(key=f"exam_{n}").click().run()
+        started = counter.count
+        widgets = list(app.radio) + [area for area in app.text_area if area.key and area.key.startswith("essay_")]
+        for widget in widgets:
+            value = widget.options[0] if hasattr(widget, "options") else "Jawaban esai singkat dari siswa."
+            _interact(app, widget, value, args.timeout)
+        next(b for b in app.button if b.label == "Kirim Jawaban").click().run()
+        if not app.success:
+            raise RuntimeError(f"exam {n} was not graded")
+        exam_runs.append(counter.count - started)
+        exam_widgets = len(widgets)
+        next(b for b in app.button if b.label == "Kembali ke Daftar Mapel").click().run()
+        next(b for b in app.button if b.label == "← Kembali ke Menu Utama").click().run()
+    
+    return {
+        "exams": args.exams,
+        "widgets_per_exam": exam_widgets,
+        "runs_per_exam": round(sum(exam_runs) / len(exam_runs), 1) if exam_runs else 0,
+        "messages": args.messages,
+        "runs_per_message": round(chat_runs / args.messages, 1) if args.messages else 0
+    }
+
+AI_OPERATIONS = ("get_response", "generate_exam_questions", "grade_exam")
+
+_worker_queries = None
+
+def _init_load_worker(args, workdir: str):
+    """Set up one load worker process: offline backend on the shared database, app modules imported"""
+    global _worker_queries
+    _use_offline_backend(args.latency_ms, args.jitter, args.seed, workdir)
+    # Imported here so their memory is not charged to the first student
+    import resources
+    import streamlit.testing.v1
+    _worker_queries = QueryCounter()
+    _worker_queries.install()
+
+def _run_student(index: int, args) -> Dict:
+    """Drive one simulated student in this worker process"""
+    from metrics import registry
+    registry.reset()
+    queries = _worker_queries.count
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    student = SimulatedStudent(index, args.messages, args.same_prompt, args.timeout)
+    error = None
+    started = time.time()
+    try:
+        student.run()
+    except Exception as e:
+        error = f"student {index}: {e}"
+    finished = time.time()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "error": error,
+        "steps": student.steps,
+        "started": started,
+        "finished": finished,
+        "queries": _worker_queries.count - queries,
+        "memory_bytes": current - baseline,
+        "peak_bytes": peak,
+        "ai_samples": {op: registry.samples(op) for op in AI_OPERATIONS}
+    }
+
+def run_load(args) -> Dict:
+    workdir = _use_offline_backend(args.latency_ms, args.jitter, args.seed)
+    from database import DatabaseManager
+    DatabaseManager().close()  # create the schema once, before the workers share the file
+    
+    # Workers find these by module name: AppTest replaces __main__ with the app script
+    import benchmark as worker
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.concurrency, mp_context=context,
+                             initializer=worker._init_load_worker, initargs=(args, workdir)) as pool:
+        results = list(pool.map(worker._run_student, range(args.users), itertools.repeat(args)))
+    
+    errors = [result["error"] for result in results if result["error"]]
+    # From the first student starting to the last finishing; worker start-up is not counted
+    elapsed = max(r["finished"] for r in results) - min(r["started"] for r in results) if results else 0
+    steps: Dict[str, List[float]] = {}
+    ai_samples: Dict[str, List[float]] = {op: [] for op in AI_OPERATIONS}
+    for result in results:
+        for name, samples in result["steps"].items():
+            steps.setdefault(name, []).extend(samples)
+        for op, samples in result["ai_samples"].items():
+            ai_samples[op].extend(samples)
+    queries = sum(result["queries"] for result in results)
+    
+    completed = args.users - len(errors)
+    return {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "completed": completed,
+        "errors": errors[:10],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_users_per_s": round(completed / elapsed, 3) if elapsed else 0,
+        "interactions_per_s": round(sum(len(v) for v in steps.values()) / elapsed, 3) if elapsed else 0,
+        "step_latency_ms": {name: percentiles(samples) for name, samples in sorted(steps.items())},
+        "ai_latency_ms": {op: percentiles(samples) for op, samples in ai_samples.items()},
+        "db_queries_total": queries,
+        "db_queries_per_user": round(queries / max(1, args.users), 1),
+        "memory_per_user_kb": round(sum(r["memory_bytes"] for r in results) / max(1, args.users) / 1024, 1),
+        "memory_peak_mb": round(max((r["peak_bytes"] for r in results), default=0) / 1024 / 1024, 1)
+    }
+
+SEARCH_WORDS = (
+    "apa", "itu", "bagaimana", "mengapa", "jelaskan", "contoh", "cara", "menghitung", "pecahan", "persamaan",
+    "fotosintesis", "tumbuhan", "energi", "gaya", "listrik", "sejarah", "kemerdekaan", "indonesia", "pancasila",
+    "kalimat", "paragraf", "bahasa", "inggris", "sel", "jaringan", "ekosistem", "perkalian", "pembagian",
+    "geometri", "sudut", "segitiga", "lingkaran", "volume", "massa", "suhu", "cahaya", "bunyi", "magnet"
+)
+
+def _synthetic_text(rng, vocabulary: List[str], cum_weights: List[float], words: int) -> str:
+    return " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=words))
+
+def build_search_corpus(db, rows: int, users: int, seed: int = 7, batch: int = 20000):
+    """Insert `rows` synthetic chats (Zipf-distributed words) through the FTS triggers"""
+    import random
+    from sqlalchemy import text
+    from compression import compress_text, content_hash
+    from config import subjects_for
+    
+    rng = random.Random(seed)
+    vocabulary = list(SEARCH_WORDS) + [f"istilah{n}" for n in range(20000)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    subjects = subjects_for("SMP")
+    created = "2024-01-01 08:00:00"
+    for start in range(0, rows, batch):
+        blobs, chats = [], []
+        for _ in range(min(batch, rows - start)):
+            response = _synthetic_text(rng, vocabulary, cum_weights, rng.randint(30, 60))
+            codec, body = compress_text(response)
+            digest = content_hash(response)
+            blobs.append({"hash": digest, "codec": codec, "body": body, "size": len(response), "created_at": created})
+            chats.append({
+                "user_id": f"user{rng.randrange(users)}",
+                "subject": rng.choice(subjects),
+                "message": _synthetic_text(rng, vocabulary, cum_weights, rng.randint(6, 14)),
+                "hash": digest,
+                "created_at": created
+            })
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT OR IGNORE INTO blobs (hash, codec, body, size, created_at) "
+                "VALUES (:hash, :codec, :body, :size, :created_at)"
+            ), blobs)
+            conn.execute(text(
+                "INSERT INTO chat_sessions (user_id, tenant_id, subject, grade_level, user_message, ai_response, "
+                "response_hash, ai_provider, created_at) VALUES (:user_id, 'default', :subject, 'SMP', :message, '', "
+                ":hash, 'synthetic', :created_at)"
+            ), chats)
+
+def run_search(args) -> Dict:
+    import random
+    from sqlalchemy import text
+    from config import Config
+    Config.WRITE_BEHIND_ENABLED = False
+    from database import DatabaseManager
+    
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench_"), "search.db")
+    db = DatabaseManager(url=f"sqlite:///{path}")
+    if not db.search_enabled:
+        raise RuntimeError("SQLite was built without FTS5")
+    with db.engine.connect() as conn:
+        existing = conn.execute(text("SELECT COUNT(*) FROM chat_sessions")).scalar()
+    started = time.perf_counter()
+    if existing < args.rows:
+        build_search_corpus(db, args.rows - existing, args.users)
+    build_s = time.perf_counter() - started
+    
+    # "common" queries use the most frequent words of the corpus (worst case for ranking),
+    # "topic" ones mid-frequency terms, closer to what students look up
+    rng = random.Random(11)
+    queries = [
+        (kind, " ".join(rng.sample(words, rng.randint(1, 2))))
+        for kind, words in (("common", list(SEARCH_WORDS)), ("topic", [f"istilah{n}" for n in range(50, 2000)]))
+        for _ in range(args.queries // 2)
+    ]
+    timings = {"user_common": [], "tenant_common": [], "user_topic": [], "tenant_topic": [], "tenant_like": []}
+    for n, (kind, query) in enumerate(queries):
+        user_id = f"user{rng.randrange(args.users)}"
+        for name, search in ((f"user_{kind}", lambda: db.search_chats(user_id, query, limit=20)),
+                             (f"tenant_{kind}", lambda: db.search_chats(None, query, limit=20))):
+            began = time.perf_counter()
+            search()
+            timings[name].append(time.perf_counter() - began)
+        if n < args.like_samples:
+            # Baseline: what a LIKE scan over the same rows costs
+            began = time.perf_counter()
+            with db.read_engine.connect() as conn:
+                conn.execute(text(
+                    "SELECT id FROM chat_sessions WHERE user_message LIKE :pattern ORDER BY created_at DESC LIMIT 20"
+                ), {"pattern": f"%{query.split()[-1]}%"}).all()
+            timings["tenant_like"].append(time.perf_counter() - began)
+    db.close()
+    
+    return {
+        "rows": max(existing, args.rows),
+        "database": path,
+        "build_s": round(build_s, 1),
+        "db_size_mb": round(os.path.getsize(path) / 1024 / 1024, 1),
+        "queries": args.queries,
+        "latency_ms": {name: percentiles(samples) for name, samples in timings.items() if samples}
+    }
+
+# Modules that must not be imported just by loading app.py
+DEFERRED_MODULES = (
+    "google.generativeai", "openai", "cohere", "pandas",
+    "google.oauth2", "bcrypt", "jwt", "smtplib"
+)
+
+def parse_importtime(stderr: str) -> Dict[str, Dict[str, float]]:
+    """Self/cumulative milliseconds per module from `-X importtime` output"""
+    modules, children = {}, []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = {
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+            "depth": depth,
+            "parent": None
+        }
+        # Output is post-order: direct children are listed before their parent
+        if depth == 1:
+            children.append(name.strip())
+        elif depth == 0:
+            for child in children:
+                modules[child]["parent"] = name.strip()
+            children = []
+    return modules
+
+def run_importtime(args) -> Dict:
+    root = os.path.dirname(os.path.abspath(__file__))
+    totals, modules = [], {}
+    for _ in range(args.runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {args.module}"],
+            cwd=root, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+        run = parse_importtime(proc.stderr)
+        total = run[args.module]["cumulative_ms"]
+        totals.append(total)
+        if total == min(totals):
+            modules = run
+    
+    total = min(totals)
+    loaded_deferred = sorted(
+        name for name in modules
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in DEFERRED_MODULES)
+    )
+    # Direct imports of the measured module, where a lazy import would help
+    slowest = sorted(
+        ((name, m["cumulative_ms"]) for name, m in modules.items() if m["parent"] == args.module),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+    return {
+        "module": args.module,
+        "runs": args.runs,
+        "import_ms": round(total, 1),
+        "budget_ms": args.budget_ms,
+        "over_budget": total > args.budget_ms,
+        "deferred_modules_loaded": loaded_deferred,
+        "slowest_ms": {name: round(ms, 1) for name, ms in slowest}
+    }
+
+def print_importtime_report(report: Dict):
+    print(f"import {report['module']}: {report['import_ms']} ms "
+          f"(best of {report['runs']}, budget {report['budget_ms']} ms)")
+    for name, ms in report["slowest_ms"].items():
+        print(f"  {name:<32} {ms:8.1f}")
+    if report["over_budget"]:
+        print("ERROR import time over budget")
+    for name in report["deferred_modules_loaded"]:
+        print(f"ERROR {name} imported eagerly")
+
+def print_report(report: Dict):
+    print(f"Users: {report['completed']}/{report['users']} completed "
+          f"(concurrency {report['concurrency']}) in {report['elapsed_s']} s")
+    print(f"Throughput: {report['throughput_users_per_s']} users/s, "
+          f"{report['interactions_per_s']} interactions/s")
+    for section in ("step_latency_ms", "ai_latency_ms"):
+        print(f"\n{section}:")
+        for name, pct in report[section].items():
+            print(f"  {name:<24} p50 {pct['p50']:8.1f}  p95 {pct['p95']:8.1f}  p99 {pct['p99']:8.1f}")
+    print(f"\nDB queries: {report['db_queries_total']} total, {report['db_queries_per_user']} per user")
+    print(f"Memory: {report['memory_per_user_kb']} KB per user, peak {report['memory_peak_mb']} MB")
+    for error in report["errors"]:
+        print(f"ERROR {error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the AI Education Platform")
+    sub = parser.add_subparsers(dest="command", required=True)
+    
+    load = sub.add_parser("load", help="Simulate concurrent students with a fake AI provider")
+    load.add_argument("--users", type=int, default=20)
+    load.add_argument("--concurrency", type=int, default=5)
+    load.add_argument("--messages", type=int, default=3, help="Chat messages per student")
+    load.add_argument("--latency-ms", type=float, default=800, help="Median fake provider latency")
+    load.add_argument("--jitter", type=float, default=0.5, help="Log-normal sigma of provider latency")
+    load.add_argument("--same-prompt", action="store_true", help="All students ask the same question")
+    load.add_argument("--seed", type=int)
+    load.add_argument("--timeout", type=float, default=60)
+    load.add_argument("--json", action="store_true", help="Print the report as JSON")
+    
+    importtime = sub.add_parser("importtime", help="Measure cold import time of the app")
+    importtime.add_argument("--module", default="app")
+    importtime.add_argument("--budget-ms", type=float, default=1500)
+    importtime.add_argument("--runs", type=int, default=3, help="Best of N fresh interpreters")
+    importtime.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    importtime.add_argument("--json", action="store_true", help="Print the report as JSON")
+    
+    reruns = sub.add_parser("reruns", help="Count full script runs per exam and chat message")
+    reruns.add_argument("--exams", type=int, default=3)
+    reruns.add_argument("--messages", type=int, default=3)
+    reruns.add_argument("--latency-ms", type=float, default=50, help="Fake provider latency")
+    reruns.add_argument("--timeout", type=float, default=60)
+    reruns.add_argument("--json", action="store_true", help="Print the report as JSON")
+    
+    search = sub.add_parser("search", help="Full-text chat search latency on a synthetic corpus")
+    search.add_argument("--rows", type=int, default=1000000)
+    search.add_argument("--users", type=int, default=5000)
+    search.add_argument("--queries", type=int, default=200)
+    search.add_argument("--like-samples", type=int, default=5, help="Queries also timed as a LIKE scan")
+    search.add_argument("--db", help="Reuse (and top up) this SQLite file instead of a temporary one")
+    search.add_argument("--json", action="store_true", help="Print the report as JSON")
+    
+    args = parser.parse_args(argv)
+    if args.command == "search":
+        report = run_search(args)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(f"Corpus: {report['rows']} chats, {report['db_size_mb']} MB (built in {report['build_s']} s)")
+            for name, pct in report["latency_ms"].items():
+                print(f"  {name:<14} p50 {pct['p50']:8.2f}  p95 {pct['p95']:8.2f}  p99 {pct['p99']:8.2f} ms")
+        return 0
+    if args.command == "reruns":
+        report = run_reruns(args)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(f"Exam: {report['runs_per_exam']} script runs for {report['widgets_per_exam']} answers "
+                  f"(average of {report['exams']} exams)")
+            print(f"Chat: {report['runs_per_message']} script runs per message")
+        return 0
+    if args.command == "importtime":
+        report = run_importtime(args)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_importtime_report(report)
+        return 1 if report["over_budget"] or report["deferred_modules_loaded"] else 0
+    if args.command == "load":
+        report = run_load(args)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
+        return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
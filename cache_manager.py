@@ -1,35 +1,128 @@
 import hashlib
 import json
-from typing import Optional, Dict, Any
+import re
+from typing import Optional, Dict, Any, Set
 from database import DatabaseManager
 from config import Config
+from prescreen import STOPWORDS
+from tenants import current_tenant
 
 class CacheManager:
-    def __init__(self):
-        self.db = DatabaseManager()
+    def __init__(self, db: DatabaseManager = None):
+        self.db = db or DatabaseManager()
     
     def _generate_hash(self, data: Dict[str, Any]) -> str:
         """Generate MD5 hash for caching"""
         data_str = json.dumps(data, sort_keys=True)
         return hashlib.md5(data_str.encode()).hexdigest()
     
-    def get_cached_response(self, query: str, subject: str, grade_level: str) -> Optional[str]:
-        """Get cached response if exists"""
-        query_hash = self._generate_hash({
+    def cache_key(self, query: str, subject: str, grade_level: str, tenant_id: Optional[str] = None) -> str:
+        """Key identifying a (query, subject, grade_level) request within a tenant"""
+        data = {
             "query": query,
             "subject": subject,
             "grade_level": grade_level
-        })
-        return self.db.get_cache(query_hash)
+        }
+        tenant_id = tenant_id or current_tenant()
+        if tenant_id != Config.DEFAULT_TENANT:
+            # Default-tenant keys stay unchanged so entries cached before tenants existed remain valid
+            data["tenant"] = tenant_id
+        return self._generate_hash(data)
+    
+    def get_cached_response(self, query: str, subject: str, grade_level: str,
+                            tenant_id: Optional[str] = None) -> Optional[str]:
+        """Get cached response if exists"""
+        return self.db.get_cache(self.cache_key(query, subject, grade_level, tenant_id))
     
-    def save_to_cache(self, query: str, response: str, subject: str, grade_level: str):
+    def save_to_cache(self, query: str, response: str, subject: str, grade_level: str,
+                      tenant_id: Optional[str] = None):
         """Save response to cache"""
-        query_hash = self._generate_hash({
-            "query": query,
-            "subject": subject,
-            "grade_level": grade_level
-        })
-        self.db.set_cache(query_hash, query, response, subject, grade_level)
+        tenant_id = tenant_id or current_tenant()
+        query_hash = self.cache_key(query, subject, grade_level, tenant_id)
+        self.db.set_cache(query_hash, query, response, subject, grade_level, tenant_id)
+    
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """Lowercase words only, so case, spacing and punctuation don't split the cache"""
+        return " ".join(re.findall(r"\w+", question.lower()))
+    
+    def chat_key(self, question: str, subject: str, grade_level: str, tenant_id: Optional[str] = None) -> str:
+        """Key of a chat reply: the normalized question, kept apart from prompt keys"""
+        return self.cache_key("chat:" + self.normalize_question(question), subject, grade_level, tenant_id)
+    
+    def get_chat_response(self, question: str, subject: str, grade_level: str,
+                          tenant_id: Optional[str] = None) -> Optional[str]:
+        """Cached context-free answer to a chat question"""
+        return self.db.get_cache(self.chat_key(question, subject, grade_level, tenant_id))
+    
+    def save_chat_response(self, question: str, response: str, subject: str, grade_level: str,
+                           tenant_id: Optional[str] = None):
+        """Cache the context-free answer to a chat question"""
+        tenant_id = tenant_id or current_tenant()
+        query_hash = self.chat_key(question, subject, grade_level, tenant_id)
+        self.db.set_cache(query_hash, question, response, subject, grade_level, tenant_id, kind='chat')
+    
+    def save_many(self, entries, tenant_id: Optional[str] = None, kind: Optional[str] = None):
+        """Bulk-load (query, response, subject, grade_level) tuples in one transaction.
+        
+        With kind='chat' the queries are chat questions, keyed like
+        save_chat_response.
+        """
+        tenant_id = tenant_id or current_tenant()
+        key = self.chat_key if kind == 'chat' else self.cache_key
+        self.db.set_cache_many([
+            {
+                'query_hash': key(query, subject, grade_level, tenant_id),
+                'query': query,
+                'response': response,
+                'subject': subject,
+                'grade_level': grade_level,
+                'kind': kind
+            }
+            for query, response, subject, grade_level in entries
+        ], tenant_id)
+    
+    _STOPWORDS = frozenset().union(*STOPWORDS.values())
+    
+    @classmethod
+    def _words(cls, text: str) -> Set[str]:
+        """Content words of a question (function words don't make two questions alike)"""
+        return {word for word in re.findall(r"\w+", text.lower()) if len(word) > 2 and word not in cls._STOPWORDS}
+    
+    @staticmethod
+    def similarity(words: Set[str], other: Set[str]) -> float:
+        """Jaccard similarity of two word sets"""
+        return len(words & other) / len(words | other) if words and other else 0.0
+    
+    def find_similar_response(self, question: str, subject: str, grade_level: str,
+                              tenant_id: Optional[str] = None, user_id: Optional[str] = None) -> Optional[str]:
+        """Nearest earlier answer to a question, expired entries included (degraded mode).
+        
+        Candidates are the questions of the subject's recent cached chat
+        replies (only their text is read) plus the best full-text matches in
+        the chat history of `user_id` (never other students'), degraded
+        replies excepted. The candidate
+        with the highest word similarity wins if it reaches
+        DEGRADED_MIN_SIMILARITY; only then is its answer loaded.
+        """
+        wanted = self._words(question)
+        if not wanted:
+            return None
+        tenant_id = tenant_id or current_tenant()
+        best_score, best_id, best_response = 0.0, None, None
+        for cache_id, query in self.db.get_recent_chat_queries(subject, grade_level, tenant_id,
+                                                               Config.DEGRADED_SCAN_LIMIT):
+            score = self.similarity(wanted, self._words(query))
+            if score > best_score:
+                best_score, best_id, best_response = score, cache_id, None
+        if user_id is not None and self.db.search_enabled:
+            for chat in self.db.search_chats(user_id, question, subject, limit=20, any_term=True):
+                score = self.similarity(wanted, self._words(chat['user_message']))
+                if chat['ai_provider'] != 'degraded' and chat['ai_response'] and score > best_score:
+                    best_score, best_id, best_response = score, None, chat['ai_response']
+        if best_score < Config.DEGRADED_MIN_SIMILARITY:
+            return None
+        return best_response or self.db.get_cache_response(best_id) or None
     
     def clear_old_cache(self):
         """Clear expired cache entries"""
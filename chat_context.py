@@ -0,0 +1,88 @@
+from typing import List, Optional, Tuple
+from config import Config
+from prompts import PromptBudgetError, prompts
+
+class ChatContextManager:
+    """Bounded conversation context for the tutoring chat.
+    
+    The prompt carries the last `recent_turns` question/answer pairs
+    verbatim plus a rolling summary of everything older. The summary is
+    stored in `chat_summaries` next to the ChatSession rows and is only
+    extended every `summary_every` turns, so both the prompt size and the
+    summarization cost stay constant per request. Only turns of the current
+    conversation (one visit of the chat page) are used; without a
+    conversation id every turn of the subject counts.
+    """
+    
+    def __init__(self, ai, db, recent_turns: int = Config.CHAT_CONTEXT_TURNS,
+                 summary_every: int = Config.CHAT_SUMMARY_EVERY):
+        self.ai = ai
+        self.db = db
+        self.recent_turns = recent_turns
+        self.summary_every = summary_every
+    
+    @staticmethod
+    def _clip(text: str, limit: int) -> str:
+        text = (text or "").strip()
+        return text if len(text) <= limit else text[:limit].rstrip() + "..."
+    
+    def _summary(self, user_id: str, subject: str, conversation_id: Optional[str]) -> Tuple[str, int]:
+        """Summary text and turns it covers; a summary of another conversation counts as none"""
+        summary_row = self.db.get_chat_summary(user_id, subject)
+        if not summary_row or summary_row.conversation_id != conversation_id:
+            return "", 0
+        return summary_row.summary, summary_row.turns_summarized
+    
+    def _window(self, user_id: str, subject: str, conversation_id: Optional[str]) -> Tuple[str, List]:
+        """Rolling summary plus the most recent turns not covered by it"""
+        summary, summarized = self._summary(user_id, subject, conversation_id)
+        total = self.db.count_user_chats(user_id, subject, conversation_id)
+        start = max(summarized, total - self.recent_turns)
+        recent = self.db.get_chat_range(
+            user_id, subject, start, total - start, conversation_id
+        ) if total > start else []
+        return summary, recent
+    
+    def _turns(self, chats) -> str:
+        return "\n".join(
+            f"Siswa: {self._clip(chat.user_message, Config.CHAT_TURN_MAX_CHARS)}\n"
+            f"Guru: {self._clip(chat.ai_response, Config.CHAT_TURN_MAX_CHARS)}"
+            for chat in chats
+        )
+    
+    def build_prompt(self, user_id: str, subject: str, message: str, conversation_id: Optional[str] = None) -> str:
+        """Prompt for the next chat reply: summary + recent turns + new message.
+        
+        Without any context the message itself is the prompt, so the reply
+        can be shared through the chat cache. A message too long to fit the
+        chat_reply budget next to its context is sent alone as well.
+        """
+        summary, recent = self._window(user_id, subject, conversation_id)
+        if not summary and not recent:
+            return message
+        try:
+            prompt = prompts.render(
+                "chat_reply",
+                summary=self._clip(summary, Config.CHAT_SUMMARY_MAX_CHARS) or "-",
+                turns=self._turns(recent) or "-",
+                message=message
+            )
+        except PromptBudgetError:
+            return message
+        return prompt.text
+    
+    def update_summary(self, user_id: str, subject: str, grade_level: str, conversation_id: Optional[str] = None):
+        """Fold turns that left the verbatim window into the summary, every K turns"""
+        summary, summarized = self._summary(user_id, subject, conversation_id)
+        total = self.db.count_user_chats(user_id, subject, conversation_id)
+        target = total - self.recent_turns
+        if target - summarized < self.summary_every:
+            return
+        
+        older = self.db.get_chat_range(user_id, subject, summarized, target - summarized, conversation_id)
+        prompt = prompts.render("chat_summary", summary=summary or "-", turns=self._turns(older))
+        # Uncached: a summary is specific to one conversation and never reused
+        new_summary = self.ai.generate_response(prompt.text, subject, grade_level, operation="chat_summary")
+        self.db.save_chat_summary(
+            user_id, subject, self._clip(new_summary, Config.CHAT_SUMMARY_MAX_CHARS), target, conversation_id
+        )
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict
+from config import Config
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose breaker is open"""
+    
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Layanan AI ({name}) sedang gangguan. Silakan coba lagi dalam {max(1, round(retry_in))} detik.")
+        self.name = name
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker around one AI provider.
+    
+    Outcomes of the last `window` calls are kept; a call counts as failed
+    when it raises or takes longer than `slow_call_seconds`. Once at least
+    `min_calls` are recorded and the failure rate reaches `failure_rate` the
+    breaker opens and calls fail immediately for `open_seconds`. After that
+    `half_open_calls` trial calls go through: one success closes the breaker,
+    one failure opens it again.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name: str, window: int = Config.BREAKER_WINDOW, min_calls: int = Config.BREAKER_MIN_CALLS,
+                 failure_rate: float = Config.BREAKER_FAILURE_RATE,
+                 slow_call_seconds: float = Config.BREAKER_SLOW_CALL_SECONDS,
+                 open_seconds: float = Config.BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = Config.BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._outcomes = deque(maxlen=window)  # True = failed
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return self.HALF_OPEN
+            return self._state
+    
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trials = 0
+    
+    def before_call(self):
+        """Reserve a call, or raise CircuitOpenError while the provider is considered down"""
+        with self._lock:
+            if self._state == self.OPEN:
+                waited = time.monotonic() - self._opened_at
+                if waited < self.open_seconds:
+                    raise CircuitOpenError(self.name, self.open_seconds - waited)
+                self._state = self.HALF_OPEN
+                self._trials = 0
+            if self._state == self.HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    raise CircuitOpenError(self.name, self.open_seconds)
+                self._trials += 1
+    
+    def record(self, failed: bool, elapsed: float = 0.0):
+        """Record the outcome of a call reserved with before_call"""
+        failed = failed or elapsed > self.slow_call_seconds
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(failed)
+            if (self._state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                    and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate):
+                self._open()
+    
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        self.before_call()
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(True)
+            raise
+        self.record(False, time.perf_counter() - started)
+        return result
+    
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._outcomes.clear()
+            self._trials = 0
+
+class BreakerRegistry:
+    """One breaker per provider, shared by every session of the process"""
+    
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+            return breaker
+    
+    def states(self) -> Dict[str, str]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.state for breaker in breakers}
+
+provider_breakers = BreakerRegistry()
@@ -0,0 +1,37 @@
+import hashlib
+import zlib
+from typing import Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, zlib is always available
+    zstandard = None
+
+# Bodies shorter than this are stored as-is; compression would not pay off
+MIN_COMPRESS_BYTES = 128
+
+def content_hash(text: str) -> str:
+    """SHA-256 of the UTF-8 text, used as the blob key"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def compress_text(text: str) -> Tuple[str, bytes]:
+    """Compress text with the best available codec; returns (codec, body)"""
+    raw = text.encode('utf-8')
+    if len(raw) < MIN_COMPRESS_BYTES:
+        return 'raw', raw
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(raw)
+    return 'zlib', zlib.compress(raw, 9)
+
+def decompress_text(codec: str, body: bytes) -> str:
+    if codec == 'raw':
+        raw = body
+    elif codec == 'zlib':
+        raw = zlib.decompress(body)
+    elif codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed blobs")
+        raw = zstandard.ZstdDecompressor().decompress(body)
+    else:
+        raise ValueError(f"Unknown blob codec: {codec}")
+    return bytes(raw).decode('utf-8')
@@ -1,18 +1,42 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey
+import importlib
+import json
+import os
+import re
+import threading
+import time
+from sqlalchemy import create_engine, event, func, inspect, null, select, text, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, LargeBinary, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from sqlalchemy.pool import QueuePool
+from datetime import datetime, timedelta
 from config import Config
+from compression import content_hash, compress_text, decompress_text
+from tenants import current_tenant
+from write_buffer import WriterStoppedError, get_write_buffer, close_write_buffer
 
 Base = declarative_base()
 
+class Tenant(Base):
+    __tablename__ = 'tenants'
+    
+    id = Column(String, primary_key=True)  # short slug, e.g. "sman1-bandung"
+    name = Column(String, nullable=False)
+    email_domain = Column(String, unique=True)  # students are assigned to the school of their email domain
+    max_concurrent_jobs = Column(Integer)  # NULL = Config.TENANT_MAX_CONCURRENT_JOBS
+    hourly_token_quota = Column(Integer)  # NULL = Config.TENANT_HOURLY_TOKEN_QUOTA, 0 = unlimited
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class User(Base):
     __tablename__ = 'users'
     
     id = Column(String, primary_key=True)
+    tenant_id = Column(String, nullable=False, default=Config.DEFAULT_TENANT, server_default=Config.DEFAULT_TENANT, index=True)
     email = Column(String, unique=True, nullable=False)
     name = Column(String, nullable=False)
     grade_level = Column(String)  # SD, SMP, SMA
+    role = Column(String, nullable=False, default='student', server_default='student')  # student, teacher
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
     
@@ -22,48 +46,143 @@ class User(Base):
     exams = relationship("Exam", back_populates="user", cascade="all, delete-orphan")
     reminders = relationship("Reminder", back_populates="user", cascade="all, delete-orphan")
 
+class Blob(Base):
+    __tablename__ = 'blobs'
+    
+    hash = Column(String, primary_key=True)  # SHA-256 of the uncompressed text
+    codec = Column(String, nullable=False)  # raw, zlib, zstd
+    body = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)  # uncompressed bytes
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    @property
+    def text(self):
+        if getattr(self, '_text', None) is None:
+            self._text = decompress_text(self.codec, self.body)
+        return self._text
+
 class ChatSession(Base):
     __tablename__ = 'chat_sessions'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String, ForeignKey('users.id'), nullable=False)
+    tenant_id = Column(String, nullable=False, default=Config.DEFAULT_TENANT, server_default=Config.DEFAULT_TENANT)
     subject = Column(String, nullable=False)
     grade_level = Column(String, nullable=False)
     user_message = Column(Text, nullable=False)
-    ai_response = Column(Text, nullable=False)
+    _ai_response = Column('ai_response', Text, nullable=False, default="")  # inline text of rows written before blobs
+    response_hash = Column(String, ForeignKey('blobs.hash'))
     ai_provider = Column(String)
+    conversation_id = Column(String)  # chat page visit the turn belongs to; NULL for rows written before
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="chat_sessions")
+    response_blob = relationship("Blob", lazy="joined")
+    
+    @property
+    def ai_response(self):
+        return self.response_blob.text if self.response_blob is not None else self._ai_response
+    
+    @ai_response.setter
+    def ai_response(self, value):
+        self._ai_response = value
+
+class ChatSummary(Base):
+    __tablename__ = 'chat_summaries'
+    __table_args__ = (UniqueConstraint('user_id', 'subject'),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, ForeignKey('users.id'), nullable=False)
+    subject = Column(String, nullable=False)
+    summary = Column(Text, nullable=False, default="")
+    turns_summarized = Column(Integer, nullable=False, default=0)  # oldest chat_sessions rows folded into summary
+    conversation_id = Column(String)  # conversation the summary covers
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Reflection(Base):
     __tablename__ = 'reflections'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String, ForeignKey('users.id'), nullable=False)
+    tenant_id = Column(String, nullable=False, default=Config.DEFAULT_TENANT, server_default=Config.DEFAULT_TENANT)
     subject = Column(String, nullable=False)
+    grade_level = Column(String)
     reflection_text = Column(Text, nullable=False)
     correction = Column(Text)
     score = Column(Float)
+    signature = Column(String)  # MinHash of the text (prescreen.py), for duplicate detection
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="reflections")
 
+class ExamTemplate(Base):
+    __tablename__ = 'exam_templates'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    question_set_hash = Column(String, unique=True, nullable=False)  # hash of the canonical questions JSON
+    subject = Column(String, nullable=False)
+    grade_level = Column(String)
+    questions_hash = Column(String, ForeignKey('blobs.hash'), nullable=False)
+    mc_count = Column(Integer, nullable=False)
+    essay_count = Column(Integer, nullable=False)
+    answer_key = Column(String)  # one letter per multiple choice question, '-' if unknown
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    questions_blob = relationship("Blob", lazy="joined")
+    
+    @property
+    def questions(self):
+        return json.loads(self.questions_blob.text)
+
 class Exam(Base):
     __tablename__ = 'exams'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String, ForeignKey('users.id'), nullable=False)
+    tenant_id = Column(String, nullable=False, default=Config.DEFAULT_TENANT, server_default=Config.DEFAULT_TENANT)
     subject = Column(String, nullable=False)
-    exam_data = Column(Text, nullable=False)  # JSON string of questions
-    answers = Column(Text)  # JSON string of answers
+    grade_level = Column(String)  # templates are shared across grades; NULL on older rows
+    template_id = Column(Integer, ForeignKey('exam_templates.id'), index=True)
+    mc_answers = Column(String)  # one letter per multiple choice question, '-' if unanswered
+    essay_answers = Column(Text)  # JSON list, one entry per essay question
+    question_scores = Column(String)  # comma separated, multiple choice first; empty if unknown
+    essay_signatures = Column(Text)  # JSON list, MinHash of each essay answer (prescreen.py)
+    _exam_data = Column('exam_data', Text, nullable=False, default="")  # JSON string of questions (legacy rows)
+    exam_data_hash = Column(String, ForeignKey('blobs.hash'))  # legacy rows
+    _answers = Column('answers', Text)  # JSON string of answers (legacy rows)
     score = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="exams")
+    template = relationship("ExamTemplate", lazy="joined")
+    exam_data_blob = relationship("Blob", lazy="joined")
+    
+    @property
+    def exam_data(self):
+        if self.template is not None:
+            return self.template.questions_blob.text
+        return self.exam_data_blob.text if self.exam_data_blob is not None else self._exam_data
+    
+    @exam_data.setter
+    def exam_data(self, value):
+        self._exam_data = value
+    
+    @property
+    def answers(self):
+        if self.template_id is None:
+            return self._answers
+        answers = {f"mc_{i}": letter for i, letter in enumerate(self.mc_answers or "") if letter != '-'}
+        for i, essay in enumerate(json.loads(self.essay_answers or "[]")):
+            if essay:
+                answers[f"essay_{i}"] = essay
+        return json.dumps(answers, ensure_ascii=False)
+    
+    @answers.setter
+    def answers(self, value):
+        self._answers = value
 
 class Reminder(Base):
     __tablename__ = 'reminders'
@@ -85,28 +204,411 @@ class Cache(Base):
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     query_hash = Column(String, unique=True, nullable=False)
+    tenant_id = Column(String, nullable=False, default=Config.DEFAULT_TENANT, server_default=Config.DEFAULT_TENANT)
     query = Column(Text, nullable=False)
-    response = Column(Text, nullable=False)
+    _response = Column('response', Text, nullable=False, default="")  # inline text of rows written before blobs
+    response_hash = Column(String, ForeignKey('blobs.hash'))
     subject = Column(String)
     grade_level = Column(String)
+    kind = Column(String)  # 'chat' for chat replies keyed on the question; NULL for prompt-keyed entries
     created_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime)
+    
+    response_blob = relationship("Blob", lazy="joined")
+    
+    @property
+    def response(self):
+        return self.response_blob.text if self.response_blob is not None else self._response
+    
+    @response.setter
+    def response(self, value):
+        self._response = value
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    
+    id = Column(String, primary_key=True)  # uuid4 hex
+    user_id = Column(String, index=True)
+    tenant_id = Column(String, nullable=False, default=Config.DEFAULT_TENANT, server_default=Config.DEFAULT_TENANT)
+    kind = Column(String, nullable=False)
+    idempotency_key = Column(String, unique=True, index=True)  # repeats of a submission reuse this job
+    payload = Column(Text, nullable=False)  # JSON string
+    status = Column(String, nullable=False, default='pending')  # pending, running, done, failed
+    result = Column(Text)  # JSON string
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ActivityRollup(Base):
+    """Hourly and daily aggregates of chats, reflections and exams (teacher dashboard).
+    
+    One row per bucket, kind, subject, grade and score bin, incremented in
+    the transaction that inserts the raw rows, so class views never scan them.
+    """
+    __tablename__ = 'activity_rollups'
+    __table_args__ = (UniqueConstraint(
+        'tenant_id', 'period', 'bucket_start', 'kind', 'subject', 'grade_level', 'score_bin',
+        name='uq_activity_rollups_key'
+    ),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant_id = Column(String, nullable=False)
+    period = Column(String, nullable=False)  # hour, day
+    bucket_start = Column(DateTime, nullable=False)  # UTC start of the hour/day
+    kind = Column(String, nullable=False)  # chat, reflection, exam
+    subject = Column(String, nullable=False)
+    grade_level = Column(String, nullable=False)  # '' when unknown
+    score_bin = Column(Integer, nullable=False)  # 0-9 for scores 0-9 ... 90-100, -1 = no score
+    events = Column(Integer, nullable=False, default=0)
+    score_total = Column(Float, nullable=False, default=0.0)
+
+class TokenUsage(Base):
+    """Provider tokens a tenant spent per minute, shared by every process on the database.
+    
+    The hourly quota sums the last hour of minutes; older rows are deleted
+    as new usage is recorded.
+    """
+    __tablename__ = 'token_usage'
+    __table_args__ = (UniqueConstraint('tenant_id', 'bucket_start', name='uq_token_usage_key'),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant_id = Column(String, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)  # UTC start of the minute
+    tokens = Column(Integer, nullable=False, default=0)
+
+# Full-text index over chat history (SQLite FTS5). Triggers keep it in sync with chat_sessions;
+# the answer text lives compressed in blobs, so they decode it with the blob_text() SQL function
+# registered on every connection (a writer without it cannot insert chats).
+CHAT_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chat_search USING fts5(
+        user_message, ai_response, user_key, tenant_key, subject UNINDEXED,
+        prefix = '2 3', tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS chat_search_insert AFTER INSERT ON chat_sessions BEGIN
+        INSERT INTO chat_search(rowid, user_message, ai_response, user_key, tenant_key, subject)
+        VALUES (new.id, new.user_message,
+                COALESCE((SELECT blob_text(codec, body) FROM blobs WHERE hash = new.response_hash), new.ai_response),
+                new.user_id, new.tenant_id, new.subject);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_search_delete AFTER DELETE ON chat_sessions BEGIN
+        DELETE FROM chat_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_search_update AFTER UPDATE ON chat_sessions BEGIN
+        DELETE FROM chat_search WHERE rowid = old.id;
+        INSERT INTO chat_search(rowid, user_message, ai_response, user_key, tenant_key, subject)
+        VALUES (new.id, new.user_message,
+                COALESCE((SELECT blob_text(codec, body) FROM blobs WHERE hash = new.response_hash), new.ai_response),
+                new.user_id, new.tenant_id, new.subject);
+    END"""
+)
+
+# Index chats written before the index existed (or while it was missing)
+CHAT_SEARCH_BACKFILL = """
+    INSERT INTO chat_search(rowid, user_message, ai_response, user_key, tenant_key, subject)
+    SELECT c.id, c.user_message, COALESCE(blob_text(b.codec, b.body), c.ai_response), c.user_id, c.tenant_id, c.subject
+    FROM chat_sessions c LEFT JOIN blobs b ON b.hash = c.response_hash
+    WHERE c.id > (SELECT COALESCE(MAX(rowid), 0) FROM chat_search)
+"""
+
+def _blob_text(codec, body):
+    return decompress_text(codec, body) if codec is not None else None
+
+def fts_query(text, any_term=False):
+    """FTS5 expression for free text: every word (or any word) must match, the last one as a prefix"""
+    terms = [f'"{term}"' for term in re.findall(r"\w+", (text or "").lower())]
+    if not terms:
+        return None
+    terms[-1] += "*"
+    return "{user_message ai_response} : (%s)" % (" OR " if any_term else " ").join(terms)
+
+def highlight_snippet(text, query, words=24):
+    """Window of `words` words around the first query match, matches in **bold** (FTS5 snippet() in Python)"""
+    terms = re.findall(r"\w+", (query or "").lower())
+    tokens = (text or "").split()
+    
+    def is_match(token):
+        word = re.sub(r"\W+", "", token.lower())
+        return bool(word) and any(word == term or (i == len(terms) - 1 and word.startswith(term))
+                                  for i, term in enumerate(terms))
+    
+    first = next((i for i, token in enumerate(tokens) if is_match(token)), 0)
+    start = max(0, min(first - words // 4, len(tokens) - words))
+    shown = [f"**{token}**" if is_match(token) else token for token in tokens[start:start + words]]
+    return ("..." if start else "") + " ".join(shown) + ("..." if start + words < len(tokens) else "")
+
+def _fts_phrase(value):
+    return '"{}"'.format(value.replace('"', '""'))
+
+# Rollup kind of each table written through insert_rows, and the rollup periods
+ROLLUP_KINDS = {'chat_sessions': 'chat', 'reflections': 'reflection', 'exams': 'exam'}
+ROLLUP_PERIODS = ('hour', 'day')
+
+def score_bin(score):
+    """Histogram bin of a 0-100 score: 0 for 0-9 ... 9 for 90-100, -1 without a score"""
+    if score is None:
+        return -1
+    return min(max(int(score // 10), 0), 9)
+
+def bucket_start(created_at, period):
+    if period == 'day':
+        return created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return created_at.replace(minute=0, second=0, microsecond=0)
+
+def add_rollup(deltas, tenant_id, kind, subject, grade_level, created_at, score):
+    """Count one event into `deltas` ({key: [events, score_total]}) for every rollup period"""
+    for period in ROLLUP_PERIODS:
+        key = (tenant_id, period, bucket_start(created_at, period), kind, subject, grade_level or '', score_bin(score))
+        delta = deltas.setdefault(key, [0, 0.0])
+        delta[0] += 1
+        delta[1] += score or 0.0
+
+# Columns of each export dataset (see DatabaseManager.export_rows and export.py)
+EXPORT_COLUMNS = {
+    'chats': (
+        ('id', int), ('user_id', str), ('email', str), ('tenant_id', str), ('subject', str), ('grade_level', str),
+        ('user_message', str), ('ai_response', str), ('ai_provider', str), ('created_at', datetime)
+    ),
+    'reflections': (
+        ('id', int), ('user_id', str), ('email', str), ('tenant_id', str), ('subject', str),
+        ('reflection_text', str), ('correction', str), ('score', float), ('created_at', datetime)
+    ),
+    'exams': (
+        ('id', int), ('user_id', str), ('email', str), ('tenant_id', str), ('subject', str), ('grade_level', str),
+        ('score', float), ('question_scores', str), ('mc_answers', str), ('created_at', datetime)
+    )
+}
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    dbapi_connection.create_function("blob_text", 2, _blob_text, deterministic=True)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")  # readers no longer block the single writer
+    cursor.execute("PRAGMA synchronous=NORMAL")  # fsync at checkpoints only; safe with WAL
+    cursor.execute(f"PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+def _set_sqlite_read_only_pragmas(dbapi_connection, connection_record):
+    dbapi_connection.create_function("blob_text", 2, _blob_text, deterministic=True)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=1")
+    cursor.execute(f"PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+def is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def create_db_engine(url, read_only=False):
+    """Engine for the configured backend: tuned SQLite by default, pooled server database otherwise"""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        connect_args = {'check_same_thread': False, 'timeout': Config.SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if read_only and is_sqlite_file(url):
+            # Separate read-only connections to the same file (WAL lets them run next to the writer)
+            path = os.path.abspath(url.database)
+            engine = create_engine(f"sqlite:///file:{path}?mode=ro&uri=true", connect_args=connect_args)
+            event.listen(engine, 'connect', _set_sqlite_read_only_pragmas)
+            return engine
+        if is_sqlite_file(url):
+            os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+        engine = create_engine(url, connect_args=connect_args)
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+        return engine
+    
+    return create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT,
+        pool_recycle=Config.DB_POOL_RECYCLE,
+        pool_pre_ping=True
+    )
 
 class DatabaseManager:
-    def __init__(self):
-        self.engine = create_engine(Config.DATABASE_URL)
+    # Sticky key (user id) -> time of its last write, shared by every manager in the process
+    _recent_writes = {}
+    _recent_writes_lock = threading.Lock()
+    
+    def __init__(self, url=None, read_url=None):
+        url = url or Config.DATABASE_URL
+        self.engine = create_db_engine(url)
         Base.metadata.create_all(self.engine)
+        self._add_missing_columns()
+        self.search_enabled = self._create_search_index()
         self.Session = sessionmaker(bind=self.engine)
+        
+        read_url = read_url or Config.DATABASE_READ_URL
+        if read_url:
+            self.read_engine = create_db_engine(read_url, read_only=True)
+        elif is_sqlite_file(url):
+            self.read_engine = create_db_engine(url, read_only=True)
+        else:
+            self.read_engine = self.engine
+        self.ReadSession = sessionmaker(bind=self.read_engine)
+    
+    def close(self):
+        """Commit buffered writes and release pooled connections"""
+        close_write_buffer(self)
+        if self.read_engine is not self.engine:
+            self.read_engine.dispose()
+        self.engine.dispose()
+    
+    def _add_missing_columns(self):
+        """create_all never alters existing tables; add columns introduced since they were created"""
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        column_type = column.type.compile(self.engine.dialect)
+                        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                        if column.server_default is not None and isinstance(column.server_default.arg, str):
+                            ddl += " DEFAULT '{}'".format(column.server_default.arg.replace("'", "''"))
+                        conn.execute(text(ddl))
+                existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing_indexes:
+                        index.create(conn)
+    
+    def _create_search_index(self):
+        """Create the FTS5 chat index and its triggers; False when the backend has no FTS5"""
+        if self.engine.dialect.name != 'sqlite':
+            return False
+        try:
+            with self.engine.begin() as conn:
+                for ddl in CHAT_SEARCH_DDL:
+                    conn.execute(text(ddl))
+                conn.execute(text(CHAT_SEARCH_BACKFILL))
+        except OperationalError:
+            # SQLite built without FTS5
+            return False
+        return True
     
     def get_session(self):
         return self.Session()
     
-    def add_user(self, user_data):
+    def get_read_session(self, sticky_key=None):
+        """Session on the read-only pool; the primary for keys that wrote recently (read-your-writes)"""
+        if sticky_key is not None and self._wrote_recently(sticky_key):
+            return self.Session()
+        return self.ReadSession()
+    
+    def _mark_write(self, sticky_key):
+        if sticky_key is None:
+            return
+        now = time.monotonic()
+        with self._recent_writes_lock:
+            self._recent_writes[sticky_key] = now
+            if len(self._recent_writes) > 10000:
+                cutoff = now - Config.READ_YOUR_WRITES_SECONDS
+                for key in [k for k, t in self._recent_writes.items() if t < cutoff]:
+                    del self._recent_writes[key]
+    
+    def _wrote_recently(self, sticky_key):
+        with self._recent_writes_lock:
+            last = self._recent_writes.get(sticky_key)
+        return last is not None and time.monotonic() - last < Config.READ_YOUR_WRITES_SECONDS
+    
+    def _put_blob(self, session, body_text):
+        """Store text once in the content-addressed blob table; returns its hash"""
+        digest = content_hash(body_text)
+        codec, body = compress_text(body_text)
+        values = {
+            'hash': digest,
+            'codec': codec,
+            'body': body,
+            'size': len(body_text.encode('utf-8')),
+            'created_at': datetime.utcnow()
+        }
+        self._insert_ignore(session, Blob, values, 'hash')
+        return digest
+    
+    def _insert_ignore(self, session, model, values, unique_column):
+        """Insert a row unless one with the same unique value exists (safe under concurrent writers)"""
+        dialect = self.engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = importlib.import_module(f"sqlalchemy.dialects.{dialect}").insert
+            session.execute(insert(model).values(**values).on_conflict_do_nothing(index_elements=[unique_column]))
+        elif session.query(model).filter_by(**{unique_column: values[unique_column]}).first() is None:
+            session.add(model(**values))
+            session.flush()
+    
+    def add_tenant(self, tenant_data):
         session = self.get_session()
+        try:
+            tenant = Tenant(**tenant_data)
+            session.add(tenant)
+            session.commit()
+            return tenant
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def add_token_usage(self, tenant_id, tokens, at=None):
+        """Count provider tokens against the tenant's hourly quota (every process sees them)"""
+        bucket = (at or datetime.utcnow()).replace(second=0, microsecond=0)
+        session = self.get_session()
+        try:
+            self._upsert_add(session, TokenUsage, ('tenant_id', 'bucket_start'), ('tokens',),
+                             [{'tenant_id': tenant_id, 'bucket_start': bucket, 'tokens': tokens}])
+            session.query(TokenUsage).filter(
+                TokenUsage.tenant_id == tenant_id,
+                TokenUsage.bucket_start < bucket - timedelta(hours=1)
+            ).delete(synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_token_usage(self, tenant_id, since):
+        """Tokens the tenant spent from `since` on (minute granularity); read from the primary"""
+        session = self.get_session()
+        try:
+            return session.query(func.coalesce(func.sum(TokenUsage.tokens), 0)).filter(
+                TokenUsage.tenant_id == tenant_id,
+                TokenUsage.bucket_start >= since.replace(second=0, microsecond=0)
+            ).scalar()
+        finally:
+            session.close()
+    
+    def get_tenant(self, tenant_id):
+        session = self.get_read_session()
+        try:
+            return session.query(Tenant).filter_by(id=tenant_id).first()
+        finally:
+            session.close()
+    
+    def resolve_tenant(self, email):
+        """Tenant of a new user, from the domain of their email address"""
+        domain = email.rsplit('@', 1)[-1].lower()
+        session = self.get_read_session()
+        try:
+            tenant = session.query(Tenant).filter_by(email_domain=domain).first()
+            return tenant.id if tenant else Config.DEFAULT_TENANT
+        finally:
+            session.close()
+    
+    def add_user(self, user_data):
+        """Create a user; the returned row (detached, loaded) carries the resolved tenant_id and role"""
+        user_data = dict(user_data)
+        user_data.setdefault('tenant_id', self.resolve_tenant(user_data['email']))
+        if user_data['email'].lower() in Config.TEACHER_EMAILS:
+            user_data.setdefault('role', 'teacher')
+        session = self.Session(expire_on_commit=False)
         try:
             user = User(**user_data)
             session.add(user)
             session.commit()
+            self._mark_write(user.id)
             return user
         except Exception as e:
             session.rollback()
@@ -115,14 +617,14 @@ class DatabaseManager:
             session.close()
     
     def get_user_by_email(self, email):
-        session = self.get_session()
+        session = self.get_read_session()
         try:
             return session.query(User).filter_by(email=email).first()
         finally:
             session.close()
     
     def get_user_by_id(self, user_id):
-        session = self.get_session()
+        session = self.get_read_session(user_id)
         try:
             return session.query(User).filter_by(id=user_id).first()
         finally:
@@ -135,6 +637,7 @@ class DatabaseManager:
             if user:
                 user.grade_level = grade_level
                 session.commit()
+                self._mark_write(user_id)
             return user
         except Exception as e:
             session.rollback()
@@ -143,46 +646,281 @@ class DatabaseManager:
             session.close()
     
     def save_chat(self, chat_data):
+        return self._save('chat_sessions', chat_data)
+    
+    def save_reflection(self, reflection_data):
+        return self._save('reflections', reflection_data)
+    
+    def save_exam(self, exam_data):
+        """Save an exam attempt.
+        
+        Expects 'exam_data' and 'answers' as JSON strings (as before) plus
+        optional 'grade_level' and 'question_scores' (list, None = unknown).
+        """
+        return self._save('exams', exam_data)
+    
+    def _save(self, table, data):
+        """Insert one row, through the write-behind buffer when enabled.
+        
+        Returns the new id, or None for tables with "async" durability
+        (acknowledged before the batch is committed).
+        """
+        self._mark_write(data.get('user_id'))
+        data.setdefault('tenant_id', current_tenant())
+        if Config.WRITE_BEHIND_ENABLED:
+            try:
+                pending = get_write_buffer(self).submit(table, data)
+            except WriterStoppedError:
+                return self.insert_rows([(table, data)])[0]
+            if Config.WRITE_DURABILITY.get(table) == 'async':
+                return None
+            return pending.result(timeout=Config.WRITE_COMMIT_TIMEOUT)
+        return self.insert_rows([(table, data)])[0]
+    
+    def insert_rows(self, items):
+        """Insert [(table, data), ...] in a single transaction; returns the new ids"""
+        builders = {
+            'chat_sessions': self._build_chat,
+            'reflections': self._build_reflection,
+            'exams': self._build_exam
+        }
         session = self.get_session()
         try:
-            chat = ChatSession(**chat_data)
-            session.add(chat)
+            rows = [builders[table](session, dict(data)) for table, data in items]
+            session.add_all(rows)
+            session.flush()
+            deltas = {}
+            for (table, _), row in zip(items, rows):
+                grade_level = row.grade_level
+                if grade_level is None and table == 'exams':
+                    # Same fallback as rebuild_rollups: the shared template's grade
+                    grade_level = session.get(ExamTemplate, row.template_id).grade_level
+                add_rollup(deltas, row.tenant_id, ROLLUP_KINDS[table], row.subject, grade_level,
+                           row.created_at, getattr(row, 'score', None))
+            self._apply_rollups(session, deltas)
+            ids = [row.id for row in rows]
             session.commit()
-            return chat.id
+            return ids
         except Exception as e:
             session.rollback()
             raise e
         finally:
             session.close()
     
-    def save_reflection(self, reflection_data):
+    def _apply_rollups(self, session, deltas):
+        """Add {key: [events, score_total]} to activity_rollups (one upsert per key)"""
+        if not deltas:
+            return
+        key_columns = ('tenant_id', 'period', 'bucket_start', 'kind', 'subject', 'grade_level', 'score_bin')
+        values = [
+            dict(zip(key_columns, key), events=events, score_total=score_total)
+            for key, (events, score_total) in sorted(deltas.items())
+        ]
+        self._upsert_add(session, ActivityRollup, key_columns, ('events', 'score_total'), values)
+    
+    def _upsert_add(self, session, model, key_columns, counters, values):
+        """Insert rows, or add their counter columns to the row already holding the same key"""
+        dialect = self.engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = importlib.import_module(f"sqlalchemy.dialects.{dialect}").insert(model)
+            session.execute(insert.on_conflict_do_update(
+                index_elements=list(key_columns),
+                set_={column: getattr(model, column) + getattr(insert.excluded, column) for column in counters}
+            ), values)
+            return
+        for value in values:
+            row = session.query(model).filter_by(
+                **{column: value[column] for column in key_columns}
+            ).with_for_update().first()
+            if row is None:
+                session.add(model(**value))
+                session.flush()
+            else:
+                for column in counters:
+                    setattr(row, column, getattr(row, column) + value[column])
+    
+    def rebuild_rollups(self, tenant_id=None):
+        """Recompute activity_rollups from the raw tables; returns the number of rollup rows.
+        
+        Runs in one write transaction (raw inserts wait for it), so counts
+        stay exact. Only needed once for data written before rollups existed:
+        `python analytics.py rebuild`.
+        """
+        self.flush_writes()
+        sources = (
+            ('chat_sessions', ChatSession, ChatSession.grade_level, None),
+            ('reflections', Reflection, Reflection.grade_level, Reflection.score),
+            ('exams', Exam, func.coalesce(Exam.grade_level, ExamTemplate.grade_level), Exam.score)
+        )
         session = self.get_session()
         try:
-            reflection = Reflection(**reflection_data)
-            session.add(reflection)
+            if self.engine.dialect.name == 'postgresql':
+                # Writers upsert rollups in the raw insert's transaction; hold them off until we commit
+                session.execute(text("LOCK TABLE activity_rollups IN EXCLUSIVE MODE"))
+            rollups = session.query(ActivityRollup)
+            if tenant_id:
+                rollups = rollups.filter(ActivityRollup.tenant_id == tenant_id)
+            rollups.delete(synchronize_session=False)
+            
+            deltas = {}
+            for table, model, grade_column, score_column in sources:
+                query = select(model.tenant_id, model.subject, grade_column, model.created_at,
+                               score_column if score_column is not None else null())
+                if model is Exam:
+                    query = query.outerjoin(ExamTemplate, ExamTemplate.id == Exam.template_id)
+                if tenant_id:
+                    query = query.where(model.tenant_id == tenant_id)
+                result = session.execute(query.execution_options(yield_per=Config.EXPORT_BATCH_SIZE))
+                for row_tenant, subject, grade_level, created_at, score in result:
+                    add_rollup(deltas, row_tenant, ROLLUP_KINDS[table], subject, grade_level,
+                               created_at or datetime.utcnow(), score)
+            self._apply_rollups(session, deltas)
             session.commit()
-            return reflection.id
+            return len(deltas)
         except Exception as e:
             session.rollback()
             raise e
         finally:
             session.close()
     
-    def save_exam(self, exam_data):
-        session = self.get_session()
+    def get_rollups(self, tenant_id, period, since, until=None, group_by=('kind',), grade_level=None, subject=None):
+        """Summed rollups as dicts of the group_by columns plus events, score_total and scored.
+        
+        Reads activity_rollups only: cost depends on the time range and the
+        number of subjects, not on how many raw rows there are.
+        """
+        columns = [getattr(ActivityRollup, column) for column in group_by]
+        scored = func.sum(ActivityRollup.events).filter(ActivityRollup.score_bin >= 0)
+        session = self.get_read_session()
         try:
-            exam = Exam(**exam_data)
-            session.add(exam)
-            session.commit()
-            return exam.id
-        except Exception as e:
-            session.rollback()
-            raise e
+            query = session.query(
+                *columns, func.sum(ActivityRollup.events), func.sum(ActivityRollup.score_total), scored
+            ).filter(
+                ActivityRollup.tenant_id == (tenant_id or Config.DEFAULT_TENANT),
+                ActivityRollup.period == period,
+                ActivityRollup.bucket_start >= bucket_start(since, period)
+            )
+            if until:
+                query = query.filter(ActivityRollup.bucket_start < until)
+            if grade_level:
+                query = query.filter(ActivityRollup.grade_level == grade_level)
+            if subject:
+                query = query.filter(ActivityRollup.subject == subject)
+            rows = query.group_by(*columns).order_by(*columns).all()
+            return [
+                dict(zip(group_by, row[:len(group_by)]), events=row[-3], score_total=row[-2] or 0.0, scored=row[-1] or 0)
+                for row in rows
+            ]
+        finally:
+            session.close()
+    
+    def flush_writes(self, sticky_key=None):
+        """Wait until buffered writes are committed.
+        
+        With a sticky key, only when that key wrote recently (read-your-writes
+        for a user's own history); other readers never wait on the buffer.
+        """
+        if not Config.WRITE_BEHIND_ENABLED:
+            return
+        if sticky_key is not None and not self._wrote_recently(sticky_key):
+            return
+        get_write_buffer(self).flush()
+    
+    def _build_chat(self, session, chat_data):
+        chat_data['response_hash'] = self._put_blob(session, chat_data.pop('ai_response'))
+        return ChatSession(**chat_data)
+    
+    def _build_reflection(self, session, reflection_data):
+        return Reflection(**reflection_data)
+    
+    def _get_or_create_exam_template(self, session, questions, subject, grade_level):
+        """Template shared by every exam that used this exact question set"""
+        questions_json = json.dumps(questions, ensure_ascii=False, sort_keys=True)
+        question_set_hash = content_hash(questions_json)
+        template_id = session.query(ExamTemplate.id).filter_by(question_set_hash=question_set_hash).scalar()
+        if template_id:
+            return template_id
+        
+        multiple_choice = questions.get('multiple_choice', [])
+        answer_key = "".join(
+            (str(mc.get('answer') or mc.get('correct_answer') or '-').strip()[:1] or '-').upper()
+            for mc in multiple_choice
+        )
+        self._insert_ignore(session, ExamTemplate, {
+            'question_set_hash': question_set_hash,
+            'subject': subject,
+            'grade_level': grade_level,
+            'questions_hash': self._put_blob(session, questions_json),
+            'mc_count': len(multiple_choice),
+            'essay_count': len(questions.get('essay_questions', [])),
+            'answer_key': answer_key,
+            'created_at': datetime.utcnow()
+        }, 'question_set_hash')
+        return session.query(ExamTemplate.id).filter_by(question_set_hash=question_set_hash).scalar()
+    
+    def _build_exam(self, session, exam_data):
+        questions = json.loads(exam_data.pop('exam_data'))
+        answers = json.loads(exam_data.pop('answers') or "{}")
+        scores = exam_data.pop('question_scores', None) or []
+        grade_level = exam_data.get('grade_level')
+        
+        template_id = self._get_or_create_exam_template(session, questions, exam_data['subject'], grade_level)
+        total_mc = len(questions.get('multiple_choice', []))
+        total_essay = len(questions.get('essay_questions', []))
+        exam_data['template_id'] = template_id
+        exam_data['mc_answers'] = "".join(
+            (answers.get(f"mc_{i}") or '-')[:1] for i in range(total_mc)
+        )
+        exam_data['essay_answers'] = json.dumps(
+            [answers.get(f"essay_{i}", "") for i in range(total_essay)], ensure_ascii=False
+        )
+        exam_data['question_scores'] = ",".join("" if score is None else f"{score:g}" for score in scores)
+        if exam_data.get('essay_signatures') is not None:
+            exam_data['essay_signatures'] = json.dumps(exam_data['essay_signatures'])
+        return Exam(**exam_data)
+    
+    def get_question_stats(self, template_id):
+        """Per-question answer distribution and average score for one exam template"""
+        session = self.get_read_session()
+        try:
+            template = session.query(ExamTemplate).filter_by(id=template_id).first()
+            if not template:
+                return []
+            rows = session.query(Exam.mc_answers, Exam.question_scores).filter_by(template_id=template_id).all()
         finally:
             session.close()
+        
+        total = template.mc_count + template.essay_count
+        stats = [
+            {
+                'index': i,
+                'kind': 'multiple_choice' if i < template.mc_count else 'essay',
+                'attempts': 0,
+                'score_sum': 0.0,
+                'scored': 0,
+                'answers': {}
+            }
+            for i in range(total)
+        ]
+        for mc_answers, question_scores in rows:
+            for i, letter in enumerate((mc_answers or "")[:template.mc_count]):
+                if letter != '-':
+                    stats[i]['answers'][letter] = stats[i]['answers'].get(letter, 0) + 1
+            for i, value in enumerate((question_scores or "").split(",")[:total] if question_scores else []):
+                if value:
+                    stats[i]['score_sum'] += float(value)
+                    stats[i]['scored'] += 1
+        for item in stats:
+            item['attempts'] = len(rows)
+            item['average_score'] = item['score_sum'] / item['scored'] if item['scored'] else None
+            if item['kind'] == 'multiple_choice' and template.answer_key:
+                key = template.answer_key[item['index']]
+                item['correct_rate'] = item['answers'].get(key, 0) / len(rows) if rows and key != '-' else None
+        return stats
     
     def get_user_chats(self, user_id, subject=None):
-        session = self.get_session()
+        self.flush_writes(user_id)
+        session = self.get_read_session(user_id)
         try:
             query = session.query(ChatSession).filter_by(user_id=user_id)
             if subject:
@@ -191,8 +929,273 @@ class DatabaseManager:
         finally:
             session.close()
     
-    def get_cache(self, query_hash):
+    @staticmethod
+    def _chats_of(session, user_id, subject, conversation_id=None):
+        query = session.query(ChatSession).filter_by(user_id=user_id, subject=subject)
+        if conversation_id is not None:
+            query = query.filter_by(conversation_id=conversation_id)
+        return query
+    
+    def count_user_chats(self, user_id, subject, conversation_id=None):
+        self.flush_writes(user_id)
+        session = self.get_read_session(user_id)
+        try:
+            return self._chats_of(session, user_id, subject, conversation_id).count()
+        finally:
+            session.close()
+    
+    def get_chat_range(self, user_id, subject, offset, limit, conversation_id=None):
+        """Chats of one subject (optionally one conversation) in chronological order"""
+        self.flush_writes(user_id)
+        session = self.get_read_session(user_id)
+        try:
+            return self._chats_of(session, user_id, subject, conversation_id).order_by(
+                ChatSession.created_at, ChatSession.id
+            ).offset(offset).limit(limit).all()
+        finally:
+            session.close()
+    
+    def search_chats(self, user_id, query, subject=None, limit=20, offset=0, tenant_id=None, any_term=False):
+        """Ranked full-text search over chat history.
+        
+        Searches one user's chats, or every chat of the tenant when user_id
+        is None. Returns one page of dicts with the chat id, subject,
+        created_at, provider, the full message and answer, and highlighted snippets,
+        best match first. Without FTS5 it falls back to a LIKE scan of the
+        messages.
+        """
+        if user_id is not None:
+            self.flush_writes(user_id)
+        match = fts_query(query, any_term)
+        if not match:
+            return []
+        if not self.search_enabled:
+            return self._search_chats_like(user_id, query, subject, limit, offset, tenant_id)
+        
+        tenant_id = tenant_id or current_tenant()
+        conditions = ["chat_search MATCH :match"]
+        params = {'limit': limit, 'offset': offset}
+        # The phrase narrows the MATCH through the index; the comparison makes the filter exact
+        # (ids that tokenize alike, such as "a_b" and "a-b", share a phrase)
+        if user_id is not None:
+            if re.search(r"\w", user_id):
+                match = f"user_key : {_fts_phrase(user_id)} AND {match}"
+            conditions.append("s.user_key = :user_id")
+            params['user_id'] = user_id
+        elif tenant_id != Config.DEFAULT_TENANT or self._has_tenants():
+            # Skipped on single-school deployments, where every row matches it anyway
+            if re.search(r"\w", tenant_id):
+                match = f"tenant_key : {_fts_phrase(tenant_id)} AND {match}"
+            conditions.append("s.tenant_key = :tenant_id")
+            params['tenant_id'] = tenant_id
+        params['match'] = match
+        if subject:
+            conditions.append("s.subject = :subject")
+            params['subject'] = subject
+        
+        # The page is read by rowid afterwards; snippet() would re-run the MATCH for every row.
+        sql = f"""
+            WITH page AS (
+                SELECT s.rowid AS id, bm25(chat_search, 2.0, 1.0, 0.0, 0.0) AS rank
+                FROM chat_search s
+                WHERE {" AND ".join(conditions)}
+                ORDER BY rank
+                LIMIT :limit OFFSET :offset
+            )
+            SELECT c.id, c.subject, c.created_at, c.ai_provider, s.user_message, s.ai_response, page.rank
+            FROM page
+            CROSS JOIN chat_search s ON s.rowid = page.id
+            CROSS JOIN chat_sessions c ON c.id = page.id
+            ORDER BY page.rank
+        """
+        session = self.get_read_session(user_id)
+        try:
+            rows = session.execute(text(sql).columns(created_at=DateTime), params).all()
+        finally:
+            session.close()
+        return [
+            dict(
+                row._mapping,
+                message_snippet=highlight_snippet(row.user_message, query, 16),
+                response_snippet=highlight_snippet(row.ai_response, query, 24)
+            )
+            for row in rows
+        ]
+    
+    def _has_tenants(self):
+        session = self.get_read_session()
+        try:
+            return session.query(Tenant.id).first() is not None
+        finally:
+            session.close()
+    
+    def _search_chats_like(self, user_id, query, subject, limit, offset, tenant_id):
+        session = self.get_read_session(user_id)
+        try:
+            chats = session.query(ChatSession).filter(ChatSession.user_message.ilike(f"%{query.strip()}%"))
+            if user_id is not None:
+                chats = chats.filter_by(user_id=user_id)
+            else:
+                chats = chats.filter_by(tenant_id=tenant_id or current_tenant())
+            if subject:
+                chats = chats.filter_by(subject=subject)
+            chats = chats.order_by(ChatSession.created_at.desc()).offset(offset).limit(limit).all()
+            return [{
+                'id': chat.id,
+                'subject': chat.subject,
+                'created_at': chat.created_at,
+                'ai_provider': chat.ai_provider,
+                'user_message': chat.user_message,
+                'ai_response': chat.ai_response,
+                'message_snippet': highlight_snippet(chat.user_message, query, 16),
+                'response_snippet': highlight_snippet(chat.ai_response, query, 24),
+                'rank': 0.0
+            } for chat in chats]
+        finally:
+            session.close()
+    
+    def _export_query(self, dataset):
+        """(model, select, row converter) for an export dataset"""
+        if dataset == 'chats':
+            query = select(
+                ChatSession.id, ChatSession.user_id, User.email, ChatSession.tenant_id, ChatSession.subject,
+                ChatSession.grade_level, ChatSession.user_message, ChatSession._ai_response, Blob.codec, Blob.body,
+                ChatSession.ai_provider, ChatSession.created_at
+            ).outerjoin(Blob, Blob.hash == ChatSession.response_hash).outerjoin(User, User.id == ChatSession.user_id)
+            
+            def convert(row):
+                response = decompress_text(row.codec, row.body) if row.codec is not None else row[7]
+                return tuple(row[:7]) + (response,) + tuple(row[10:])
+            return ChatSession, query, convert
+        if dataset == 'reflections':
+            query = select(
+                Reflection.id, Reflection.user_id, User.email, Reflection.tenant_id, Reflection.subject,
+                Reflection.reflection_text, Reflection.correction, Reflection.score, Reflection.created_at
+            ).outerjoin(User, User.id == Reflection.user_id)
+            return Reflection, query, tuple
+        if dataset == 'exams':
+            query = select(
+                Exam.id, Exam.user_id, User.email, Exam.tenant_id, Exam.subject,
+                func.coalesce(Exam.grade_level, ExamTemplate.grade_level), Exam.score, Exam.question_scores, Exam.mc_answers, Exam.created_at
+            ).outerjoin(ExamTemplate, ExamTemplate.id == Exam.template_id).outerjoin(User, User.id == Exam.user_id)
+            return Exam, query, tuple
+        raise ValueError(f"Unknown export dataset: {dataset}")
+    
+    def export_rows(self, dataset, tenant_id=None, since=None, until=None, batch_size=Config.EXPORT_BATCH_SIZE):
+        """Stream a dataset in batches of row tuples (columns as in EXPORT_COLUMNS).
+        
+        Rows come from a server-side cursor (yield_per), so only one batch
+        is in memory at a time however large the table is. tenant_id=None
+        exports every school; since/until bound created_at.
+        """
+        self.flush_writes()
+        model, query, convert = self._export_query(dataset)
+        if tenant_id:
+            query = query.where(model.tenant_id == tenant_id)
+        if since:
+            query = query.where(model.created_at >= since)
+        if until:
+            query = query.where(model.created_at < until)
+        query = query.order_by(model.id).execution_options(yield_per=batch_size)
+        
+        session = self.get_read_session()
+        try:
+            for partition in session.execute(query).partitions():
+                yield [convert(row) for row in partition]
+        finally:
+            session.close()
+    
+    def get_popular_questions(self, per_group, tenant_id=None, since=None, min_count=2):
+        """Most asked chat messages per (subject, grade_level) as (subject, grade_level, message, count)"""
+        session = self.get_read_session()
+        try:
+            asked = func.count(ChatSession.id)
+            query = session.query(
+                ChatSession.subject, ChatSession.grade_level, ChatSession.user_message, asked
+            ).filter(ChatSession.tenant_id == (tenant_id or Config.DEFAULT_TENANT))
+            if since:
+                query = query.filter(ChatSession.created_at >= since)
+            rows = query.group_by(
+                ChatSession.subject, ChatSession.grade_level, ChatSession.user_message
+            ).having(asked >= min_count).order_by(asked.desc()).all()
+        finally:
+            session.close()
+        
+        taken = {}
+        popular = []
+        for subject, grade_level, message, count in rows:
+            group = (subject, grade_level)
+            if taken.get(group, 0) < per_group:
+                taken[group] = taken.get(group, 0) + 1
+                popular.append((subject, grade_level, message, count))
+        return popular
+    
+    def get_recent_reflection_signatures(self, subject, tenant_id=None, limit=300):
+        """(user_id, MinHash signature) of the latest reflections in a subject"""
+        session = self.get_read_session()
+        try:
+            return session.query(Reflection.user_id, Reflection.signature).filter(
+                Reflection.tenant_id == (tenant_id or Config.DEFAULT_TENANT),
+                Reflection.subject == subject,
+                Reflection.signature.isnot(None)
+            ).order_by(Reflection.id.desc()).limit(limit).all()
+        finally:
+            session.close()
+    
+    def get_recent_essay_signatures(self, questions, tenant_id=None, limit=300):
+        """(user_id, [signature per essay]) of the latest exams with the same question set"""
+        question_set_hash = content_hash(json.dumps(questions, ensure_ascii=False, sort_keys=True))
+        session = self.get_read_session()
+        try:
+            template_id = session.query(ExamTemplate.id).filter_by(question_set_hash=question_set_hash).scalar()
+            if template_id is None:
+                return []
+            rows = session.query(Exam.user_id, Exam.essay_signatures).filter(
+                Exam.template_id == template_id,
+                Exam.tenant_id == (tenant_id or Config.DEFAULT_TENANT),
+                Exam.essay_signatures.isnot(None)
+            ).order_by(Exam.id.desc()).limit(limit)
+            return [(user_id, json.loads(signatures)) for user_id, signatures in rows]
+        finally:
+            session.close()
+    
+    def get_user_scores(self, user_id):
+        """Reflection and exam scores of a user (knowledge level page)"""
+        session = self.get_read_session(user_id)
+        try:
+            reflection_scores = [score for (score,) in session.query(Reflection.score).filter_by(user_id=user_id)]
+            exam_scores = [score for (score,) in session.query(Exam.score).filter_by(user_id=user_id)]
+            return reflection_scores, exam_scores
+        finally:
+            session.close()
+    
+    def get_chat_summary(self, user_id, subject):
+        session = self.get_read_session(user_id)
+        try:
+            return session.query(ChatSummary).filter_by(user_id=user_id, subject=subject).first()
+        finally:
+            session.close()
+    
+    def save_chat_summary(self, user_id, subject, summary, turns_summarized, conversation_id=None):
         session = self.get_session()
+        try:
+            row = session.query(ChatSummary).filter_by(user_id=user_id, subject=subject).first()
+            if not row:
+                row = ChatSummary(user_id=user_id, subject=subject)
+                session.add(row)
+            row.summary = summary
+            row.turns_summarized = turns_summarized
+            row.conversation_id = conversation_id
+            session.commit()
+            self._mark_write(user_id)
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_cache(self, query_hash):
+        session = self.get_read_session()
         try:
             cache = session.query(Cache).filter_by(query_hash=query_hash).first()
             if cache and cache.expires_at and cache.expires_at > datetime.utcnow():
@@ -201,19 +1204,179 @@ class DatabaseManager:
         finally:
             session.close()
     
-    def set_cache(self, query_hash, query, response, subject=None, grade_level=None):
-        session = self.get_session()
+    def get_recent_chat_queries(self, subject, grade_level, tenant_id=None, limit=500):
+        """(id, question) of the most recent cached chat replies for a subject and grade, expired ones included.
+        
+        Only the question text is read; load the answer of the chosen row with get_cache_response.
+        """
+        session = self.get_read_session()
         try:
-            expires_at = datetime.utcnow() + timedelta(seconds=Config.CACHE_TTL)
-            cache = Cache(
-                query_hash=query_hash,
-                query=query,
-                response=response,
+            return session.query(Cache.id, Cache.query).filter_by(
+                kind='chat',
                 subject=subject,
                 grade_level=grade_level,
-                expires_at=expires_at
-            )
-            session.add(cache)
+                tenant_id=tenant_id or Config.DEFAULT_TENANT
+            ).order_by(Cache.created_at.desc()).limit(limit).all()
+        finally:
+            session.close()
+    
+    def get_cache_response(self, cache_id):
+        """Response of one cache row by id, expired or not"""
+        session = self.get_read_session()
+        try:
+            cache = session.get(Cache, cache_id)
+            return cache.response if cache else None
+        finally:
+            session.close()
+    
+    def set_cache(self, query_hash, query, response, subject=None, grade_level=None, tenant_id=None, kind=None):
+        session = self.get_session()
+        try:
+            expires_at = datetime.utcnow() + timedelta(seconds=Config.CACHE_TTL)
+            response_hash = self._put_blob(session, response)
+            cache = session.query(Cache).filter_by(query_hash=query_hash).first()
+            if cache:
+                # Refresh expired entry instead of violating the unique hash
+                cache.response = ""
+                cache.response_hash = response_hash
+                cache.expires_at = expires_at
+            else:
+                cache = Cache(
+                    query_hash=query_hash,
+                    query=query,
+                    response_hash=response_hash,
+                    subject=subject,
+                    grade_level=grade_level,
+                    kind=kind,
+                    tenant_id=tenant_id or Config.DEFAULT_TENANT,
+                    expires_at=expires_at
+                )
+                session.add(cache)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def set_cache_many(self, entries, tenant_id=None):
+        """Insert or refresh many cache entries in one transaction.
+        
+        entries: dicts with query_hash, query, response, subject, grade_level
+        and optionally kind.
+        """
+        session = self.get_session()
+        try:
+            expires_at = datetime.utcnow() + timedelta(seconds=Config.CACHE_TTL)
+            existing = {
+                cache.query_hash: cache
+                for cache in session.query(Cache).filter(
+                    Cache.query_hash.in_([entry['query_hash'] for entry in entries])
+                )
+            } if entries else {}
+            for entry in entries:
+                response_hash = self._put_blob(session, entry['response'])
+                cache = existing.get(entry['query_hash'])
+                if cache:
+                    cache.response = ""
+                    cache.response_hash = response_hash
+                    cache.expires_at = expires_at
+                else:
+                    cache = existing[entry['query_hash']] = Cache(
+                        query_hash=entry['query_hash'],
+                        query=entry['query'],
+                        response_hash=response_hash,
+                        subject=entry.get('subject'),
+                        grade_level=entry.get('grade_level'),
+                        kind=entry.get('kind'),
+                        tenant_id=tenant_id or Config.DEFAULT_TENANT,
+                        expires_at=expires_at
+                    )
+                    session.add(cache)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def create_job(self, job_data):
+        session = self.get_session()
+        try:
+            job = Job(**job_data)
+            session.add(job)
+            session.commit()
+            return job.id
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_job(self, job_id):
+        session = self.get_session()
+        try:
+            return session.query(Job).filter_by(id=job_id).first()
+        finally:
+            session.close()
+    
+    def get_job_by_idempotency_key(self, idempotency_key):
+        session = self.get_session()
+        try:
+            return session.query(Job).filter_by(idempotency_key=idempotency_key).first()
+        finally:
+            session.close()
+    
+    def update_job(self, job_id, **fields):
+        session = self.get_session()
+        try:
+            session.query(Job).filter_by(id=job_id).update(fields)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def claim_job(self, job_id, from_statuses, stale_before=None, **fields):
+        """Atomically update a job that is still in one of from_statuses.
+        
+        With stale_before, only if it was last updated before then. Returns
+        False when another worker or process changed the job first.
+        """
+        session = self.get_session()
+        try:
+            query = session.query(Job).filter(Job.id == job_id, Job.status.in_(from_statuses))
+            if stale_before is not None:
+                query = query.filter(Job.updated_at < stale_before)
+            fields.setdefault('updated_at', datetime.utcnow())
+            claimed = query.update(fields, synchronize_session=False)
+            session.commit()
+            return claimed == 1
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    def get_stale_jobs(self, stale_before):
+        """Jobs left pending/running by a worker that stopped before finishing them"""
+        session = self.get_session()
+        try:
+            return session.query(Job).filter(
+                Job.status.in_(['pending', 'running']),
+                Job.updated_at < stale_before
+            ).all()
+        finally:
+            session.close()
+    
+    def delete_finished_jobs(self, older_than):
+        session = self.get_session()
+        try:
+            session.query(Job).filter(
+                Job.status.in_(['done', 'failed']),
+                Job.updated_at < older_than
+            ).delete(synchronize_session=False)
             session.commit()
         except Exception as e:
             session.rollback()
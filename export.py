@@ -0,0 +1,93 @@
+"""Streaming export of learning records (chats, reflections, exam scores).
+
+    python export.py chats --tenant sman1 --since 2024-07-01 --until 2025-01-01 -o chats.csv
+    python export.py exams --format parquet -o exams.parquet
+
+Rows are read through a server-side cursor and written batch by batch:
+CSV rows as they arrive, Parquet one row group per batch. Memory stays
+constant however many rows a school has. Parquet output needs pyarrow
+(optional dependency, imported only when used).
+"""
+import argparse
+import csv
+import importlib
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Tuple
+from config import Config
+from database import EXPORT_COLUMNS, DatabaseManager
+
+FORMATS = ("csv", "parquet")
+
+def write_csv(batches: Iterable[List[tuple]], columns: Sequence[Tuple[str, type]], path: str) -> int:
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in columns])
+        for batch in batches:
+            writer.writerows(
+                [value.isoformat(sep=" ") if isinstance(value, datetime) else value for value in row]
+                for row in batch
+            )
+            rows += len(batch)
+    return rows
+
+def write_parquet(batches: Iterable[List[tuple]], columns: Sequence[Tuple[str, type]], path: str) -> int:
+    try:
+        pa = importlib.import_module("pyarrow")
+        pq = importlib.import_module("pyarrow.parquet")
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+    
+    types = {int: pa.int64(), float: pa.float64(), str: pa.string(), datetime: pa.timestamp("us")}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for batch in batches:
+            arrays = [pa.array([row[i] for row in batch], type=field.type) for i, field in enumerate(schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(batch)
+    return rows
+
+def export_records(db, dataset: str, path: str, fmt: str = "csv", tenant_id: Optional[str] = None,
+                   since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   batch_size: int = Config.EXPORT_BATCH_SIZE) -> int:
+    """Write one dataset to `path`; returns the number of rows exported"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    batches = db.export_rows(dataset, tenant_id, since, until, batch_size)
+    writer = write_parquet if fmt == "parquet" else write_csv
+    return writer(batches, EXPORT_COLUMNS[dataset], path)
+
+def _date(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export learning records to CSV or Parquet")
+    parser.add_argument("dataset", choices=sorted(EXPORT_COLUMNS))
+    parser.add_argument("-o", "--output", help="Output file (default: EXPORT_DIR/<dataset>-<time>.<format>)")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--tenant", help="Only this school (default: all)")
+    parser.add_argument("--since", type=_date, help="Records created on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", type=_date, help="Records created before this date (YYYY-MM-DD)")
+    parser.add_argument("--batch-size", type=int, default=Config.EXPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    
+    path = args.output or os.path.join(
+        Config.EXPORT_DIR, f"{args.dataset}-{datetime.utcnow():%Y%m%d-%H%M%S}.{args.format}"
+    )
+    db = DatabaseManager()
+    started = time.perf_counter()
+    try:
+        rows = export_records(db, args.dataset, path, args.format, args.tenant, args.since, args.until,
+                              args.batch_size)
+    finally:
+        db.close()
+    print(f"Exported {rows} {args.dataset} rows to {path} in {time.perf_counter() - started:.1f} s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
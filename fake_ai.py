@@ -0,0 +1,131 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Any, Iterator, Optional
+
+class FakeAIManager:
+    """Offline stand-in for AIManager used by load tests and local development.
+    
+    Latency is drawn from a log-normal distribution around `latency_ms` so
+    the tail looks like a real provider; `stream_response` yields the reply
+    in chunks to simulate token streaming.
+    """
+    
+    current_provider = "fake"
+    
+    def __init__(self, latency_ms: float = 800.0, jitter: float = 0.5, first_token_ms: float = 200.0,
+                 chunk_size: int = 40, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.first_token_ms = first_token_ms
+        self.chunk_size = chunk_size
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.last_usage = {}
+    
+    @classmethod
+    def from_env(cls) -> "FakeAIManager":
+        """Build from FAKE_AI_* environment variables"""
+        seed = os.getenv("FAKE_AI_SEED")
+        return cls(
+            latency_ms=float(os.getenv("FAKE_AI_LATENCY_MS", 800)),
+            jitter=float(os.getenv("FAKE_AI_JITTER", 0.5)),
+            first_token_ms=float(os.getenv("FAKE_AI_FIRST_TOKEN_MS", 200)),
+            error_rate=float(os.getenv("FAKE_AI_ERROR_RATE", 0)),
+            seed=int(seed) if seed else None
+        )
+    
+    def _sample_latency(self) -> float:
+        with self._lock:
+            self.calls += 1
+            if self._random.random() < self.error_rate:
+                raise RuntimeError("Fake provider error")
+            return self._random.lognormvariate(0, self.jitter) * self.latency_ms / 1000
+    
+    def _reply(self, prompt: str, subject: str) -> str:
+        words = ["Materi", subject or "umum", "dijelaskan", "langkah", "demi", "langkah", "dengan", "contoh"]
+        body = " ".join(words[i % len(words)] for i in range(120))
+        self.last_usage = {"input_tokens": max(1, len(prompt) // 4), "output_tokens": max(1, len(body) // 4)}
+        return body
+    
+    def stream_response(self, prompt: str, subject: str, grade_level: str) -> Iterator[str]:
+        """Yield the reply chunk by chunk with simulated inter-token delay"""
+        total = self._sample_latency()
+        reply = self._reply(prompt, subject)
+        chunks = [reply[i:i + self.chunk_size] for i in range(0, len(reply), self.chunk_size)]
+        first = min(total, self.first_token_ms / 1000)
+        time.sleep(first)
+        step = (total - first) / max(1, len(chunks) - 1)
+        for idx, chunk in enumerate(chunks):
+            if idx:
+                time.sleep(step)
+            yield chunk
+    
+    def get_response(self, prompt: str, subject: str, grade_level: str) -> str:
+        return "".join(self.stream_response(prompt, subject, grade_level))
+    
+    def grade_reflection(self, reflection_text: str, subject: str, grade_level: str) -> Dict[str, Any]:
+        time.sleep(self._sample_latency())
+        self.last_usage = {"input_tokens": max(1, len(reflection_text) // 4), "output_tokens": 60}
+        return {
+            "score": 80,
+            "correction": "Refleksi sudah baik, perjelas contoh pengalaman pribadi.",
+            "feedback": "Pertahankan cara berpikir kritis Anda."
+        }
+    
+    def _exam_questions(self, subject: str) -> Dict[str, Any]:
+        self.last_usage = {"input_tokens": 50, "output_tokens": 900}
+        return {
+            "multiple_choice": [
+                {
+                    "question": f"Soal {subject} nomor {i + 1}?",
+                    "options": ["A. Pilihan satu", "B. Pilihan dua", "C. Pilihan tiga", "D. Pilihan empat"],
+                    "answer": "A"
+                }
+                for i in range(10)
+            ],
+            "essay_questions": [
+                {"question": f"Jelaskan konsep {subject} nomor {i + 1}."}
+                for i in range(3)
+            ]
+        }
+    
+    def generate_exam_questions(self, subject: str, grade_level: str) -> Dict[str, Any]:
+        time.sleep(self._sample_latency())
+        return self._exam_questions(subject)
+    
+    def stream_exam_questions(self, subject: str, grade_level: str) -> Iterator[str]:
+        """Yield the exam as raw JSON text, chunk by chunk, like a streaming provider.
+        
+        AIManager has no equivalent yet, so incremental exam previews are
+        only seen with AI_BACKEND=fake.
+        """
+        total = self._sample_latency()
+        text = json.dumps(self._exam_questions(subject), ensure_ascii=False)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        first = min(total, self.first_token_ms / 1000)
+        time.sleep(first)
+        step = (total - first) / max(1, len(chunks) - 1)
+        for idx, chunk in enumerate(chunks):
+            if idx:
+                time.sleep(step)
+            yield chunk
+    
+    def grade_exam(self, questions: Dict[str, Any], answers: Dict[str, str]) -> Dict[str, Any]:
+        time.sleep(self._sample_latency())
+        total_mc = len(questions.get("multiple_choice", []))
+        total_essay = len(questions.get("essay_questions", []))
+        mc_score = sum(2 for i in range(total_mc) if answers.get(f"mc_{i}") == "A")
+        essay_score = 7 * total_essay
+        self.last_usage = {"input_tokens": 400, "output_tokens": 150}
+        max_score = total_mc * 2 + total_essay * 10
+        return {
+            "multiple_choice_score": mc_score,
+            "essay_score": essay_score,
+            "total_score": round((mc_score + essay_score) * 100 / max_score, 1) if max_score else 0,
+            "feedback": "Jawaban cukup baik."
+        }
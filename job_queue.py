@@ -0,0 +1,274 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Callable
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from database import DatabaseManager
+from tenants import TenantQuotas, tenant_scope
+
+_progress: ContextVar[Optional[Callable[[Any], None]]] = ContextVar("job_progress", default=None)
+
+def report_progress(partial: Any):
+    """Store a partial result on the running job so pages can show it before it is done"""
+    reporter = _progress.get()
+    if reporter is not None:
+        reporter(partial)
+
+class FairScheduler:
+    """Round-robin dispatch of queued work across tenants.
+    
+    Each tenant (school) has its own FIFO queue. Whenever a worker is free
+    the next tenant in rotation that is below its concurrency limit gets it,
+    so a burst from one school queues behind its own jobs instead of ahead
+    of every other school's.
+    """
+    
+    def __init__(self, executor: ThreadPoolExecutor, max_workers: int, quotas: TenantQuotas):
+        self.executor = executor
+        self.max_workers = max_workers
+        self.quotas = quotas
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._running = defaultdict(int)
+        self._busy = 0
+        self._lock = threading.Lock()
+    
+    def submit(self, tenant_id: str, fn: Callable, *args):
+        with self._lock:
+            self._queues.setdefault(tenant_id, deque()).append((fn, args))
+        self._dispatch()
+    
+    def queued(self, tenant_id: Optional[str] = None) -> int:
+        with self._lock:
+            if tenant_id is not None:
+                return len(self._queues.get(tenant_id, ()))
+            return sum(len(queue) for queue in self._queues.values())
+    
+    def _next(self, limits: Dict[str, int]):
+        """Pop the next job of the first eligible tenant and rotate it to the back.
+        
+        Tenants missing from `limits` (queued after the snapshot) wait for
+        the dispatch their own submit triggers.
+        """
+        for tenant_id, queue in self._queues.items():
+            if tenant_id in limits and self._running[tenant_id] < limits[tenant_id]:
+                fn, args = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(tenant_id)
+                else:
+                    del self._queues[tenant_id]
+                return tenant_id, fn, args
+        return None
+    
+    def _dispatch(self):
+        # Limits may be loaded from the database: snapshot them before taking the lock
+        with self._lock:
+            tenants = list(self._queues)
+        limits = {tenant_id: self.quotas.max_concurrent(tenant_id) for tenant_id in tenants}
+        with self._lock:
+            while self._busy < self.max_workers:
+                picked = self._next(limits)
+                if picked is None:
+                    return
+                tenant_id, fn, args = picked
+                try:
+                    self.executor.submit(self._run, tenant_id, fn, args)
+                except RuntimeError:
+                    # Executor shut down; the job stays pending in the table and is recovered on restart
+                    return
+                self._running[tenant_id] += 1
+                self._busy += 1
+    
+    def _run(self, tenant_id: str, fn: Callable, args: tuple):
+        try:
+            fn(*args)
+        finally:
+            with self._lock:
+                self._running[tenant_id] -= 1
+                self._busy -= 1
+            self._dispatch()
+
+class JobManager:
+    """Runs AI work on a thread pool, outside the Streamlit script thread.
+    
+    Every job is persisted in the `jobs` table, so a page only has to keep
+    the job id in st.session_state: reruns and navigation no longer cancel
+    the provider call, and the result can be picked up later by id. Jobs are
+    dispatched per tenant through FairScheduler and checked against the
+    tenant's hourly token quota before they start.
+    """
+    
+    def __init__(self, db: DatabaseManager, handlers: Dict[str, Callable[[Dict[str, Any]], Any]],
+                 max_workers: int = Config.JOB_WORKERS):
+        self.db = db
+        self.handlers = handlers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-job")
+        self.quotas = TenantQuotas(db)
+        self.scheduler = FairScheduler(self.executor, max_workers, self.quotas)
+        self._events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, kind: str, payload: Dict[str, Any], user_id: Optional[str] = None,
+               tenant_id: Optional[str] = None, submission: Optional[str] = None) -> str:
+        """Persist a job and schedule it; returns the job id.
+        
+        `submission` is a nonce the page generated when it rendered the form.
+        A repeat of the same submission (double click, resent request) within
+        IDEMPOTENCY_TTL_SECONDS returns the id of the job already running or
+        finished instead of calling the provider and saving the result again;
+        a new submission with an identical payload is a new job.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        tenant_id = tenant_id or Config.DEFAULT_TENANT
+        key = self.idempotency_key(kind, submission, user_id) if submission else None
+        if key:
+            existing = self._reuse(key)
+            if existing:
+                return existing
+        
+        job_id = uuid.uuid4().hex
+        try:
+            self.db.create_job({
+                'id': job_id,
+                'user_id': user_id,
+                'tenant_id': tenant_id,
+                'kind': kind,
+                'idempotency_key': key,
+                'payload': json.dumps(payload, ensure_ascii=False),
+                'status': 'pending'
+            })
+        except IntegrityError:
+            # A concurrent repeat of the submission created the job first
+            existing = self._reuse(key) if key else None
+            if not existing:
+                raise
+            return existing
+        self._schedule(job_id, kind, payload, tenant_id)
+        return job_id
+    
+    @staticmethod
+    def idempotency_key(kind: str, submission: str, user_id: Optional[str]) -> str:
+        body = json.dumps([user_id, kind, submission], ensure_ascii=False)
+        return hashlib.sha256(body.encode('utf-8')).hexdigest()
+    
+    def _reuse(self, key: str) -> Optional[str]:
+        """Id of the live job holding this key; expired or failed holders give the key up"""
+        job = self.db.get_job_by_idempotency_key(key)
+        if not job:
+            return None
+        expired = job.created_at < datetime.utcnow() - timedelta(seconds=Config.IDEMPOTENCY_TTL_SECONDS)
+        if expired or job.status == 'failed':
+            self.db.update_job(job.id, idempotency_key=None)
+            return None
+        return job.id
+    
+    def _schedule(self, job_id: str, kind: str, payload: Dict[str, Any], tenant_id: str):
+        with self._lock:
+            self._events[job_id] = threading.Event()
+        self.scheduler.submit(tenant_id, self._execute, job_id, kind, payload, tenant_id)
+    
+    def _execute(self, job_id: str, kind: str, payload: Dict[str, Any], tenant_id: str):
+        try:
+            if not self.quotas.has_tokens(tenant_id):
+                self.db.update_job(job_id, status='failed',
+                                   error="Kuota AI sekolah Anda untuk satu jam ini sudah habis. Silakan coba lagi nanti.")
+                return
+            if not self.db.claim_job(job_id, ('pending',), status='running'):
+                return  # already taken by another process recovering the same job
+            progress = _progress.set(
+                lambda partial: self.db.update_job(job_id, result=json.dumps(partial, ensure_ascii=False))
+            )
+            with tenant_scope(tenant_id) as scope:
+                try:
+                    result = self.handlers[kind](payload)
+                finally:
+                    self.quotas.record(tenant_id, scope.tokens)
+                    _progress.reset(progress)
+            self.db.update_job(job_id, status='done', result=json.dumps(result, ensure_ascii=False))
+        except Exception as e:
+            self.db.update_job(job_id, status='failed', error=str(e))
+        finally:
+            with self._lock:
+                event = self._events.pop(job_id, None)
+            if event:
+                event.set()
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current status of a job: {'status', 'result', 'error'}; running jobs may carry a partial result"""
+        job = self.db.get_job(job_id)
+        if not job:
+            return None
+        return {
+            'status': job.status,
+            'result': json.loads(job.result) if job.result is not None else None,
+            'error': job.error
+        }
+    
+    def wait(self, job_id: str, timeout: float = Config.JOB_POLL_SECONDS) -> Optional[Dict[str, Any]]:
+        """Block up to `timeout` seconds for a job to finish, then return its status"""
+        with self._lock:
+            event = self._events.get(job_id)
+        if event:
+            event.wait(timeout)
+            return self.get(job_id)
+        
+        # Job owned by another process (or already finished): poll the table, less often as it runs
+        deadline = time.monotonic() + timeout
+        interval = 0.2
+        while True:
+            job = self.get(job_id)
+            if not job or job['status'] in ('done', 'failed') or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+            interval = min(interval * 2, 1.0)
+    
+    def recover(self):
+        """Requeue jobs abandoned by a previous process and purge old results.
+        
+        Each stale job is claimed with a conditional update, so when several
+        processes start at once against the same database only one of them
+        requeues it.
+        """
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=Config.JOB_STALE_SECONDS)
+        for job in self.db.get_stale_jobs(stale_before):
+            if job.kind not in self.handlers:
+                self.db.update_job(job.id, status='failed', error="Unknown job kind")
+            elif self.db.claim_job(job.id, ('pending', 'running'), stale_before, status='pending'):
+                self._schedule(job.id, job.kind, json.loads(job.payload), job.tenant_id or Config.DEFAULT_TENANT)
+        self.db.delete_finished_jobs(now - timedelta(hours=Config.JOB_RETENTION_HOURS))
+    
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager(db: DatabaseManager = None) -> JobManager:
+    """Process-wide JobManager shared by every Streamlit session"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            from ai_service import AIService
+            from ai_tasks import build_handlers
+            from cache_manager import CacheManager
+            db = db or DatabaseManager()
+            ai = AIService(cache=CacheManager(db))
+            _manager = JobManager(db, build_handlers(ai, db))
+            _manager.recover()
+    return _manager
+
+def shutdown_job_manager():
+    """Let running jobs finish and drop the process-wide manager"""
+    global _manager
+    with _manager_lock:
+        manager, _manager = _manager, None
+    if manager is not None:
+        manager.shutdown()
@@ -0,0 +1,35 @@
+import importlib
+import threading
+from types import ModuleType
+
+class LazyModule:
+    """Module proxy that imports the real module on first attribute access.
+    
+    Streamlit re-executes app.py on every rerun and each worker pays the
+    full import cost on start, so SDKs that are only needed on a few code
+    paths (password hashing, Google sign-in, provider clients) are bound
+    through this proxy instead of a top-level import.
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+    
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+    
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+    
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_module(name: str) -> LazyModule:
+    """Bind `name` without importing it until it is used"""
+    return LazyModule(name)
@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from config import Config
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token) when the provider reports no usage"""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+class CallRecord:
+    """Measurements collected for a single AI call"""
+    
+    def __init__(self, operation: str, provider: str, subject: Optional[str] = None):
+        self.operation = operation
+        self.provider = provider
+        self.subject = subject or "-"
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.finished = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_hit = False
+        self.coalesced = False  # served by another caller's in-flight request
+        self.degraded = False  # provider unavailable, answered from the cache or a canned reply
+        self.prescreened = False  # answered by the local pre-screen (prescreen.py), no provider call
+        self.error = None
+    
+    def mark_first_token(self):
+        """Mark the moment the first token (or the whole non-streamed reply) arrived"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+    
+    @property
+    def wall_time(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+    
+    @property
+    def time_to_first_token(self) -> float:
+        return (self.first_token_at or self.finished or time.perf_counter()) - self.started
+
+class MetricsRegistry:
+    """Thread-safe aggregation of AI call metrics with Prometheus text export"""
+    
+    QUANTILES = (0.5, 0.95, 0.99)
+    
+    def __init__(self, window: int = Config.METRICS_WINDOW, export_path: Optional[str] = Config.METRICS_FILE):
+        self.window = window
+        self.export_path = export_path
+        self._lock = threading.Lock()
+        self._wall = defaultdict(lambda: deque(maxlen=self.window))
+        self._ttft = defaultdict(lambda: deque(maxlen=self.window))
+        self._counters = defaultdict(float)
+        self._gauges: Dict[str, Tuple[str, list]] = {}  # name -> (help, [(labels, value)])
+        self._last_export = 0.0
+    
+    def observe(self, record: CallRecord):
+        """Add a finished call to the aggregates"""
+        series = (record.operation, record.provider, record.subject)
+        cache = ("prescreened" if record.prescreened else "degraded" if record.degraded
+                 else "hit" if record.cache_hit else "coalesced" if record.coalesced else "miss")
+        with self._lock:
+            self._wall[series].append(record.wall_time)
+            self._ttft[series].append(record.time_to_first_token)
+            self._counters[("ai_calls_total", series + (cache,))] += 1
+            self._counters[("ai_input_tokens_total", series)] += record.input_tokens
+            self._counters[("ai_output_tokens_total", series)] += record.output_tokens
+            if record.error:
+                self._counters[("ai_errors_total", series)] += 1
+        self._maybe_export()
+    
+    def set_gauges(self, name: str, help_text: str, samples):
+        """Replace every sample of a gauge; samples are (labels dict, value) pairs"""
+        with self._lock:
+            self._gauges[name] = (help_text, list(samples))
+        self._maybe_export()
+    
+    @staticmethod
+    def _quantile(samples, q: float) -> float:
+        ordered = sorted(samples)
+        if not ordered:
+            return 0.0
+        idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[idx]
+    
+    def samples(self, operation: str, provider: Optional[str] = None, subject: Optional[str] = None) -> List[float]:
+        """Wall times (seconds) of the matching series still in the window"""
+        with self._lock:
+            return [
+                value
+                for (op, prov, subj), values in self._wall.items()
+                if op == operation and provider in (None, prov) and subject in (None, subj)
+                for value in values
+            ]
+    
+    def percentiles(self, operation: str, provider: Optional[str] = None,
+                    subject: Optional[str] = None) -> Dict[str, float]:
+        """Return p50/p95/p99 wall time (seconds) for matching series"""
+        samples = self.samples(operation, provider, subject)
+        return {f"p{int(q * 100)}": self._quantile(samples, q) for q in self.QUANTILES}
+    
+    @staticmethod
+    def _label_set(labels: Dict[str, object]) -> str:
+        """Prometheus label set with escaped values ("" when there are no labels)"""
+        if not labels:
+            return ""
+        return "{" + ",".join(
+            '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for key, value in labels.items()
+        ) + "}"
+    
+    @classmethod
+    def _labels(cls, series: Tuple[str, ...], cache: Optional[str] = None, quantile: Optional[float] = None) -> str:
+        operation, provider, subject = series[:3]
+        labels = {'operation': operation, 'provider': provider, 'subject': subject}
+        if cache is not None:
+            labels['cache'] = cache
+        if quantile is not None:
+            labels['quantile'] = quantile
+        return cls._label_set(labels)
+    
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, store, help_text in (
+                ("ai_call_duration_seconds", self._wall, "Wall time of AI calls"),
+                ("ai_time_to_first_token_seconds", self._ttft, "Time until the first token arrived"),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} summary")
+                for series, values in sorted(store.items()):
+                    for q in self.QUANTILES:
+                        lines.append(f"{name}{self._labels(series, quantile=q)} {self._quantile(values, q):.6f}")
+                    lines.append(f"{name}_sum{self._labels(series)} {sum(values):.6f}")
+                    lines.append(f"{name}_count{self._labels(series)} {len(values)}")
+            
+            seen = set()
+            for (name, series), value in sorted(self._counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} counter")
+                    seen.add(name)
+                cache = series[3] if len(series) > 3 else None
+                lines.append(f"{name}{self._labels(series, cache=cache)} {value:g}")
+            
+            for name, (help_text, samples) in sorted(self._gauges.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples:
+                    lines.append(f"{name}{self._label_set(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+    
+    def export(self, path: Optional[str] = None):
+        """Atomically write the Prometheus text file"""
+        path = path or self.export_path
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+    
+    def _maybe_export(self):
+        now = time.monotonic()
+        if now - self._last_export < Config.METRICS_EXPORT_SECONDS:
+            return
+        self._last_export = now
+        try:
+            self.export()
+        except OSError:
+            # Metrics must never break the request path
+            pass
+    
+    def reset(self):
+        with self._lock:
+            self._wall.clear()
+            self._ttft.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+# Process-wide registry shared by every Streamlit session
+registry = MetricsRegistry()
+
+@contextmanager
+def track_ai_call(operation: str, provider: str, subject: Optional[str] = None):
+    """Time an AI call and record it in the registry.
+    
+    Usage:
+        with track_ai_call("get_response", "gemini", subject) as record:
+            ...
+            record.mark_first_token()
+            record.output_tokens = ...
+    """
+    record = CallRecord(operation, provider, subject)
+    try:
+        yield record
+    except Exception as e:
+        record.error = e
+        raise
+    finally:
+        record.finished = time.perf_counter()
+        registry.observe(record)
@@ -0,0 +1,239 @@
+"""Local pre-screening of reflections and exam essays before LLM grading.
+
+Cheap checks catch submissions that do not need a model to judge them:
+
+- too short, gibberish, the same words repeated, or not in the expected
+  language: rejected with instant feedback (reflections) or scored 0
+  (essays, which a student may legitimately be unable to answer)
+- mostly copied from the generated story (reflections) or from the
+  question (essays): word 5-/3-gram containment
+- near duplicates of another student's submission: MinHash signatures of
+  word 3-grams, stored with every graded reflection and exam. Only answers
+  of Config.PRESCREEN_DUPLICATE_MIN_WORDS words or more count; short
+  correct answers are naturally alike.
+
+Copies and duplicates get Config.PRESCREEN_LOW_SCORE without an LLM call.
+Only text that passes every check is sent to grade_reflection/grade_exam.
+"""
+import hashlib
+import random
+import re
+from typing import Any, Dict, List, Optional, Sequence
+from config import Config
+from metrics import track_ai_call
+from tenants import current_tenant
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)  # fixed: stored signatures must stay comparable across restarts
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(Config.PRESCREEN_MINHASH_PERMUTATIONS)
+]
+
+# Common chat-style abbreviations; most have no vowels but are ordinary words to a reader
+ABBREVIATIONS = frozenset("""
+    yg dgn krn krna sy sya tdk gk ga gak ttg dr dri utk bwt tp tpi jg sdh udh blm dlm pd bhw sbg spt
+    kl klo kalo lg bs bsa hrs sj aja dll dsb dst kmrn skrg bnyk org jd jdi
+""".split())
+
+STOPWORDS = {
+    'id': frozenset("""
+        yang dan di ke dari ini itu dengan untuk tidak ada adalah dalam akan pada juga saya kita kami
+        mereka dia ia bisa karena jika kalau sudah belum lebih agar supaya atau tetapi tapi harus saat
+        ketika seperti oleh sangat bahwa aku kamu apa bagaimana mengapa banyak hal orang menjadi jadi
+        telah lagi hanya setelah sebelum tentang cerita belajar
+    """.split()) | ABBREVIATIONS,
+    'en': frozenset("""
+        the and to of a in is it that for was on with as be this are by at from have not they you we
+        i my his her their but or an will can would should about what how why when if so because do
+        did learned story
+    """.split())
+}
+
+def words(text: str) -> List[str]:
+    return re.findall(r"[^\W\d_]+|\d+", (text or "").lower())
+
+def shingles(tokens: Sequence[str], size: int) -> set:
+    if len(tokens) < size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+def minhash(text: str, size: int = 3) -> str:
+    """MinHash signature of the text's word n-grams, as hex (empty for empty text)"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for shingle in shingles(words(text), size)
+    ]
+    if not hashes:
+        return ""
+    return "".join(
+        f"{min((a * h + b) % _MERSENNE_PRIME for h in hashes) & 0xffffffff:08x}" for a, b in _PERMUTATIONS
+    )
+
+def signature_similarity(a: str, b: str) -> float:
+    """Estimated Jaccard similarity of two minhash() signatures"""
+    if not a or not b or len(a) != len(b):
+        return 0.0
+    slots = len(a) // 8
+    return sum(a[i * 8:(i + 1) * 8] == b[i * 8:(i + 1) * 8] for i in range(slots)) / slots
+
+def containment(text: str, source: str, size: int) -> float:
+    """Share of the text's word n-grams that appear verbatim in source"""
+    text_shingles = shingles(words(text), size)
+    if not text_shingles:
+        return 0.0
+    return len(text_shingles & shingles(words(source), size)) / len(text_shingles)
+
+def detect_language(tokens: Sequence[str]) -> Optional[str]:
+    """'id' or 'en' by stopword share; None when neither is recognisable"""
+    if not tokens:
+        return None
+    hits = {language: sum(token in stopwords for token in tokens) for language, stopwords in STOPWORDS.items()}
+    language = max(hits, key=hits.get)
+    return language if hits[language] / len(tokens) >= Config.PRESCREEN_MIN_STOPWORD_RATIO else None
+
+def _plausible_word(token: str) -> bool:
+    if token.isdigit() or token in ABBREVIATIONS:
+        return True
+    if len(token) <= 4 and re.search(r"[aiueo]", token) is None:
+        return True  # likely a shortened word ("pntg"); only long consonant runs look like mashing
+    return (re.search(r"[aiueo]", token) is not None and re.search(r"[^aiueo]{5,}", token) is None
+            and re.search(r"(.)\1\1", token) is None and len(token) <= 25)
+
+def check_text(text: str, min_words: int, languages: Optional[Sequence[str]] = ("id",)) -> Optional[Dict[str, Any]]:
+    """Problems that need no model to spot: {'reason', 'message'} or None.
+    
+    languages=None skips the language check (essays, regional languages).
+    """
+    tokens = words(text)
+    if len(tokens) < min_words:
+        return {'reason': 'too_short',
+                'message': f"Jawaban terlalu singkat ({len(tokens)} kata). Tulis minimal {min_words} kata."}
+    if sum(_plausible_word(token) for token in tokens) / len(tokens) < 0.6:
+        return {'reason': 'gibberish',
+                'message': "Jawaban tidak dapat dibaca sebagai kalimat. Tulis dengan kalimat yang jelas."}
+    if len(tokens) >= 10 and len(set(tokens)) / len(tokens) < 0.3:
+        return {'reason': 'repetitive',
+                'message': "Jawaban berisi kata yang diulang-ulang. Tulis pemikiran Anda dengan kalimat yang beragam."}
+    if languages:
+        language = detect_language(tokens)
+        if language is None:
+            return {'reason': 'gibberish',
+                    'message': "Jawaban tidak dapat dikenali sebagai kalimat. Tulis dengan kalimat yang jelas."}
+        if language not in languages:
+            names = {'id': "Bahasa Indonesia", 'en': "Bahasa Inggris"}
+            return {'reason': 'language',
+                    'message': "Tulis jawaban dalam " + " atau ".join(names[code] for code in languages) + "."}
+    return None
+
+def reflection_languages(subject: str) -> Optional[Sequence[str]]:
+    """Languages a reflection may be written in (None = any)"""
+    if subject == "B.DAERAH":
+        return None
+    if subject == "B.INGGRIS":
+        return ("id", "en")
+    return ("id",)
+
+def _record(operation: str, subject: str):
+    """Count a submission answered without the model (ai_calls_total{cache="prescreened"})"""
+    with track_ai_call(operation, "prescreen", subject) as record:
+        record.prescreened = True
+
+class PrescreenManager:
+    def __init__(self, db):
+        self.db = db
+    
+    @staticmethod
+    def _duplicate_of_peer(signature: str, user_id: str, recent) -> bool:
+        """Whether (user_id, signature) pairs hold a near copy by another student.
+        
+        A match with the student's own earlier work is a resubmission, even
+        if a classmate has copied it since.
+        """
+        matches = {
+            author for author, other in recent
+            if signature_similarity(signature, other) >= Config.PRESCREEN_DUPLICATE_SIMILARITY
+        }
+        return bool(matches) and user_id not in matches
+    
+    def screen_reflection(self, text: str, story: Optional[str], subject: str, user_id: str,
+                          signature: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Verdict for a reflection, or None when it should be graded by the model.
+        
+        A verdict is either {'rejected': True, ...} (nothing is graded or
+        saved, the student revises) or a grade result with a low score.
+        """
+        problem = check_text(text, Config.PRESCREEN_REFLECTION_MIN_WORDS, reflection_languages(subject))
+        if problem:
+            _record("grade_reflection", subject)
+            return {'rejected': True, 'prescreen': problem['reason'], 'feedback': problem['message']}
+        
+        if story and containment(text, story, 5) >= Config.PRESCREEN_COPY_RATIO:
+            verdict = ('copied_story', "Sebagian besar refleksi disalin dari cerita.",
+                       "Refleksi harus berisi pemikiran Anda sendiri, bukan salinan cerita.")
+        else:
+            if len(words(text)) < Config.PRESCREEN_DUPLICATE_MIN_WORDS:
+                return None
+            signature = signature if signature is not None else minhash(text)
+            recent = self.db.get_recent_reflection_signatures(subject, current_tenant(), Config.PRESCREEN_DUPLICATE_SCAN)
+            if not self._duplicate_of_peer(signature, user_id, recent):
+                return None
+            verdict = ('duplicate', "Refleksi sangat mirip dengan refleksi siswa lain.",
+                       "Tulis refleksi dengan kata-kata Anda sendiri.")
+        
+        _record("grade_reflection", subject)
+        reason, correction, feedback = verdict
+        return {'score': Config.PRESCREEN_LOW_SCORE, 'correction': correction, 'feedback': feedback, 'prescreen': reason}
+    
+    def screen_essays(self, questions: Dict[str, Any], answers: Dict[str, str], user_id: str,
+                      signatures: Sequence[str]) -> List[Optional[str]]:
+        """Reason each essay answer needs no model (None = substantive)"""
+        essays = questions.get('essay_questions', [])
+        recent = None
+        reasons = []
+        for i, essay in enumerate(essays):
+            answer = answers.get(f"essay_{i}", "")
+            problem = check_text(answer, Config.PRESCREEN_ESSAY_MIN_WORDS, None)
+            if problem:
+                reasons.append(problem['reason'])
+                continue
+            if containment(answer, essay.get('question', ""), 3) >= Config.PRESCREEN_COPY_RATIO:
+                reasons.append('copied_question')
+                continue
+            if len(words(answer)) < Config.PRESCREEN_DUPLICATE_MIN_WORDS:
+                reasons.append(None)
+                continue
+            if recent is None:
+                recent = self.db.get_recent_essay_signatures(questions, current_tenant(), Config.PRESCREEN_DUPLICATE_SCAN)
+            peers = [(author, peer_signatures[i]) for author, peer_signatures in recent if i < len(peer_signatures)]
+            if self._duplicate_of_peer(signatures[i], user_id, peers):
+                reasons.append('duplicate')
+                continue
+            reasons.append(None)
+        return reasons
+    
+    def grade_exam_locally(self, questions: Dict[str, Any], answers: Dict[str, str], subject: str,
+                           essay_reasons: Sequence[Optional[str]]) -> Optional[Dict[str, Any]]:
+        """Grade result when no essay needs the model and every multiple choice has its key"""
+        multiple_choice = questions.get('multiple_choice', [])
+        keys = [str(mc.get('answer') or mc.get('correct_answer') or "").strip()[:1].upper() for mc in multiple_choice]
+        if any(reason is None for reason in essay_reasons) or not all(keys):
+            return None
+        
+        mc_score = sum(2 for i, key in enumerate(keys) if (answers.get(f"mc_{i}") or "")[:1].upper() == key)
+        max_score = len(multiple_choice) * 2 + len(essay_reasons) * 10
+        labels = {
+            'too_short': "terlalu singkat", 'gibberish': "tidak dapat dibaca", 'repetitive': "kata diulang-ulang",
+            'copied_question': "menyalin soal", 'duplicate': "sama dengan jawaban siswa lain"
+        }
+        _record("grade_exam", subject)
+        return {
+            'total_score': round(mc_score * 100 / max_score, 1) if max_score else 0,
+            'multiple_choice_score': mc_score,
+            'essay_score': 0,
+            'essay_scores': [0] * len(essay_reasons),
+            'feedback': "Jawaban esai belum dapat dinilai: " + "; ".join(
+                f"esai {i + 1} {labels[reason]}" for i, reason in enumerate(essay_reasons)
+            ) + ". Jawab setiap esai dengan penjelasan Anda sendiri.",
+            'prescreen': list(essay_reasons)
+        }
@@ -0,0 +1,192 @@
+import string
+import textwrap
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from metrics import estimate_tokens
+
+class PromptBudgetError(ValueError):
+    """Raised when a prompt cannot be brought under its template's token budget"""
+
+class RenderedPrompt(NamedTuple):
+    name: str
+    system: str
+    user: str
+    tokens: int
+    clipped: bool
+    
+    @property
+    def text(self) -> str:
+        """Single-string prompt with the static prefix first (provider prefix caching)"""
+        return f"{self.system}\n\n{self.user}" if self.system else self.user
+
+class PromptTemplate:
+    """A prompt split into a static system prefix and a dynamic user part.
+    
+    Both parts are dedented and parsed once when the template is
+    registered. The system prefix takes no fields, so it is byte-identical
+    across requests and providers can reuse their cached prefix; only the
+    user part is formatted per call. Rendering counts tokens locally and, if
+    the prompt is over `max_tokens`, shortens the `clip` field before giving
+    up with PromptBudgetError.
+    """
+    
+    def __init__(self, name: str, system: str, user: str, max_tokens: int, clip: Optional[str] = None):
+        self.name = name
+        self.system = textwrap.dedent(system).strip()
+        self.max_tokens = max_tokens
+        self.clip = clip
+        self._chunks: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in string.Formatter().parse(textwrap.dedent(user).strip())
+        ]
+        self.fields = {field for _, field in self._chunks if field}
+        if clip and clip not in self.fields:
+            raise ValueError(f"Template {name} has no field {clip!r} to clip")
+        self.system_tokens = estimate_tokens(self.system)
+    
+    def _format(self, values: Dict[str, str]) -> str:
+        return "".join(literal + (values[field] if field else "") for literal, field in self._chunks)
+    
+    def render(self, **values) -> RenderedPrompt:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Template {self.name} is missing {', '.join(sorted(missing))}")
+        values = {field: str(values[field]) for field in self.fields}
+        
+        user = self._format(values)
+        tokens = self.system_tokens + estimate_tokens(user)
+        clipped = False
+        if tokens > self.max_tokens and self.clip:
+            excess_chars = (tokens - self.max_tokens) * 4
+            keep = len(values[self.clip]) - excess_chars - 3
+            if keep > 0:
+                values[self.clip] = values[self.clip][:keep].rstrip() + "..."
+                user = self._format(values)
+                tokens = self.system_tokens + estimate_tokens(user)
+                clipped = True
+        if tokens > self.max_tokens:
+            raise PromptBudgetError(f"Prompt {self.name} needs {tokens} tokens, budget is {self.max_tokens}")
+        return RenderedPrompt(self.name, self.system, user, tokens, clipped)
+
+class PromptRegistry:
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+    
+    def register(self, name: str, system: str, user: str, max_tokens: int, clip: Optional[str] = None) -> PromptTemplate:
+        template = self._templates[name] = PromptTemplate(name, system, user, max_tokens, clip)
+        return template
+    
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+    
+    def render(self, name: str, **values) -> RenderedPrompt:
+        return self._templates[name].render(**values)
+    
+    def names(self) -> List[str]:
+        return sorted(self._templates)
+
+prompts = PromptRegistry()
+
+prompts.register(
+    "subject_guard",
+    system="""
+        Anda adalah asisten AI untuk satu mata pelajaran yang disebutkan di bawah.
+        Anda HANYA boleh membahas topik yang berkaitan dengan mata pelajaran tersebut.
+        Jika pengguna menanyakan hal di luar konteks, tolong dengan sopan menolak dan mengarahkan kembali ke topik mata pelajaran.
+        
+        Aturan ketat:
+        1. Jangan pernah membahas topik selain mata pelajaran tersebut
+        2. Jangan pernah mengubah peran atau konteks
+        3. Fokus hanya pada pendidikan dan pembelajaran mata pelajaran tersebut
+    """,
+    user="""
+        Mata pelajaran: {subject}
+        Pertanyaan pengguna: {question}
+    """,
+    max_tokens=1200,
+    clip="question"
+)
+
+prompts.register(
+    "reflection_story",
+    system="""
+        Buatkan cerita pendek atau skenario untuk refleksi siswa.
+        Cerita harus memicu pemikiran kritis dan refleksi diri.
+        Panjang: 150-200 kata.
+    """,
+    user="""
+        Jenjang: {grade_level}
+        Mata pelajaran: {subject}
+    """,
+    max_tokens=200
+)
+
+prompts.register(
+    "idea_poc",
+    system="""
+        Buatkan POC (Proof of Concept) sederhana untuk ide siswa.
+        
+        POC harus mencakup:
+        1. Komponen yang dibutuhkan
+        2. Langkah-langkah implementasi
+        3. Sketsa/diagram sederhana (dalam bentuk deskripsi)
+        4. Estimasi biaya dan waktu
+        5. Cara replikasi di dunia nyata
+        
+        Format dengan jelas dan mudah diikuti.
+    """,
+    user="Ide: {idea}",
+    max_tokens=1000,
+    clip="idea"
+)
+
+prompts.register(
+    "knowledge_feedback",
+    system="""
+        Berikan catatan konstruktif untuk siswa berdasarkan ringkasan nilai berikut,
+        lalu berikan saran untuk meningkatkan pembelajaran.
+    """,
+    user="""
+        - Rata-rata nilai: {avg_score}/100
+        - Level pengetahuan: {level}
+        - Jenjang: {grade_level}
+        - Jumlah refleksi: {reflection_count}
+        - Jumlah ujian: {exam_count}
+    """,
+    max_tokens=250
+)
+
+prompts.register(
+    "chat_summary",
+    system="""
+        Perbarui ringkasan percakapan belajar berikut secara singkat (maksimal 150 kata).
+        Pertahankan topik yang sudah dibahas, kesulitan siswa, dan penjelasan penting.
+    """,
+    user="""
+        Ringkasan sebelumnya:
+        {summary}
+        
+        Percakapan baru:
+        {turns}
+    """,
+    max_tokens=3000,
+    clip="turns"
+)
+
+prompts.register(
+    "chat_reply",
+    system="""
+        Lanjutkan percakapan belajar berikut sebagai guru.
+        Jawab pesan baru siswa dengan memperhatikan ringkasan dan percakapan terakhir.
+    """,
+    user="""
+        Ringkasan percakapan sebelumnya:
+        {summary}
+        
+        Percakapan terakhir:
+        {turns}
+        
+        Pesan baru siswa:
+        {message}
+    """,
+    max_tokens=4000,
+    clip="turns"
+)
@@ -0,0 +1,45 @@
+import atexit
+import threading
+import streamlit as st
+from analytics import AnalyticsManager
+from auth import AuthManager
+from cache_manager import CacheManager
+from database import DatabaseManager
+from job_queue import JobManager, get_job_manager, shutdown_job_manager
+from security import SecurityManager
+from session_budget import SessionBudgetManager
+
+class Resources:
+    """Managers shared by every session and rerun of the Streamlit process.
+    
+    They hold no per-user state (that lives in st.session_state), so one
+    instance per process is enough; building them per rerun used to open a
+    new engine and connection pool on every widget interaction.
+    """
+    
+    def __init__(self):
+        self.db = DatabaseManager()
+        self.auth = AuthManager()
+        self.security = SecurityManager()
+        self.cache = CacheManager(self.db)
+        self.analytics = AnalyticsManager(self.db)
+        self.sessions = SessionBudgetManager()
+        self.jobs: JobManager = get_job_manager(self.db)
+        self._closed = False
+        self._lock = threading.Lock()
+    
+    def close(self):
+        """Finish running jobs, commit buffered writes and release connection pools"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        shutdown_job_manager()
+        self.db.close()
+
+@st.cache_resource(show_spinner=False)
+def get_resources() -> Resources:
+    """Build the shared managers once per process"""
+    resources = Resources()
+    atexit.register(resources.close)
+    return resources
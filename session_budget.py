@@ -0,0 +1,198 @@
+"""Memory budget for st.session_state.
+
+Every Streamlit session keeps its own state for as long as the process
+lives, so memory grows with concurrent users times how long they stay.
+SessionBudgetManager (one per process) bounds that:
+
+- chat_history keeps the last Config.SESSION_CHAT_MAX_MESSAGES messages.
+  Older turns are already stored in chat_sessions by the chat job, so they
+  are only dropped from memory (`chat_history_spilled` counts them) and
+  the chat page reloads them from the database on request.
+- Sessions the runtime reports disconnected and that have been idle for
+  Config.SESSION_IDLE_SECONDS lose their large objects (chat history,
+  generated exam and its answers) and are forgotten. Connected sessions
+  are never touched, and an exam that has not been submitted is kept
+  even then, so a student who reconnects can still hand it in.
+- Rate-limit timestamps are removed once their cooldown has passed.
+- The state size of every session is estimated on each sweep and exported
+  as Prometheus gauges (see metrics.py).
+"""
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from config import Config
+from metrics import registry as metrics
+from security import SecurityManager
+
+# Large per-session objects and the value they are reset to when a session goes idle
+LARGE_KEYS = {'chat_history': list, 'exam_questions': lambda: None, 'exam_answers': dict}
+EXAM_WIDGET_PREFIXES = ('mc_', 'essay_')
+RATE_LIMIT_SUFFIX = '_last_time'
+
+def deep_size(obj: Any, limit: int = 100000) -> int:
+    """Approximate bytes held by obj and everything it references (visits at most `limit` objects)"""
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack and len(seen) < limit:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return size
+
+def chat_replies(history: List[Dict]) -> int:
+    """AI answers in a chat history (the greeting is not a stored turn)"""
+    return sum(1 for message in history if message['role'] == 'assistant' and not message.get('greeting'))
+
+def _get(state, key: str, default=None):
+    # The thread-safe state wrapper has no get()
+    return state[key] if key in state else default
+
+def exam_in_progress(state) -> bool:
+    """An exam has been generated but not yet handed in for grading"""
+    return bool(_get(state, 'exam_questions')) and 'exam_grade_job' not in state
+
+class _TrackedSession:
+    def __init__(self, state):
+        self.state = state  # the session's SafeSessionState, usable from any thread
+        self.last_active = time.monotonic()
+
+class SessionBudgetManager:
+    def __init__(self):
+        self._sessions: Dict[str, _TrackedSession] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._report: List[Dict] = []
+    
+    def touch(self):
+        """Mark the running session active and keep its chat history within budget.
+        
+        Called on every run and chat fragment run; sweeps all sessions at
+        most every Config.SESSION_SWEEP_SECONDS.
+        """
+        ctx = get_script_run_ctx()
+        if ctx is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tracked = self._sessions.get(ctx.session_id)
+            if tracked is None:
+                tracked = self._sessions[ctx.session_id] = _TrackedSession(ctx.session_state)
+            tracked.state = ctx.session_state
+            tracked.last_active = now
+            due = now - self._last_sweep >= Config.SESSION_SWEEP_SECONDS
+            if due:
+                self._last_sweep = now
+        self.trim_chat_history(ctx.session_state)
+        if due:
+            self.sweep(now)
+    
+    @staticmethod
+    def trim_chat_history(state, max_messages: int = Config.SESSION_CHAT_MAX_MESSAGES):
+        """Drop the oldest whole turns beyond max_messages (they stay in chat_sessions)"""
+        history = _get(state, 'chat_history')
+        if not history or len(history) <= max_messages:
+            return
+        drop = len(history) - max_messages
+        if history[drop]['role'] == 'assistant':
+            drop += 1  # never keep an answer without its question
+        spilled = chat_replies(history[:drop])
+        del history[:drop]
+        state['chat_history_spilled'] = _get(state, 'chat_history_spilled', 0) + spilled
+    
+    @staticmethod
+    def expire_large_objects(state):
+        """Free an idle session's chat history, and its exam unless one is still being answered"""
+        history = _get(state, 'chat_history')
+        if history:
+            state['chat_history_spilled'] = _get(state, 'chat_history_spilled', 0) + chat_replies(history)
+        keep_exam = exam_in_progress(state)
+        for key, empty in LARGE_KEYS.items():
+            if key in state and not (keep_exam and key.startswith('exam_')):
+                state[key] = empty()
+        if keep_exam:
+            return
+        for key in list(state.filtered_state):
+            if key.startswith(EXAM_WIDGET_PREFIXES):
+                del state[key]
+    
+    @staticmethod
+    def expire_rate_limits(state, now: Optional[datetime] = None):
+        """Remove rate-limit timestamps whose cooldown is over (same as never having acted)"""
+        now = now or datetime.now()
+        for key, value in list(state.filtered_state.items()):
+            if not key.endswith(RATE_LIMIT_SUFFIX) or not isinstance(value, datetime):
+                continue
+            # Keys are "<user id or email>_<action>_last_time"
+            action = key[:-len(RATE_LIMIT_SUFFIX)].rsplit('_', 1)[-1]
+            if (now - value).total_seconds() >= SecurityManager.rate_limit_cooldown(action):
+                del state[key]
+    
+    def sweep(self, now: Optional[float] = None) -> List[Dict]:
+        """Expire and forget idle disconnected sessions, measure the rest"""
+        now = now or time.monotonic()
+        wall_now = datetime.now()
+        runtime = Runtime.instance() if Runtime.exists() else None
+        with self._lock:
+            sessions = list(self._sessions.items())
+        
+        report = []
+        for session_id, tracked in sessions:
+            state = tracked.state
+            idle = now - tracked.last_active
+            self.expire_rate_limits(state, wall_now)
+            disconnected = runtime is not None and not runtime.is_active_session(session_id)
+            if disconnected and idle >= Config.SESSION_IDLE_SECONDS:
+                with self._lock:
+                    # A reconnect may have touched it since we looked
+                    forget = (self._sessions.get(session_id) is tracked
+                              and now - tracked.last_active >= Config.SESSION_IDLE_SECONDS)
+                    if forget:
+                        del self._sessions[session_id]
+                if forget:
+                    self.expire_large_objects(state)
+                continue
+            
+            sizes = {key: deep_size(value) for key, value in state.filtered_state.items()}
+            largest = max(sizes, key=sizes.get, default=None)
+            report.append({
+                'session_id': session_id,
+                'user_id': _get(state, 'user_id'),
+                'idle_seconds': round(idle),
+                'bytes': sum(sizes.values()),
+                'largest_key': largest,
+                'largest_bytes': sizes.get(largest, 0)
+            })
+        
+        report.sort(key=lambda entry: entry['bytes'], reverse=True)
+        with self._lock:
+            self._report = report
+        self._export(report)
+        return report
+    
+    def report(self) -> List[Dict]:
+        """Per-session state sizes measured by the last sweep, largest first"""
+        with self._lock:
+            return list(self._report)
+    
+    @staticmethod
+    def _export(report: List[Dict]):
+        metrics.set_gauges("app_sessions", "Streamlit sessions tracked by this process", [({}, len(report))])
+        metrics.set_gauges("app_session_state_bytes_total", "Estimated st.session_state bytes of all sessions",
+                           [({}, sum(entry['bytes'] for entry in report))])
+        metrics.set_gauges("app_session_state_bytes", "Estimated st.session_state bytes of the largest sessions", [
+            ({'session': entry['session_id'][:8], 'largest_key': entry['largest_key'] or ""},
+             entry['bytes'])
+            for entry in report[:Config.SESSION_REPORT_TOP]
+        ])
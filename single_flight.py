@@ -0,0 +1,57 @@
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key.
+    
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is in flight wait for the leader and receive the same
+    result (or exception), so N identical requests cost one provider call.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+    
+    def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """Run fn once per in-flight key.
+        
+        Returns (result, shared) where shared is True when this caller
+        received the result of another caller's in-flight request.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call:
+                call.followers += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+        
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result, True
+        
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+    
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
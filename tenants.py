@@ -0,0 +1,75 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from config import Config
+
+class TenantScope:
+    """Tenant the current job runs for, plus the provider tokens it used"""
+    
+    def __init__(self, tenant_id: str):
+        self.tenant_id = tenant_id
+        self.tokens = 0
+
+_current_scope: ContextVar[Optional[TenantScope]] = ContextVar("tenant_scope", default=None)
+
+@contextmanager
+def tenant_scope(tenant_id: Optional[str]):
+    """Run AI and database calls on behalf of a tenant (school)"""
+    scope = TenantScope(tenant_id or Config.DEFAULT_TENANT)
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+
+def current_tenant() -> str:
+    scope = _current_scope.get()
+    return scope.tenant_id if scope else Config.DEFAULT_TENANT
+
+def charge_tokens(tokens: int):
+    """Attribute provider tokens to the tenant of the running job"""
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.tokens += tokens
+
+class TenantQuotas:
+    """Per-tenant concurrency limits and the sliding one-hour token quota.
+    
+    Limits come from the tenants table (NULL = Config default) and are
+    cached for a minute so the scheduler does not query on every dispatch.
+    Token usage lives in the token_usage table, so every worker process and
+    warm_cache.py spend from the same per-school quota.
+    """
+    
+    LIMITS_TTL = 60
+    
+    def __init__(self, db):
+        self.db = db
+        self._limits: Dict[str, tuple] = {}  # tenant -> (loaded_at, max_concurrent, hourly_tokens)
+    
+    def _load_limits(self, tenant_id: str) -> tuple:
+        now = time.monotonic()
+        cached = self._limits.get(tenant_id)
+        if cached and now - cached[0] < self.LIMITS_TTL:
+            return cached
+        tenant = self.db.get_tenant(tenant_id)
+        max_concurrent = tenant.max_concurrent_jobs if tenant and tenant.max_concurrent_jobs else Config.TENANT_MAX_CONCURRENT_JOBS
+        hourly_tokens = tenant.hourly_token_quota if tenant and tenant.hourly_token_quota is not None else Config.TENANT_HOURLY_TOKEN_QUOTA
+        cached = self._limits[tenant_id] = (now, max_concurrent, hourly_tokens)
+        return cached
+    
+    def max_concurrent(self, tenant_id: str) -> int:
+        return self._load_limits(tenant_id)[1]
+    
+    def tokens_used(self, tenant_id: str) -> int:
+        return self.db.get_token_usage(tenant_id, datetime.utcnow() - timedelta(hours=1))
+    
+    def has_tokens(self, tenant_id: str) -> bool:
+        quota = self._load_limits(tenant_id)[2]
+        return not quota or self.tokens_used(tenant_id) < quota
+    
+    def record(self, tenant_id: str, tokens: int):
+        if tokens:
+            self.db.add_token_usage(tenant_id, tokens)
@@ -0,0 +1,50 @@
+"""Shared fixtures. Tests run offline: fake AI backend, throwaway databases, no metrics file."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Read by config.py at import time
+os.environ["METRICS_FILE"] = ""
+os.environ["AI_BACKEND"] = "fake"
+
+import pytest
+from config import Config
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """DatabaseManager on a fresh SQLite file, writing synchronously"""
+    monkeypatch.setattr(Config, "WRITE_BEHIND_ENABLED", False)
+    from database import DatabaseManager
+    manager = DatabaseManager(url=f"sqlite:///{tmp_path / 'test.db'}")
+    yield manager
+    manager.close()
+
+@pytest.fixture(scope="session")
+def postgres_url(tmp_path_factory):
+    """TEST_POSTGRES_URL, or a throwaway local server from pgserver; skips when neither is available"""
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if url:
+        yield url
+        return
+    pgserver = pytest.importorskip("pgserver")
+    pytest.importorskip("psycopg2")
+    server = pgserver.get_server(str(tmp_path_factory.mktemp("pg")), cleanup_mode="stop")
+    yield server.get_uri().replace("postgresql:", "postgresql+psycopg2:", 1)
+    server.cleanup()
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def db_url(request, tmp_path, monkeypatch):
+    """URL of an empty database on each supported backend"""
+    monkeypatch.setattr(Config, "WRITE_BEHIND_ENABLED", False)
+    if request.param == "sqlite":
+        yield f"sqlite:///{tmp_path / 'test.db'}"
+        return
+    url = request.getfixturevalue("postgres_url")
+    yield url
+    from sqlalchemy import create_engine
+    from database import Base
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    engine.dispose()
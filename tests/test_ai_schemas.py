@@ -0,0 +1,101 @@
+import json
+import pytest
+import ai_schemas
+from ai_schemas import (
+    ExamQuestionStream, parse_exam_grade, parse_exam_questions, parse_reflection_grade, repair_json
+)
+
+EXAM = {
+    "multiple_choice": [
+        {"question": "Ibu kota Indonesia?", "options": ["A. Jakarta", "B. Bandung"], "answer": "A"},
+        {"question": "2 + 2 = ?", "options": ["A. 3", "B. 4"], "answer": "B"}
+    ],
+    "essay_questions": ["Jelaskan fotosintesis.", "Apa itu gotong royong?"]
+}
+
+@pytest.mark.parametrize("raw, expected", [
+    ('```json\n{"score": 80}\n```', {"score": 80}),
+    ('Berikut hasilnya: {"score": 80} Semoga membantu!', {"score": 80}),
+    ('{"items": [1, 2,], "score": 80,}', {"items": [1, 2], "score": 80}),
+    ('{"score": 80, // nilai akhir\n "ok": True, "note": None}', {"score": 80, "ok": True, "note": None}),
+    ("{'feedback': 'Bagus, it\\'s fine'}", {"feedback": "Bagus, it's fine"}),
+    ('{score: 80}', {"score": 80}),
+    ('{"feedback": "baris satu\nbaris dua"}', {"feedback": "baris satu\nbaris dua"}),
+])
+def test_repair_json_fixes_common_mistakes(raw, expected):
+    assert json.loads(repair_json(raw)) == expected
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"score": 80, "feedback": "Bagus sek', {"score": 80, "feedback": "Bagus sek"}),
+    ('{"score": 80, "feedback"', {"score": 80}),
+    ('{"score": 80, "feedback":', {"score": 80}),
+    ('{"items": [{"a": 1}, {"a": 2', {"items": [{"a": 1}, {"a": 2}]}),
+])
+def test_repair_json_closes_truncated_output(raw, expected):
+    assert json.loads(repair_json(raw)) == expected
+
+def test_repair_json_without_an_object_fails():
+    with pytest.raises(ValueError):
+        repair_json("Maaf, saya tidak bisa membuat soal.")
+
+def test_exam_questions_are_normalized():
+    exam = parse_exam_questions({
+        "multiple_choice": [{"question": "Q", "options": ["Satu", "Dua"], "correct_answer": "b. Dua"}],
+        "essay_questions": ["Jelaskan."]
+    })
+    assert exam["multiple_choice"][0]["options"] == ["A. Satu", "B. Dua"]
+    assert exam["multiple_choice"][0]["answer"] == "B"
+    assert exam["essay_questions"] == [{"question": "Jelaskan."}]
+
+def test_grades_accept_textual_scores_and_reject_out_of_range():
+    assert parse_exam_grade('{"total_score": "85/100"}')["total_score"] == 85
+    assert parse_reflection_grade('{"score": "72,5"}')["score"] == 72.5
+    with pytest.raises(ValueError, match="ReflectionGrade"):
+        parse_reflection_grade('{"score": 150}')
+
+def test_exam_stream_reports_each_completed_question():
+    text = json.dumps(EXAM)
+    partials = []
+    stream = ExamQuestionStream(partials.append)
+    for i in range(0, len(text), 7):
+        stream.feed(text[i:i + 7])
+    
+    counts = [(len(p["multiple_choice"]), len(p["essay_questions"])) for p in partials]
+    assert counts == sorted(counts)
+    assert len(counts) == len(set(counts))
+    assert counts[0] == (1, 0)
+    assert (2, 1) in counts
+    assert stream.finish() == parse_exam_questions(EXAM)
+
+def test_exam_stream_without_callback_only_parses_at_the_end():
+    stream = ExamQuestionStream()
+    stream.feed('{"multiple_choice": [{"question": "Q", "options": ["A. x", "B. y"]}],')
+    stream.feed(' "essay_questions": ["E"]}')
+    assert stream.finish()["essay_questions"] == [{"question": "E"}]
+
+def test_exam_stream_reports_a_question_as_soon_as_it_closes():
+    partials = []
+    stream = ExamQuestionStream(partials.append)
+    stream.feed('Berikut soalnya:\n```json\n{"multiple_choice": [{"question": "Apa {ini}?", "options": ["A. x", "B. \\"y\\""]')
+    assert partials == []
+    stream.feed('}')
+    assert [q["question"] for q in partials[-1]["multiple_choice"]] == ["Apa {ini}?"]
+    stream.feed('], "essay_questions": [\'Jelaskan.\'')
+    assert partials[-1]["essay_questions"] == [{"question": "Jelaskan."}]
+
+def test_exam_stream_parses_each_question_once(monkeypatch):
+    exam = {"multiple_choice": EXAM["multiple_choice"] * 50, "essay_questions": EXAM["essay_questions"] * 50}
+    text = json.dumps(exam)
+    parsed = []
+    loads = json.loads
+    
+    def counted(raw, *args, **kwargs):
+        parsed.append(len(raw))
+        return loads(raw, *args, **kwargs)
+    monkeypatch.setattr(ai_schemas.json, "loads", counted)
+    partials = []
+    stream = ExamQuestionStream(partials.append)
+    for char in text:
+        stream.feed(char)
+    assert len(partials) == 200
+    assert len(parsed) == 200 and max(parsed) < 100
@@ -0,0 +1,113 @@
+"""Reruns must reuse the process-wide managers instead of rebuilding them,
+and must leave the shared subject catalog as it was.
+
+APP_RERUNS sets how many reruns to drive (default 2000).
+"""
+import os
+import threading
+import pytest
+from config import Config, subjects_for
+
+pytest.importorskip("streamlit.testing.v1")
+from streamlit.testing.v1 import AppTest
+import streamlit as st
+import database
+import job_queue
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+RERUNS = int(os.environ.get("APP_RERUNS", 2000))
+
+def test_reruns_share_one_engine_job_manager_and_executor(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "DATABASE_URL", f"sqlite:///{tmp_path / 'app.db'}")
+    created = {'db': 0, 'jobs': 0, 'executors': 0}
+    db_init, jobs_init = database.DatabaseManager.__init__, job_queue.JobManager.__init__
+    executor_init = job_queue.ThreadPoolExecutor.__init__
+    
+    def count(name, init, wanted=lambda kwargs: True):
+        def wrapper(self, *args, **kwargs):
+            if wanted(kwargs):
+                created[name] += 1
+            init(self, *args, **kwargs)
+        return wrapper
+    
+    monkeypatch.setattr(database.DatabaseManager, "__init__", count('db', db_init))
+    monkeypatch.setattr(job_queue.JobManager, "__init__", count('jobs', jobs_init))
+    monkeypatch.setattr(job_queue.ThreadPoolExecutor, "__init__", count(
+        'executors', executor_init, lambda kwargs: kwargs.get('thread_name_prefix') == "ai-job"
+    ))
+    st.cache_resource.clear()
+    
+    app = AppTest.from_file(APP, default_timeout=30)
+    app.run()
+    app.text_input[0].input("rerun@sekolah.id")
+    next(button for button in app.button if button.label == "Login dengan Google").click().run()
+    next(button for button in app.button if button.label == "SMP").click().run()
+    assert not app.exception
+    threads = threading.active_count()
+    
+    from resources import get_resources
+    resources = get_resources()
+    try:
+        for i in range(RERUNS):
+            if i % 100 == 0:
+                # Visit a page and come back so reruns are not all identical
+                app.button(key="menu_0").click().run()
+                next(button for button in app.button if button.label == "← Kembali ke Menu Utama").click().run()
+            app.run()
+            assert not app.exception
+        
+        assert created == {'db': 1, 'jobs': 1, 'executors': 1}
+        assert threading.active_count() <= threads + Config.JOB_WORKERS
+        for engine in (resources.db.engine, resources.db.read_engine):
+            assert engine.pool.checkedout() == 0
+            assert engine.pool.checkedin() <= engine.pool.size()
+    finally:
+        resources.close()
+        st.cache_resource.clear()
+
+def _click(app, label=None, key=None):
+    button = app.button(key=key) if key else next(button for button in app.button if button.label == label)
+    button.click().run()
+    assert not app.exception
+
+def _labels(app, prefix):
+    """Labels of the buttons keyed prefix + index, in index order (the tree lists them column by column)"""
+    buttons = {
+        int(button.key[len(prefix):]): button.label
+        for button in app.button if button.key and button.key.startswith(prefix) and button.key[len(prefix):].isdigit()
+    }
+    return [buttons[index] for index in sorted(buttons)]
+
+def test_subject_pickers_leave_the_catalog_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "DATABASE_URL", f"sqlite:///{tmp_path / 'app.db'}")
+    st.cache_resource.clear()
+    chat_catalog = {grade: tuple(subjects) for grade, subjects in Config.SUBJECTS.items()}
+    exam_catalog = {grade: subjects_for(grade, True) for grade in Config.SUBJECTS}
+    
+    app = AppTest.from_file(APP, default_timeout=30)
+    app.run()
+    try:
+        for grade in Config.SUBJECTS:
+            app.text_input[0].input(f"katalog-{grade.lower()}@sekolah.id")
+            _click(app, "Login dengan Google")
+            _click(app, grade)
+            for _ in range(10):
+                _click(app, key="menu_1")
+                assert _labels(app, "refl_") == list(exam_catalog[grade])
+                _click(app, "← Kembali ke Menu Utama")
+                _click(app, key="menu_3")
+                assert _labels(app, "exam_") == list(exam_catalog[grade])
+                _click(app, "← Kembali ke Menu Utama")
+                _click(app, key="menu_0")
+                chat_subjects = _labels(app, "subj_")
+                assert chat_subjects == list(chat_catalog[grade])
+                assert not set(chat_subjects) & set(Config.RELIGIONS)
+                _click(app, "← Kembali ke Menu Utama")
+                
+                assert {g: tuple(subjects) for g, subjects in Config.SUBJECTS.items()} == chat_catalog
+                assert {g: subjects_for(g, True) for g in Config.SUBJECTS} == exam_catalog
+            _click(app, "Logout")
+    finally:
+        from resources import get_resources
+        get_resources().close()
+        st.cache_resource.clear()
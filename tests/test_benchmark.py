@@ -0,0 +1,22 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+pytest.importorskip("streamlit.testing.v1")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_concurrent_load_completes_every_student():
+    # A separate interpreter: the benchmark repoints Config at its own database
+    proc = subprocess.run(
+        [sys.executable, "benchmark.py", "load", "--users", "4", "--concurrency", "2",
+         "--messages", "1", "--latency-ms", "20", "--json"],
+        cwd=ROOT, capture_output=True, text=True, timeout=600
+    )
+    report = json.loads(proc.stdout)
+    assert report["errors"] == []
+    assert report["completed"] == 4
+    assert len(report["step_latency_ms"]) == 10
+    assert proc.returncode == 0
@@ -0,0 +1,62 @@
+from cache_manager import CacheManager
+from chat_context import ChatContextManager
+from prompts import prompts
+
+class RecordingAI:
+    def __init__(self):
+        self.calls = []
+    
+    def generate_response(self, prompt, subject, grade_level, operation="generate_response"):
+        self.calls.append(operation)
+        return "ringkasan"
+    
+    def get_response(self, prompt, subject, grade_level, question=None):
+        raise AssertionError("summaries must not go through the cached get_response")
+
+def _chat(db, message, conversation_id):
+    db.save_chat({
+        'user_id': "u1",
+        'subject': "IPA",
+        'grade_level': "SMP",
+        'user_message': message,
+        'ai_response': f"jawaban {message}",
+        'conversation_id': conversation_id
+    })
+
+def test_context_only_covers_the_current_conversation(db):
+    context = ChatContextManager(RecordingAI(), db, recent_turns=2, summary_every=2)
+    _chat(db, "pertanyaan lama", "c1")
+    assert context.build_prompt("u1", "IPA", "halo", "c2") == "halo"
+    _chat(db, "pertanyaan baru", "c2")
+    prompt = context.build_prompt("u1", "IPA", "lanjut", "c2")
+    assert "pertanyaan baru" in prompt
+    assert "pertanyaan lama" not in prompt
+
+def test_summary_is_uncached_and_scoped(db):
+    ai = RecordingAI()
+    context = ChatContextManager(ai, db, recent_turns=1, summary_every=2)
+    for i in range(3):
+        _chat(db, f"soal {i}", "c1")
+    context.update_summary("u1", "IPA", "SMP", "c1")
+    assert ai.calls == ["chat_summary"]
+    assert db.get_chat_summary("u1", "IPA").conversation_id == "c1"
+    assert "ringkasan" in context.build_prompt("u1", "IPA", "lanjut", "c1")
+    assert "ringkasan" not in context.build_prompt("u1", "IPA", "lanjut", "c2")
+
+def test_chat_cache_is_keyed_on_the_normalized_question(db):
+    cache = CacheManager(db)
+    cache.save_chat_response("Apa itu  Fotosintesis?", "jawaban", "IPA", "SMP")
+    assert cache.get_chat_response("apa itu fotosintesis", "IPA", "SMP") == "jawaban"
+    assert cache.get_cached_response("apa itu fotosintesis", "IPA", "SMP") is None
+
+def test_context_prompt_uses_the_chat_reply_template(db):
+    context = ChatContextManager(RecordingAI(), db, recent_turns=2, summary_every=2)
+    _chat(db, "apa itu sel", "c1")
+    prompt = context.build_prompt("u1", "IPA", "lanjut", "c1")
+    assert prompt.startswith(prompts.get("chat_reply").system)
+    assert prompt.endswith("Pesan baru siswa:\nlanjut")
+    assert "Siswa: apa itu sel\nGuru: jawaban apa itu sel" in prompt
+    
+    # A message that cannot fit next to its context goes out alone
+    huge = "kata " * 5000
+    assert context.build_prompt("u1", "IPA", huge, "c1") == huge
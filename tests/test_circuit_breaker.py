@@ -0,0 +1,72 @@
+import pytest
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+def _fail():
+    raise RuntimeError("provider down")
+
+def _breaker(**overrides):
+    options = dict(window=4, min_calls=4, failure_rate=0.5, slow_call_seconds=10, open_seconds=30, half_open_calls=1)
+    options.update(overrides)
+    return CircuitBreaker("test", **options)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the breaker module"""
+    now = [1000.0]
+    monkeypatch.setattr("circuit_breaker.time.monotonic", lambda: now[0])
+    return now
+
+def _trip(breaker):
+    for _ in range(2):
+        breaker.call(lambda: "ok")
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(_fail)
+
+def test_opens_once_the_failure_rate_is_reached(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            breaker.call(_fail)
+    assert breaker.state == CircuitBreaker.CLOSED  # fewer than min_calls recorded
+    breaker.call(lambda: "ok")
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = _breaker(min_calls=2)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(False, elapsed=11)
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_half_open_success_closes(clock):
+    breaker = _breaker()
+    _trip(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    clock[0] += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_half_open_failure_reopens(clock):
+    breaker = _breaker()
+    _trip(breaker)
+    clock[0] += 30
+    with pytest.raises(RuntimeError):
+        breaker.call(_fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.call(lambda: "ok")
+    assert error.value.retry_in == 30
+
+def test_half_open_admits_only_the_trial_calls(clock):
+    breaker = _breaker()
+    _trip(breaker)
+    clock[0] += 30
+    breaker.before_call()  # trial call still running
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
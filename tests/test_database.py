@@ -0,0 +1,262 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+import compression
+from compression import MIN_COMPRESS_BYTES, compress_text, content_hash, decompress_text
+from config import Config
+from database import Blob, ChatSession, DatabaseManager, Exam, ExamTemplate, create_db_engine
+
+@pytest.fixture
+def manager(db_url):
+    """DatabaseManager with a separate read engine on both backends"""
+    db = DatabaseManager(url=db_url, read_url=None if db_url.startswith("sqlite") else db_url)
+    yield db
+    db.close()
+
+def _pragma(engine, name):
+    with engine.connect() as conn:
+        return conn.execute(text(f"PRAGMA {name}")).scalar()
+
+def test_sqlite_writer_pragmas(db):
+    assert _pragma(db.engine, "journal_mode") == "wal"
+    assert _pragma(db.engine, "synchronous") == 1  # NORMAL
+    assert _pragma(db.engine, "busy_timeout") == Config.SQLITE_BUSY_TIMEOUT_MS
+    assert _pragma(db.engine, "mmap_size") == Config.SQLITE_MMAP_SIZE
+
+def test_sqlite_read_engine_is_read_only(db):
+    assert db.read_engine is not db.engine
+    assert _pragma(db.read_engine, "query_only") == 1
+    assert _pragma(db.read_engine, "busy_timeout") == Config.SQLITE_BUSY_TIMEOUT_MS
+    with pytest.raises(OperationalError):
+        with db.read_engine.begin() as conn:
+            conn.execute(text("DELETE FROM users"))
+
+def test_in_memory_sqlite_reads_from_the_writer():
+    db = DatabaseManager(url="sqlite://")
+    try:
+        assert db.read_engine is db.engine
+    finally:
+        db.close()
+
+def test_reads_stick_to_the_primary_after_a_write(manager, monkeypatch):
+    def bind(session):
+        try:
+            return session.get_bind()
+        finally:
+            session.close()
+    
+    assert manager.read_engine is not manager.engine
+    assert bind(manager.get_read_session("reader")) is manager.read_engine
+    manager._mark_write("writer")
+    assert bind(manager.get_read_session("writer")) is manager.engine
+    assert bind(manager.get_read_session("reader")) is manager.read_engine
+    monkeypatch.setattr(Config, "READ_YOUR_WRITES_SECONDS", 0)
+    assert bind(manager.get_read_session("writer")) is manager.read_engine
+
+def test_insert_ignore_keeps_the_first_row(manager):
+    for body in (b"first", b"second"):
+        session = manager.get_session()
+        try:
+            manager._insert_ignore(session, Blob, {'hash': "h1", 'codec': "raw", 'body': body, 'size': 5}, 'hash')
+            session.commit()
+        finally:
+            session.close()
+    session = manager.get_session()
+    try:
+        rows = session.query(Blob).filter_by(hash="h1").all()
+        assert [row.body for row in rows] == [b"first"]
+    finally:
+        session.close()
+
+def test_rows_round_trip(manager):
+    manager.add_user({'id': "u1", 'email': "u1@sekolah.id", 'name': "Siswa", 'grade_level': "SMP"})
+    manager.save_chat({
+        'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP", 'user_message': "Apa itu sel?", 'ai_response': "Sel adalah ..."
+    })
+    questions = {'multiple_choice': [{'question': "1+1?", 'options': ["A. 2", "B. 3"], 'answer': "A"}],
+                 'essay_questions': ["Jelaskan."]}
+    for score in (80, 60):
+        manager.save_exam({
+            'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP", 'score': score,
+            'exam_data': json.dumps(questions), 'answers': json.dumps({'mc_0': "A", 'essay_0': "jawaban"})
+        })
+    assert [chat.ai_response for chat in manager.get_chat_range("u1", "IPA", 0, 10)] == ["Sel adalah ..."]
+    assert manager.count_user_chats("u1", "IPA") == 1
+    assert [chat['user_message'] for chat in manager.search_chats("u1", "sel")] == ["Apa itu sel?"]
+    rollups = manager.get_rollups(Config.DEFAULT_TENANT, 'day', datetime.utcnow() - timedelta(days=1))
+    assert {row['kind']: row['events'] for row in rollups} == {'chat': 1, 'exam': 2}
+
+def test_postgres_engine_is_pooled(postgres_url):
+    engine = create_db_engine(postgres_url)
+    try:
+        assert engine.pool.size() == Config.DB_POOL_SIZE
+        assert engine.pool._pre_ping
+    finally:
+        engine.dispose()
+
+def test_add_user_returns_its_tenant_and_role(manager, monkeypatch):
+    monkeypatch.setattr(Config, "TEACHER_EMAILS", {"guru@sekolah.id"})
+    data = {'id': "t1", 'email': "guru@sekolah.id", 'name': "Guru"}
+    teacher = manager.add_user(data)
+    student = manager.add_user({'id': "s1", 'email': "siswa@sekolah.id", 'name': "Siswa"})
+    assert (teacher.tenant_id, teacher.role) == (Config.DEFAULT_TENANT, 'teacher')
+    assert (student.tenant_id, student.role) == (Config.DEFAULT_TENANT, 'student')
+    assert data == {'id': "t1", 'email': "guru@sekolah.id", 'name': "Guru"}
+
+def test_token_usage_adds_up_per_minute(manager):
+    now = datetime.utcnow()
+    for tokens in (10, 20):
+        manager.add_token_usage("sekolah", tokens, at=now)
+    manager.add_token_usage("sekolah", 5, at=now - timedelta(hours=2))  # pruned by the next write
+    manager.add_token_usage("sekolah", 1, at=now)
+    assert manager.get_token_usage("sekolah", now - timedelta(hours=3)) == 31
+
+def _blobs(db):
+    session = db.get_session()
+    try:
+        return {blob.hash: (blob.codec, blob.size, len(blob.body)) for blob in session.query(Blob)}
+    finally:
+        session.close()
+
+def test_short_text_is_stored_raw():
+    assert compress_text("Sel adalah ...") == ('raw', "Sel adalah ...".encode('utf-8'))
+    text = "é" * (MIN_COMPRESS_BYTES // 2 - 1)
+    assert compress_text(text)[0] == 'raw'
+    assert decompress_text(*compress_text(text)) == text
+
+def test_long_text_round_trips_through_zlib(monkeypatch):
+    monkeypatch.setattr(compression, "zstandard", None)
+    text = "Fotosintesis mengubah cahaya menjadi energi kimia. " * 20
+    codec, body = compress_text(text)
+    assert codec == 'zlib' and len(body) < len(text)
+    assert decompress_text(codec, body) == text
+
+def test_long_text_round_trips_through_zstd():
+    pytest.importorskip("zstandard")
+    text = "Fotosintesis mengubah cahaya menjadi energi kimia. " * 20
+    codec, body = compress_text(text)
+    assert codec == 'zstd' and len(body) < len(text)
+    assert decompress_text(codec, body) == text
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        decompress_text('lz4', b"")
+
+def test_identical_answers_share_one_blob(manager):
+    manager.add_user({'id': "u1", 'email': "u1@sekolah.id", 'name': "Siswa"})
+    manager.add_user({'id': "u2", 'email': "u2@sekolah.id", 'name': "Siswa 2"})
+    answer = "Sel adalah unit terkecil makhluk hidup yang dapat menjalankan fungsi kehidupan. " * 5
+    for user_id in ("u1", "u2"):
+        manager.save_chat({'user_id': user_id, 'subject': "IPA", 'grade_level': "SMP",
+                           'user_message': "Apa itu sel?", 'ai_response': answer})
+    manager.set_cache("q1", "Apa itu sel?", answer, "IPA", "SMP")
+    manager.save_chat({'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP",
+                       'user_message': "Halo", 'ai_response': "Halo juga!"})
+    
+    blobs = _blobs(manager)
+    assert len(blobs) == 2
+    codec, size, stored = blobs[content_hash(answer)]
+    assert codec in ('zstd', 'zlib') and size == len(answer.encode('utf-8')) and stored < size
+    assert blobs[content_hash("Halo juga!")][0] == 'raw'
+    assert [chat.ai_response for chat in manager.get_chat_range("u2", "IPA", 0, 10)] == [answer]
+
+def test_legacy_inline_rows_read_next_to_blob_rows(manager):
+    manager.add_user({'id': "u1", 'email': "u1@sekolah.id", 'name': "Siswa"})
+    session = manager.get_session()
+    try:
+        # Written before the blob store: the text is inline and there is no hash
+        session.add(ChatSession(user_id="u1", subject="IPA", grade_level="SMP", user_message="Apa itu atom?",
+                                ai_response="Atom adalah partikel terkecil.",
+                                created_at=datetime.utcnow() - timedelta(days=1)))
+        session.commit()
+    finally:
+        session.close()
+    manager.save_chat({'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP",
+                       'user_message': "Apa itu sel?", 'ai_response': "Sel adalah unit terkecil."})
+    
+    chats = manager.get_chat_range("u1", "IPA", 0, 10)
+    assert [chat.response_hash is None for chat in chats] == [True, False]
+    assert [chat.ai_response for chat in chats] == ["Atom adalah partikel terkecil.", "Sel adalah unit terkecil."]
+    assert [chat['ai_response'] for chat in manager.search_chats("u1", "atom")] == ["Atom adalah partikel terkecil."]
+
+EXAM_QUESTIONS = {
+    'multiple_choice': [
+        {'question': "1+1?", 'options': ["A. 2", "B. 3"], 'answer': "A"},
+        {'question': "Ibu kota Indonesia?", 'options': ["A. Bandung", "B. Jakarta"], 'correct_answer': "b"}
+    ],
+    'essay_questions': ["Jelaskan fotosintesis."]
+}
+
+def _exams(db):
+    session = db.get_session()
+    try:
+        return session.query(Exam).order_by(Exam.id).all()
+    finally:
+        session.close()
+
+def _save_attempt(db, user_id, answers, scores=None, questions=EXAM_QUESTIONS):
+    db.save_exam({
+        'user_id': user_id, 'subject': "IPA", 'grade_level': "SMP", 'score': 50,
+        'exam_data': json.dumps(questions), 'answers': json.dumps(answers), 'question_scores': scores
+    })
+
+def test_identical_question_sets_share_one_template(manager):
+    for user_id in ("u1", "u2"):
+        manager.add_user({'id': user_id, 'email': f"{user_id}@sekolah.id", 'name': user_id})
+    _save_attempt(manager, "u1", {'mc_0': "A"})
+    # Same questions with the keys in another order
+    reordered = json.loads(json.dumps(EXAM_QUESTIONS), object_pairs_hook=lambda pairs: dict(reversed(pairs)))
+    _save_attempt(manager, "u2", {'mc_1': "B"}, questions=reordered)
+    _save_attempt(manager, "u2", {}, questions={'multiple_choice': [], 'essay_questions': ["Lain."]})
+    
+    exams = _exams(manager)
+    assert exams[0].template_id == exams[1].template_id != exams[2].template_id
+    session = manager.get_session()
+    try:
+        assert session.query(ExamTemplate).count() == 2
+        template = session.get(ExamTemplate, exams[0].template_id)
+        assert (template.mc_count, template.essay_count, template.answer_key) == (2, 1, "AB")
+        assert template.questions == EXAM_QUESTIONS
+    finally:
+        session.close()
+
+def test_exam_rows_keep_the_old_json_shape(manager):
+    manager.add_user({'id': "u1", 'email': "u1@sekolah.id", 'name': "Siswa"})
+    answers = {'mc_0': "A", 'essay_0': "Tumbuhan membuat makanan dari cahaya."}
+    _save_attempt(manager, "u1", answers)
+    _save_attempt(manager, "u1", {'mc_1': "B"})
+    session = manager.get_session()
+    try:
+        # Written before templates: both documents are inline
+        session.add(Exam(user_id="u1", subject="IPA", score=70, exam_data=json.dumps(EXAM_QUESTIONS),
+                         answers=json.dumps({'mc_1': "A"})))
+        session.commit()
+    finally:
+        session.close()
+    
+    first, second, legacy = _exams(manager)
+    assert (first.mc_answers, json.loads(first.essay_answers)) == ("A-", [answers['essay_0']])
+    assert json.loads(first.exam_data) == EXAM_QUESTIONS
+    assert json.loads(first.answers) == answers
+    assert json.loads(second.answers) == {'mc_1': "B"}
+    assert legacy.template_id is None
+    assert json.loads(legacy.exam_data) == EXAM_QUESTIONS
+    assert json.loads(legacy.answers) == {'mc_1': "A"}
+
+def test_question_stats_count_answers_and_correct_rates(manager):
+    for user_id in ("u1", "u2", "u3", "u4"):
+        manager.add_user({'id': user_id, 'email': f"{user_id}@sekolah.id", 'name': user_id})
+    _save_attempt(manager, "u1", {'mc_0': "A", 'mc_1': "B"}, [10, 10, 80])
+    _save_attempt(manager, "u2", {'mc_0': "B", 'mc_1': "B"}, [0, 10, 40])
+    _save_attempt(manager, "u3", {'mc_0': "A"}, [10, 0, None])
+    _save_attempt(manager, "u4", {'mc_0': "A", 'mc_1': "A"})
+    
+    stats = manager.get_question_stats(_exams(manager)[0].template_id)
+    assert [item['kind'] for item in stats] == ['multiple_choice', 'multiple_choice', 'essay']
+    assert all(item['attempts'] == 4 for item in stats)
+    assert [item['answers'] for item in stats] == [{'A': 3, 'B': 1}, {'B': 2, 'A': 1}, {}]
+    assert [item.get('correct_rate') for item in stats] == [0.75, 0.5, None]
+    assert [item['average_score'] for item in stats] == pytest.approx([20 / 3, 20 / 3, 60])
+    assert manager.get_question_stats(999) == []
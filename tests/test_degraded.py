@@ -0,0 +1,86 @@
+import pytest
+from ai_service import AIService
+from cache_manager import CacheManager
+from circuit_breaker import BreakerRegistry, CircuitBreaker
+from config import Config
+from metrics import registry
+from single_flight import SingleFlight
+
+class DownAI:
+    current_provider = "down"
+    
+    def get_response(self, prompt, subject, grade_level):
+        raise RuntimeError("provider down")
+
+def _service(db):
+    return AIService(ai=DownAI(), cache=CacheManager(db), flights=SingleFlight(), breakers=BreakerRegistry())
+
+def test_degraded_reply_uses_the_closest_cached_chat_answer(db):
+    cache = CacheManager(db)
+    cache.save_chat_response("Apa itu fotosintesis pada tumbuhan?", "Fotosintesis adalah ...", "IPA", "SMP")
+    cache.save_chat_response("Apa itu respirasi sel?", "Respirasi adalah ...", "IPA", "SMP")
+    response, degraded = _service(db).get_response_with_fallback(
+        "Jelaskan fotosintesis tumbuhan", "IPA", "SMP", "Jelaskan fotosintesis tumbuhan"
+    )
+    assert degraded
+    assert response == "Fotosintesis adalah ..."
+
+def test_similarity_is_symmetric_and_thresholded(db):
+    cache = CacheManager(db)
+    # Covers every word of the question but is mostly about something else
+    cache.save_chat_response(
+        "fotosintesis dan hubungannya dengan rantai makanan ekosistem hutan hujan tropis",
+        "Panjang ...", "IPA", "SMP"
+    )
+    assert cache.find_similar_response("fotosintesis", "IPA", "SMP") is None
+    words, other = cache._words("apa itu fotosintesis"), cache._words("fotosintesis itu apa sih")
+    assert cache.similarity(words, other) == cache.similarity(other, words)
+
+def test_only_chat_replies_are_candidates(db):
+    cache = CacheManager(db)
+    question = "Ringkasan percakapan tentang fotosintesis"
+    cache.save_to_cache(question, "ringkasan lama", "IPA", "SMP")
+    assert cache.find_similar_response(question, "IPA", "SMP") is None
+    response, degraded = _service(db).get_response_with_fallback(question, "IPA", "SMP", question)
+    assert degraded
+    assert response == AIService.canned_response("IPA")
+
+def test_degraded_chat_history_is_not_reused(db):
+    db.save_chat({
+        'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP", 'user_message': "Apa itu fotosintesis?",
+        'ai_response': "Maaf, guru AI sedang tidak dapat dihubungi.", 'ai_provider': 'degraded'
+    })
+    assert CacheManager(db).find_similar_response("Apa itu fotosintesis?", "IPA", "SMP") is None
+
+class FailoverAI:
+    """Tries "primary" first and answers from "backup" while the primary is down"""
+    current_provider = "primary"
+    
+    def __init__(self, backup_up=True):
+        self.backup_up = backup_up
+        self.last_provider = None
+    
+    def get_response(self, prompt, subject, grade_level):
+        self.last_provider = "backup"
+        if not self.backup_up:
+            raise RuntimeError("every provider down")
+        return "jawaban cadangan"
+
+def test_failover_is_charged_to_the_provider_that_failed(db):
+    breakers = BreakerRegistry()
+    service = AIService(ai=FailoverAI(), cache=CacheManager(db), flights=SingleFlight(), breakers=breakers)
+    before = len(registry.samples("generate_response", "backup"))
+    for _ in range(Config.BREAKER_MIN_CALLS):
+        assert service.generate_response("Halo", "IPA", "SMP") == "jawaban cadangan"
+    assert breakers.get("primary").state == CircuitBreaker.OPEN
+    assert breakers.get("backup").state == CircuitBreaker.CLOSED
+    assert len(registry.samples("generate_response", "backup")) == before + Config.BREAKER_MIN_CALLS
+    assert not registry.samples("generate_response", "primary")
+
+def test_failed_failover_opens_the_last_provider_tried(db):
+    breakers = BreakerRegistry()
+    service = AIService(ai=FailoverAI(backup_up=False), cache=CacheManager(db), flights=SingleFlight(), breakers=breakers)
+    for _ in range(Config.BREAKER_MIN_CALLS):
+        with pytest.raises(RuntimeError):
+            service.generate_response("Halo", "IPA", "SMP")
+    assert breakers.get("backup").state == CircuitBreaker.OPEN
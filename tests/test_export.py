@@ -0,0 +1,70 @@
+import csv
+import json
+from datetime import datetime, timedelta
+import pytest
+from database import EXPORT_COLUMNS, ChatSession, DatabaseManager
+from export import export_records
+
+@pytest.fixture
+def manager(db_url):
+    db = DatabaseManager(url=db_url)
+    db.add_user({'id': "u1", 'email': "u1@sekolah.id", 'name': "Siswa"})
+    db.add_user({'id': "u2", 'email': "u2@lain.id", 'name': "Lain", 'tenant_id': "lain"})
+    yield db
+    db.close()
+
+def _rows(manager, dataset, **filters):
+    return [row for batch in manager.export_rows(dataset, batch_size=2, **filters) for row in batch]
+
+def test_chats_stream_in_batches_with_full_responses(manager):
+    long_answer = "Fotosintesis adalah proses ... " * 200  # stored compressed
+    for i in range(5):
+        manager.save_chat({
+            'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP",
+            'user_message': f"soal {i}", 'ai_response': long_answer, 'ai_provider': "fake"
+        })
+    session = manager.get_session()
+    try:
+        # Row written before responses moved to blobs
+        session.add(ChatSession(user_id="u1", subject="IPA", grade_level="SMP", user_message="lama", _ai_response="inline"))
+        session.commit()
+    finally:
+        session.close()
+    
+    batches = list(manager.export_rows('chats', batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 2, 2]
+    rows = [row for batch in batches for row in batch]
+    assert all(len(row) == len(EXPORT_COLUMNS['chats']) for row in rows)
+    assert [row[7] for row in rows] == [long_answer] * 5 + ["inline"]
+    assert {row[2] for row in rows} == {"u1@sekolah.id"}
+
+def test_filters_by_tenant_and_time(manager):
+    manager.save_reflection({'user_id': "u1", 'subject': "IPA", 'reflection_text': "a", 'score': 70})
+    manager.save_reflection({'user_id': "u2", 'tenant_id': "lain", 'subject': "IPA", 'reflection_text': "b", 'score': 80})
+    assert [row[5] for row in _rows(manager, 'reflections', tenant_id="lain")] == ["b"]
+    assert len(_rows(manager, 'reflections')) == 2
+    assert _rows(manager, 'reflections', since=datetime.utcnow() + timedelta(minutes=1)) == []
+    assert len(_rows(manager, 'reflections', until=datetime.utcnow() + timedelta(minutes=1))) == 2
+
+def test_exam_rows_carry_scores_and_grade(manager):
+    questions = {'multiple_choice': [{'question': "Q", 'options': ["A. x", "B. y"], 'answer': "A"}],
+                 'essay_questions': ["E"]}
+    manager.save_exam({
+        'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP", 'score': 90, 'question_scores': [2, 8.0],
+        'exam_data': json.dumps(questions), 'answers': json.dumps({'mc_0': "A", 'essay_0': "jawab"})
+    })
+    (row,) = _rows(manager, 'exams')
+    assert row[5:9] == ("SMP", 90, "2,8", "A")
+
+def test_unknown_dataset_fails(manager):
+    with pytest.raises(ValueError):
+        _rows(manager, 'grades')
+
+def test_csv_export_writes_header_and_rows(manager, tmp_path):
+    manager.save_reflection({'user_id': "u1", 'subject': "IPA", 'reflection_text': "baris,dengan koma", 'score': 70})
+    path = tmp_path / "out" / "reflections.csv"
+    assert export_records(manager, 'reflections', str(path)) == 1
+    with open(path, newline="", encoding="utf-8") as f:
+        header, row = list(csv.reader(f))
+    assert header == [name for name, _ in EXPORT_COLUMNS['reflections']]
+    assert row[5] == "baris,dengan koma"
@@ -0,0 +1,11 @@
+import argparse
+import os
+from benchmark import run_importtime
+
+# Cold imports vary with the machine; CI can tighten or loosen the budget
+BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 1500))
+
+def test_app_import_stays_within_budget():
+    report = run_importtime(argparse.Namespace(module="app", runs=3, budget_ms=BUDGET_MS, top=5))
+    assert not report["deferred_modules_loaded"], f"imported eagerly: {report['deferred_modules_loaded']}"
+    assert not report["over_budget"], f"import app took {report['import_ms']} ms: {report['slowest_ms']}"
@@ -0,0 +1,117 @@
+import json
+import threading
+from datetime import datetime, timedelta
+from config import Config
+from database import Job
+from job_queue import JobManager
+from tenants import TenantQuotas, charge_tokens
+
+def _stale_job(db, job_id, status="running"):
+    db.create_job({
+        'id': job_id,
+        'user_id': "u1",
+        'kind': 'echo',
+        'payload': json.dumps({'n': 1}),
+        'status': status
+    })
+    session = db.get_session()
+    try:
+        session.query(Job).filter_by(id=job_id).update({'updated_at': datetime.utcnow() - timedelta(hours=1)})
+        session.commit()
+    finally:
+        session.close()
+
+def test_submit_runs_job_and_stores_result(db):
+    jobs = JobManager(db, {'echo': lambda payload: {'echo': payload['n']}}, max_workers=2)
+    try:
+        job_id = jobs.submit('echo', {'n': 7}, "u1")
+        assert jobs.wait(job_id, 5) == {'status': 'done', 'result': {'echo': 7}, 'error': None}
+    finally:
+        jobs.shutdown()
+
+def test_stale_job_is_recovered_by_one_process_only(db, monkeypatch):
+    calls = []
+    lock = threading.Lock()
+    
+    def echo(payload):
+        with lock:
+            calls.append(payload['n'])
+        return payload
+    
+    _stale_job(db, "stale1")
+    # Two processes starting at once both see the job as stale before either requeues it
+    stale = db.get_stale_jobs(datetime.utcnow() - timedelta(minutes=5))
+    monkeypatch.setattr(db, "get_stale_jobs", lambda stale_before: stale)
+    first = JobManager(db, {'echo': echo}, max_workers=2)
+    second = JobManager(db, {'echo': echo}, max_workers=2)
+    try:
+        first.recover()
+        second.recover()
+        assert first.wait("stale1", 5)['status'] == 'done'
+    finally:
+        first.shutdown()
+        second.shutdown()
+    assert calls == [1]
+
+def test_claim_job_is_conditional(db):
+    _stale_job(db, "job1", status="pending")
+    assert db.claim_job("job1", ('pending',), status='running')
+    assert not db.claim_job("job1", ('pending',), status='running')
+    assert not db.claim_job("job1", ('running',), datetime.utcnow() - timedelta(minutes=5), status='pending')
+    assert db.get_job("job1").status == 'running'
+
+def test_scheduler_reads_limits_outside_its_lock():
+    from concurrent.futures import ThreadPoolExecutor
+    from job_queue import FairScheduler
+    
+    class Quotas:
+        def max_concurrent(self, tenant_id):
+            assert not scheduler._lock.locked(), "limits loaded while holding the scheduler lock"
+            return 1
+    
+    done = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = FairScheduler(executor, 2, Quotas())
+        scheduler.submit("school-a", done.set)
+        assert done.wait(5)
+
+def test_submission_nonce_deduplicates_repeats_only(db):
+    jobs = JobManager(db, {'echo': lambda payload: payload}, max_workers=2)
+    try:
+        first = jobs.submit('echo', {'message': "lanjut"}, "u1", submission="nonce-1")
+        assert jobs.submit('echo', {'message': "lanjut"}, "u1", submission="nonce-1") == first
+        second = jobs.submit('echo', {'message': "lanjut"}, "u1", submission="nonce-2")
+        assert second != first
+        assert jobs.submit('echo', {'message': "lanjut"}, "u2", submission="nonce-1") not in (first, second)
+        assert jobs.wait(second, 5)['status'] == 'done'
+    finally:
+        jobs.shutdown()
+
+def test_token_quota_is_shared_by_every_process(db, monkeypatch):
+    monkeypatch.setattr(Config, "TENANT_HOURLY_TOKEN_QUOTA", 100)
+    
+    def spend(payload):
+        charge_tokens(payload['tokens'])
+        return payload
+    
+    first = JobManager(db, {'spend': spend}, max_workers=1)
+    second = JobManager(db, {'spend': spend}, max_workers=1)
+    try:
+        assert first.wait(first.submit('spend', {'tokens': 150}, "u1"), 5)['status'] == 'done'
+        result = second.wait(second.submit('spend', {'tokens': 1}, "u1"), 5)
+        assert result['status'] == 'failed' and "Kuota" in result['error']
+        assert second.wait(second.submit('spend', {'tokens': 1}, "u2", tenant_id="lain"), 5)['status'] == 'done'
+    finally:
+        first.shutdown()
+        second.shutdown()
+
+def test_token_usage_slides_over_the_last_hour(db):
+    quotas = TenantQuotas(db)
+    now = datetime.utcnow()
+    db.add_token_usage("sekolah", 40, at=now - timedelta(minutes=90))
+    db.add_token_usage("sekolah", 30, at=now - timedelta(minutes=30))
+    quotas.record("sekolah", 20)
+    quotas.record("sekolah", 5)
+    assert quotas.tokens_used("sekolah") == 55
+    assert TenantQuotas(db).tokens_used("sekolah") == 55
+    assert quotas.tokens_used("lain") == 0
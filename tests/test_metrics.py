@@ -0,0 +1,64 @@
+import pytest
+import metrics
+from metrics import MetricsRegistry, track_ai_call
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = MetricsRegistry(window=100, export_path=None)
+    monkeypatch.setattr(metrics, "registry", registry)
+    return registry
+
+def test_track_ai_call_records_tokens_cache_and_errors(registry):
+    with track_ai_call("get_response", "gemini", "IPA") as record:
+        record.mark_first_token()
+        record.input_tokens, record.output_tokens = 12, 30
+    with track_ai_call("get_response", "gemini", "IPA") as record:
+        record.cache_hit = True
+    with pytest.raises(RuntimeError):
+        with track_ai_call("get_response", "gemini", "IPA"):
+            raise RuntimeError("provider down")
+    
+    text = registry.render_prometheus()
+    series = 'operation="get_response",provider="gemini",subject="IPA"'
+    assert f'ai_calls_total{{{series},cache="miss"}} 2' in text
+    assert f'ai_calls_total{{{series},cache="hit"}} 1' in text
+    assert f'ai_input_tokens_total{{{series}}} 12' in text
+    assert f'ai_output_tokens_total{{{series}}} 30' in text
+    assert f'ai_errors_total{{{series}}} 1' in text
+    assert f'ai_call_duration_seconds_count{{{series}}} 3' in text
+
+def test_subject_defaults_to_a_dash(registry):
+    with track_ai_call("grade_exam", "fake"):
+        pass
+    assert len(registry.samples("grade_exam", subject="-")) == 1
+
+def test_percentiles_filter_by_series(registry):
+    for provider, values in (("a", range(1, 101)), ("b", [5.0] * 10)):
+        for value in values:
+            record = metrics.CallRecord("get_response", provider, "IPA")
+            record.finished = record.started + value
+            registry.observe(record)
+    
+    assert registry.percentiles("get_response", "a") == pytest.approx({'p50': 51, 'p95': 95, 'p99': 99})
+    assert registry.percentiles("get_response", "b") == pytest.approx({'p50': 5, 'p95': 5, 'p99': 5})
+    assert len(registry.samples("get_response")) == 110
+    assert registry.percentiles("grade_exam") == {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+
+def test_window_keeps_only_the_latest_calls():
+    registry = MetricsRegistry(window=3, export_path=None)
+    for value in (100, 1, 2, 3):
+        record = metrics.CallRecord("get_response", "a")
+        record.finished = record.started + value
+        registry.observe(record)
+    assert registry.samples("get_response") == pytest.approx([1, 2, 3])
+
+def test_label_values_are_escaped():
+    labels = MetricsRegistry._label_set({'subject': 'Bahasa "Jawa"', 'path': "C:\\data", 'note': "a\nb"})
+    assert labels == '{subject="Bahasa \\"Jawa\\"",path="C:\\\\data",note="a\\nb"}'
+    assert MetricsRegistry._label_set({}) == ""
+
+def test_gauges_are_rendered_with_escaped_labels(registry):
+    registry.set_gauges("app_jobs", "Queued jobs", [({'tenant': 'se"kolah'}, 3)])
+    text = registry.render_prometheus()
+    assert "# TYPE app_jobs gauge" in text
+    assert 'app_jobs{tenant="se\\"kolah"} 3' in text
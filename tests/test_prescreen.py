@@ -0,0 +1,70 @@
+import json
+import pytest
+from prescreen import PrescreenManager, check_text, minhash
+
+SLANG_REFLECTION = (
+    "sy blajar ttg kejujuran dr crita ini, yg pntg kita hrs jujur walaupun susah krn klo bohong nanti "
+    "org lain tdk percaya lg sm kita jd malu"
+)
+LONG_ANSWER = (
+    "Fotosintesis adalah proses tumbuhan hijau membuat makanan sendiri dengan bantuan cahaya matahari. "
+    "Di dalam daun ada klorofil yang menangkap cahaya, lalu air dari akar dan karbon dioksida dari udara "
+    "diubah menjadi glukosa dan oksigen yang dilepaskan ke udara sekitar kita setiap hari."
+)
+QUESTIONS = {'multiple_choice': [], 'essay_questions': [{'question': "Sebutkan dua hasil dari proses fotosintesis pada tumbuhan hijau."}]}
+
+@pytest.fixture
+def prescreen(db):
+    for user_id in ("u1", "u2"):
+        db.add_user({'id': user_id, 'email': f"{user_id}@sekolah.id", 'name': user_id})
+    return PrescreenManager(db)
+
+def _save_exam(db, user_id, answer):
+    db.save_exam({
+        'user_id': user_id, 'subject': "IPA", 'score': 80, 'exam_data': json.dumps(QUESTIONS),
+        'answers': json.dumps({'essay_0': answer}), 'essay_signatures': [minhash(answer)]
+    })
+
+def test_abbreviated_writing_is_not_gibberish():
+    assert len(SLANG_REFLECTION.split()) == 27
+    assert check_text(SLANG_REFLECTION, 20) is None
+
+def test_keyboard_mashing_is_gibberish():
+    assert check_text("asdfghjkl qwrtplkjh zxcvbnmm " * 3, 5, None)['reason'] == 'gibberish'
+
+def test_repeated_words_and_short_answers():
+    assert check_text("bagus " * 12, 5, None)['reason'] == 'repetitive'
+    assert check_text("tidak tahu", 5, None)['reason'] == 'too_short'
+
+def test_language_is_checked_for_reflections():
+    english = "I learned that being honest is important because people will trust you and it is the right thing to do always"
+    assert check_text(english, 20)['reason'] == 'language'
+    assert check_text(english, 20, ("id", "en")) is None
+
+def test_short_identical_essays_go_to_the_model(prescreen, db):
+    answer = "Hasilnya adalah glukosa dan oksigen."
+    _save_exam(db, "u2", answer)
+    assert prescreen.screen_essays(QUESTIONS, {'essay_0': answer}, "u1", [minhash(answer)]) == [None]
+
+def test_long_copied_essay_is_a_duplicate(prescreen, db):
+    _save_exam(db, "u2", LONG_ANSWER)
+    assert prescreen.screen_essays(QUESTIONS, {'essay_0': LONG_ANSWER}, "u1", [minhash(LONG_ANSWER)]) == ['duplicate']
+    # The author resubmitting their own answer is not copying
+    assert prescreen.screen_essays(QUESTIONS, {'essay_0': LONG_ANSWER}, "u2", [minhash(LONG_ANSWER)]) == [None]
+
+def test_essay_copying_the_question(prescreen):
+    answer = "dua hasil dari proses fotosintesis pada tumbuhan"
+    assert prescreen.screen_essays(QUESTIONS, {'essay_0': answer}, "u1", [minhash(answer)]) == ['copied_question']
+
+def test_reflection_duplicates_need_enough_words(prescreen, db):
+    db.save_reflection({'user_id': "u2", 'subject': "IPA", 'reflection_text': SLANG_REFLECTION,
+                        'score': 80, 'signature': minhash(SLANG_REFLECTION)})
+    assert prescreen.screen_reflection(SLANG_REFLECTION, None, "IPA", "u1") is None
+    
+    db.save_reflection({'user_id': "u2", 'subject': "IPA", 'reflection_text': LONG_ANSWER,
+                        'score': 80, 'signature': minhash(LONG_ANSWER)})
+    assert prescreen.screen_reflection(LONG_ANSWER, None, "IPA", "u1")['prescreen'] == 'duplicate'
+
+def test_reflection_copied_from_the_story(prescreen):
+    result = prescreen.screen_reflection(LONG_ANSWER, "Cerita hari ini. " + LONG_ANSWER, "IPA", "u1")
+    assert result['prescreen'] == 'copied_story'
@@ -0,0 +1,55 @@
+import pytest
+from prompts import PromptBudgetError, PromptTemplate, prompts
+
+def _template(**overrides):
+    options = dict(
+        name="test",
+        system="""
+            Aturan tetap.
+            Tanpa isian.
+        """,
+        user="""
+            Mata pelajaran: {subject}
+            Pertanyaan: {question}
+        """,
+        max_tokens=40,
+        clip="question"
+    )
+    options.update(overrides)
+    return PromptTemplate(**options)
+
+def test_system_prefix_is_static_and_the_user_part_formatted():
+    template = _template()
+    first, second = template.render(subject="IPA", question="Apa itu sel?"), template.render(subject="IPS", question="Apa itu pasar?")
+    assert first.system == second.system == "Aturan tetap.\nTanpa isian."
+    assert first.user == "Mata pelajaran: IPA\nPertanyaan: Apa itu sel?"
+    assert first.text == f"{first.system}\n\n{first.user}"
+    assert not first.clipped and first.tokens <= template.max_tokens
+
+def test_missing_fields_are_reported():
+    with pytest.raises(KeyError, match="question"):
+        _template().render(subject="IPA")
+
+def test_long_clip_field_is_shortened_to_fit():
+    question = "kenapa langit berwarna biru " * 20
+    prompt = _template().render(subject="IPA", question=question)
+    assert prompt.clipped
+    assert prompt.tokens <= 40
+    assert prompt.user.startswith("Mata pelajaran: IPA\nPertanyaan: kenapa langit")
+    assert prompt.user.endswith("...")
+
+def test_prompt_over_budget_without_room_to_clip():
+    with pytest.raises(PromptBudgetError):
+        _template(clip=None).render(subject="IPA", question="x" * 400)
+    with pytest.raises(PromptBudgetError):
+        _template().render(subject="IPA " * 100, question="Apa itu sel?")
+
+def test_clip_field_must_exist():
+    with pytest.raises(ValueError):
+        _template(clip="idea")
+
+def test_registered_templates_fit_their_budget_with_empty_fields():
+    for name in prompts.names():
+        template = prompts.get(name)
+        prompt = template.render(**{field: "-" for field in template.fields})
+        assert prompt.tokens <= template.max_tokens
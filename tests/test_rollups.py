@@ -0,0 +1,51 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from database import ActivityRollup, DatabaseManager
+
+@pytest.fixture
+def manager(db_url):
+    db = DatabaseManager(url=db_url)
+    db.add_user({'id': "u1", 'email': "u1@sekolah.id", 'name': "Siswa"})
+    db.add_user({'id': "u2", 'email': "u2@lain.id", 'name': "Lain", 'tenant_id': "lain"})
+    yield db
+    db.close()
+
+def _snapshot(db):
+    session = db.get_session()
+    try:
+        return sorted(
+            (r.tenant_id, r.period, r.bucket_start, r.kind, r.subject, r.grade_level, r.score_bin, r.events, r.score_total)
+            for r in session.query(ActivityRollup)
+        )
+    finally:
+        session.close()
+
+def test_incremental_rollups_match_a_rebuild(manager):
+    earlier = datetime.utcnow() - timedelta(days=2, hours=3)
+    questions = json.dumps({'multiple_choice': [], 'essay_questions': ["E"]})
+    manager.insert_rows([
+        ('chat_sessions', {'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP", 'user_message': "a", 'ai_response': "b"}),
+        ('chat_sessions', {'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP", 'user_message': "c",
+                           'ai_response': "d", 'created_at': earlier}),
+        ('reflections', {'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP", 'reflection_text': "r", 'score': 75}),
+        ('reflections', {'user_id': "u1", 'subject': "IPS", 'reflection_text': "tanpa jenjang", 'score': 100}),
+        ('reflections', {'user_id': "u2", 'tenant_id': "lain", 'subject': "IPA", 'reflection_text': "s", 'score': None}),
+        ('exams', {'user_id': "u1", 'subject': "IPA", 'grade_level': "SMA", 'score': 42,
+                   'exam_data': questions, 'answers': "{}"}),
+        # Older attempt without its own grade: the rebuild falls back to the template's
+        ('exams', {'user_id': "u1", 'subject': "IPA", 'score': 88, 'exam_data': questions, 'answers': "{}"})
+    ])
+    manager.save_reflection({'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP", 'reflection_text': "r2", 'score': 71})
+    incremental = _snapshot(manager)
+    assert incremental
+    
+    assert manager.rebuild_rollups() == len(incremental)
+    assert _snapshot(manager) == incremental
+
+def test_tenant_rebuild_leaves_other_tenants_alone(manager):
+    manager.save_reflection({'user_id': "u1", 'subject': "IPA", 'reflection_text': "a", 'score': 70})
+    manager.save_reflection({'user_id': "u2", 'tenant_id': "lain", 'subject': "IPA", 'reflection_text': "b", 'score': 80})
+    before = _snapshot(manager)
+    manager.rebuild_rollups("lain")
+    assert _snapshot(manager) == before
@@ -0,0 +1,48 @@
+import pytest
+from cache_manager import CacheManager
+
+def _chat(db, user_id, message, tenant_id="default", response="jawaban"):
+    db.save_chat({
+        'user_id': user_id, 'tenant_id': tenant_id, 'subject': "IPA", 'grade_level': "SMP",
+        'user_message': message, 'ai_response': response
+    })
+
+@pytest.fixture(params=["fts", "like"])
+def search_db(request, db, monkeypatch):
+    """The same database searched through FTS5 and through the LIKE fallback"""
+    if request.param == "like":
+        monkeypatch.setattr(db, "search_enabled", False)
+    elif not db.search_enabled:
+        pytest.skip("SQLite built without FTS5")
+    return db
+
+def test_user_search_only_returns_that_users_chats(search_db):
+    # Ids that tokenize to the same phrase must still be told apart
+    _chat(search_db, "siswa_1", "fotosintesis milik siswa satu")
+    _chat(search_db, "siswa-1", "fotosintesis milik siswa lain")
+    _chat(search_db, "x_siswa_1", "fotosintesis milik siswa ketiga")
+    results = search_db.search_chats("siswa_1", "fotosintesis")
+    assert [chat['user_message'] for chat in results] == ["fotosintesis milik siswa satu"]
+
+def test_tenant_search_only_returns_that_tenants_chats(search_db):
+    _chat(search_db, "u1", "fotosintesis sekolah satu", tenant_id="sekolah-1")
+    _chat(search_db, "u2", "fotosintesis sekolah dua", tenant_id="sekolah_1")
+    results = search_db.search_chats(None, "fotosintesis", tenant_id="sekolah-1")
+    assert [chat['user_message'] for chat in results] == ["fotosintesis sekolah satu"]
+
+def test_every_match_is_reachable_by_paging(db):
+    for i in range(35):
+        _chat(db, "u1", f"pertanyaan fotosintesis nomor {i}")
+    seen = set()
+    for offset in range(0, 40, 10):
+        seen.update(chat['id'] for chat in db.search_chats("u1", "fotosintesis", limit=10, offset=offset))
+    assert len(seen) == 35
+
+def test_degraded_match_never_uses_other_students_history(db):
+    if not db.search_enabled:
+        pytest.skip("SQLite built without FTS5")
+    _chat(db, "other", "Apa itu fotosintesis pada tumbuhan?", response="jawaban siswa lain")
+    cache = CacheManager(db)
+    assert cache.find_similar_response("Apa itu fotosintesis pada tumbuhan?", "IPA", "SMP", user_id="me") is None
+    _chat(db, "me", "Apa itu fotosintesis pada tumbuhan?", response="jawaban saya")
+    assert cache.find_similar_response("fotosintesis tumbuhan", "IPA", "SMP", user_id="me") == "jawaban saya"
@@ -0,0 +1,85 @@
+import pytest
+import session_budget
+from config import Config
+from session_budget import SessionBudgetManager, _TrackedSession
+
+class State(dict):
+    """Stand-in for SafeSessionState: item access plus filtered_state"""
+    
+    @property
+    def filtered_state(self):
+        return dict(self)
+
+class FakeRuntime:
+    def __init__(self, active=()):
+        self.active = set(active)
+    
+    def is_active_session(self, session_id):
+        return session_id in self.active
+
+def _turns(count):
+    history = [{'role': "assistant", 'content': "Halo!", 'greeting': True}]
+    for i in range(count):
+        history += [{'role': "user", 'content': f"tanya {i}"}, {'role': "assistant", 'content': f"jawab {i}"}]
+    return history
+
+def test_trim_keeps_the_newest_messages():
+    state = State(chat_history=_turns(5))
+    SessionBudgetManager.trim_chat_history(state, max_messages=4)
+    assert [m['content'] for m in state['chat_history']] == ["tanya 3", "jawab 3", "tanya 4", "jawab 4"]
+    assert state['chat_history_spilled'] == 3  # the greeting is not a stored turn
+
+def test_trim_never_keeps_an_answer_without_its_question():
+    state = State(chat_history=_turns(3), chat_history_spilled=2)
+    SessionBudgetManager.trim_chat_history(state, max_messages=3)
+    assert [m['content'] for m in state['chat_history']] == ["tanya 2", "jawab 2"]
+    assert state['chat_history_spilled'] == 4
+
+def test_trim_leaves_short_histories_alone():
+    history = _turns(1)
+    state = State(chat_history=history)
+    SessionBudgetManager.trim_chat_history(state, max_messages=4)
+    assert state['chat_history'] is history and len(history) == 3
+    assert 'chat_history_spilled' not in state
+    SessionBudgetManager.trim_chat_history(State(), max_messages=4)
+
+@pytest.fixture
+def runtime(monkeypatch):
+    runtime = FakeRuntime()
+    monkeypatch.setattr(session_budget.Runtime, "exists", staticmethod(lambda: True))
+    monkeypatch.setattr(session_budget.Runtime, "instance", staticmethod(lambda: runtime))
+    return runtime
+
+@pytest.fixture
+def budget(runtime):
+    return SessionBudgetManager()
+
+def _track(manager, session_id, state, idle):
+    tracked = _TrackedSession(state)
+    tracked.last_active -= idle
+    manager._sessions[session_id] = tracked
+
+def test_sweep_only_expires_idle_disconnected_sessions(budget, runtime):
+    idle = Config.SESSION_IDLE_SECONDS + 1
+    connected, recent, gone = State(chat_history=_turns(2)), State(chat_history=_turns(2)), State(chat_history=_turns(2))
+    runtime.active.add("connected")
+    _track(budget, "connected", connected, idle)
+    _track(budget, "recent", recent, 5)
+    _track(budget, "gone", gone, idle)
+    report = budget.sweep()
+    assert sorted(entry['session_id'] for entry in report) == ["connected", "recent"]
+    assert len(connected['chat_history']) == 5 and len(recent['chat_history']) == 5
+    assert gone['chat_history'] == [] and gone['chat_history_spilled'] == 2
+    assert "gone" not in budget._sessions
+
+def test_sweep_keeps_an_unsubmitted_exam(budget):
+    exam = {'multiple_choice': [], 'essay_questions': ["E"]}
+    answering = State(exam_questions=exam, exam_answers={'essay_0': "draf"}, essay_0="draf", chat_history=_turns(1))
+    submitted = State(exam_questions=exam, exam_answers={'essay_0': "x"}, essay_0="x", exam_grade_job="job-1")
+    _track(budget, "answering", answering, Config.SESSION_IDLE_SECONDS)
+    _track(budget, "submitted", submitted, Config.SESSION_IDLE_SECONDS)
+    budget.sweep()
+    assert answering['exam_questions'] == exam and answering['essay_0'] == "draf"
+    assert answering['exam_answers'] == {'essay_0': "draf"}
+    assert answering['chat_history'] == []
+    assert submitted['exam_questions'] is None and 'essay_0' not in submitted
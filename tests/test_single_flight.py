@@ -0,0 +1,66 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from single_flight import SingleFlight
+
+def _wait_for_followers(flights, key, followers):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with flights._lock:
+            call = flights._calls.get(key)
+            if call and call.followers >= followers:
+                return
+        time.sleep(0.01)
+    raise AssertionError("followers did not join the flight")
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+    
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+    
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(flights.do, "key", fetch) for _ in range(5)]
+        _wait_for_followers(flights, "key", 4)
+        release.set()
+        results = [future.result() for future in futures]
+    
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["answer"] * 5
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert flights.in_flight() == 0
+
+def test_followers_receive_the_leaders_error():
+    flights = SingleFlight()
+    release = threading.Event()
+    
+    def fail():
+        release.wait(5)
+        raise RuntimeError("provider down")
+    
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(flights.do, "key", fail) for _ in range(3)]
+        _wait_for_followers(flights, "key", 2)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError, match="provider down"):
+                future.result()
+    assert flights.in_flight() == 0
+
+def test_distinct_keys_and_later_calls_run_separately():
+    flights = SingleFlight()
+    calls = []
+    
+    def fetch(value):
+        calls.append(value)
+        return value
+    
+    assert flights.do("a", fetch, 1) == (1, False)
+    assert flights.do("b", fetch, 2) == (2, False)
+    assert flights.do("a", fetch, 3) == (3, False)  # the first flight for "a" has landed
+    assert calls == [1, 2, 3]
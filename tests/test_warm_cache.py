@@ -0,0 +1,65 @@
+import json
+from ai_service import AIService
+from cache_manager import CacheManager
+from circuit_breaker import BreakerRegistry
+from config import Config, subjects_for
+from single_flight import SingleFlight
+from warm_cache import load_questions, warm
+
+TENANT = Config.DEFAULT_TENANT
+
+class StubAI:
+    current_provider = "stub"
+    
+    def __init__(self):
+        self.prompts = []
+    
+    def generate_response(self, prompt, subject, grade_level, operation="generate_response"):
+        self.prompts.append(prompt)
+        return f"jawaban: {prompt}"
+    
+    def get_response(self, prompt, subject, grade_level):
+        raise AssertionError("a warmed question must be served from the cache")
+
+class Quotas:
+    def __init__(self, tokens=True):
+        self.tokens = tokens
+    
+    def has_tokens(self, tenant_id):
+        return self.tokens
+    
+    def record(self, tenant_id, tokens):
+        pass
+
+ITEMS = [("IPA", "SMP", "Apa itu fotosintesis?"), ("IPA", "SMP", "Apa itu sel?"), ("IPA", "SMP", "Apa itu sel?")]
+
+def test_warm_generates_each_question_once_and_skips_cached_ones(db):
+    cache, ai = CacheManager(db), StubAI()
+    report = warm(ai, cache, Quotas(), ITEMS, TENANT, concurrency=2)
+    assert (report["questions"], report["generated"], report["failed"]) == (2, 2, 0)
+    assert sorted(ai.prompts) == ["Apa itu fotosintesis?", "Apa itu sel?"]
+    
+    report = warm(StubAI(), cache, Quotas(), ITEMS, TENANT, concurrency=2)
+    assert (report["already_cached"], report["generated"]) == (2, 0)
+
+def test_warmed_answers_hit_the_chat_cache(db):
+    cache = CacheManager(db)
+    warm(StubAI(), cache, Quotas(), ITEMS[:1], TENANT, concurrency=1)
+    service = AIService(ai=StubAI(), cache=cache, flights=SingleFlight(), breakers=BreakerRegistry())
+    question = "apa itu FOTOSINTESIS"
+    assert service.get_response(question, "IPA", "SMP", question) == "jawaban: Apa itu fotosintesis?"
+
+def test_warm_stops_when_the_quota_is_spent(db):
+    report = warm(StubAI(), CacheManager(db), Quotas(tokens=False), ITEMS, TENANT, concurrency=2)
+    assert (report["generated"], report["errors"]) == (0, {"quota": 2})
+
+def test_load_questions_expands_and_sanitizes(tmp_path):
+    path = tmp_path / "questions.json"
+    path.write_text(json.dumps([
+        {"question": "Apa itu <b>sel</b>?", "subject": "IPA", "grade_level": "SMP"},
+        "Bagaimana cara belajar yang efektif?"
+    ]), encoding="utf-8")
+    items = load_questions(str(path), ["SMP"])
+    assert items[0][:2] == ("IPA", "SMP")
+    assert "<b>" not in items[0][2]
+    assert [subject for subject, _, _ in items[1:]] == list(subjects_for("SMP"))
@@ -0,0 +1,103 @@
+import threading
+import time
+from datetime import datetime
+import pytest
+import database
+from config import Config
+from write_buffer import PendingWrite, WriteBehindBuffer, WriterStoppedError, close_write_buffer, get_write_buffer
+
+def _reflection(user_id="u1"):
+    return {'user_id': user_id, 'subject': "IPA", 'reflection_text': "refleksi", 'score': 80}
+
+def test_group_rows_commit_without_waiting_for_the_flush_window(db):
+    buffer = WriteBehindBuffer(db, flush_seconds=5)
+    try:
+        started = time.monotonic()
+        assert buffer.submit('reflections', _reflection()).result(timeout=3)
+        assert time.monotonic() - started < 1
+    finally:
+        buffer.close()
+
+def test_async_rows_are_still_batched(db):
+    buffer = WriteBehindBuffer(db, flush_seconds=0.5)
+    try:
+        first = buffer.submit('chat_sessions', {
+            'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP", 'user_message': "a", 'ai_response': "b"
+        })
+        second = buffer.submit('chat_sessions', {
+            'user_id': "u2", 'subject': "IPA", 'grade_level': "SMP", 'user_message': "c", 'ai_response': "d"
+        })
+        assert second.result(timeout=3) == first.result(timeout=3) + 1
+    finally:
+        buffer.close()
+
+def test_readers_only_wait_for_their_own_writes(db, monkeypatch):
+    monkeypatch.setattr(Config, "WRITE_BEHIND_ENABLED", True)
+    flushed = []
+    
+    class Buffer:
+        def flush(self):
+            flushed.append(1)
+    
+    monkeypatch.setattr(database, "get_write_buffer", lambda manager: Buffer())
+    db._mark_write("writer")
+    db.count_user_chats("reader", "IPA")
+    db.get_rollups(Config.DEFAULT_TENANT, 'day', datetime.utcnow())
+    assert flushed == []
+    db.count_user_chats("writer", "IPA")
+    assert flushed == [1]
+
+def _chat(message):
+    return {'user_id': "u1", 'subject': "IPA", 'grade_level': "SMP", 'user_message': message, 'ai_response': "jawab"}
+
+def test_rows_survive_a_dead_writer(db, monkeypatch):
+    buffer = WriteBehindBuffer(db, flush_seconds=5)
+    write = buffer._write
+    
+    def crash(batch):
+        write(batch[:1])
+        raise SystemExit("writer killed")
+    monkeypatch.setattr(buffer, "_write", crash)
+    monkeypatch.setattr(threading, "excepthook", lambda args: None)
+    
+    queued = [buffer.submit('chat_sessions', _chat(f"pesan {i}")) for i in range(3)]
+    reflection = buffer.submit('reflections', _reflection())
+    assert reflection.result(timeout=3)
+    buffer._thread.join(timeout=3)
+    assert not buffer.alive
+    assert all(pending.result(timeout=0) for pending in queued)
+    with pytest.raises(WriterStoppedError):
+        buffer.submit('reflections', _reflection())
+    assert db.count_user_chats("u1", "IPA") == 3
+
+def test_saves_fall_back_when_the_writer_is_gone(db, monkeypatch):
+    monkeypatch.setattr(Config, "WRITE_BEHIND_ENABLED", True)
+    buffer = get_write_buffer(db)
+    buffer._queue.put(None)  # stops the thread without closing the buffer
+    buffer._thread.join(timeout=3)
+    monkeypatch.setattr(database, "get_write_buffer", lambda manager: buffer)
+    assert db.save_reflection(_reflection())
+    db.save_chat(_chat("setelah writer mati"))
+    db.flush_writes()
+    assert db.count_user_chats("u1", "IPA") == 1
+
+def test_a_dead_writer_is_replaced(db):
+    buffer = get_write_buffer(db)
+    buffer._queue.put(None)
+    buffer._thread.join(timeout=3)
+    replacement = get_write_buffer(db)
+    try:
+        assert replacement is not buffer and replacement.alive
+    finally:
+        close_write_buffer(db)
+
+def test_group_saves_do_not_wait_forever(db, monkeypatch):
+    monkeypatch.setattr(Config, "WRITE_BEHIND_ENABLED", True)
+    monkeypatch.setattr(Config, "WRITE_COMMIT_TIMEOUT", 0.2)
+    
+    class Stuck:
+        def submit(self, table, data):
+            return PendingWrite(table, data)
+    monkeypatch.setattr(database, "get_write_buffer", lambda manager: Stuck())
+    with pytest.raises(TimeoutError):
+        db.save_exam({'user_id': "u1", 'subject': "IPA", 'score': 1, 'exam_data': "{}", 'answers': "{}"})
@@ -0,0 +1,152 @@
+"""Warm the chat response cache before students arrive.
+
+    python warm_cache.py --questions questions.json
+    python warm_cache.py --top 20 --days 30 --grades SMP SMA --concurrency 4
+
+Answers are generated for a curated question list and/or the questions
+asked most often in chat_sessions, then bulk-loaded into the `cache` table
+in one transaction. The curated list is a JSON array of objects:
+
+    [{"question": "Apa itu fotosintesis?", "subject": "IPA", "grade_level": "SMP"},
+     {"question": "Bagaimana cara belajar yang efektif?"}]
+
+A missing grade_level means every selected grade; a missing subject means
+every chat subject of that grade. Answers are stored as chat replies keyed
+on the normalized question (see CacheManager.chat_key), so they hit the
+cache when a student asks one of them without earlier turns as context. Provider calls are limited to --concurrency at
+once, charged to the tenant's hourly token quota and stop when it runs out.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+from config import Config, subjects_for
+from security import SecurityManager
+from tenants import TenantQuotas, tenant_scope
+
+Item = Tuple[str, str, str]  # (subject, grade_level, question)
+
+def load_questions(path: str, grades: Sequence[str], subjects: Optional[Sequence[str]] = None) -> List[Item]:
+    """Expand a curated question file into (subject, grade_level, question) items"""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    items = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"question": entry}
+        for grade_level in [entry["grade_level"]] if entry.get("grade_level") else grades:
+            offered = subjects_for(grade_level)
+            for subject in [entry["subject"]] if entry.get("subject") else offered:
+                if subject in offered and (not subjects or subject in subjects):
+                    # Sanitized like the chat page does, so the cache key matches a real message
+                    items.append((subject, grade_level, SecurityManager.sanitize_input(entry["question"])))
+    return items
+
+def mine_questions(db, top: int, days: Optional[int], tenant_id: str, grades: Sequence[str],
+                   subjects: Optional[Sequence[str]] = None) -> List[Item]:
+    """Top-N most asked chat messages per subject and grade"""
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    return [
+        (subject, grade_level, message)
+        for subject, grade_level, message, _ in db.get_popular_questions(top, tenant_id, since)
+        if grade_level in grades and (not subjects or subject in subjects)
+    ]
+
+def warm(ai, cache, quotas: TenantQuotas, items: List[Item], tenant_id: str,
+         concurrency: int, refresh: bool = False) -> Dict:
+    """Generate answers for uncached items, then bulk-load them into the cache"""
+    started = time.perf_counter()
+    todo = []
+    seen = set()
+    for item in items:
+        subject, grade_level, question = item
+        if not question or item in seen:
+            continue
+        seen.add(item)
+        if refresh or cache.get_chat_response(question, subject, grade_level, tenant_id) is None:
+            todo.append(item)
+    
+    def generate(item: Item):
+        subject, grade_level, question = item
+        if not quotas.has_tokens(tenant_id):
+            return item, None, "quota"
+        with tenant_scope(tenant_id) as scope:
+            try:
+                response = ai.generate_response(question, subject, grade_level, operation="warm_cache")
+            except Exception as e:
+                return item, None, str(e)
+            finally:
+                quotas.record(tenant_id, scope.tokens)
+        return item, response, None
+    
+    answers = []
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="warm-cache") as executor:
+        for (subject, grade_level, question), response, error in executor.map(generate, todo):
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+            else:
+                answers.append((question, response, subject, grade_level))
+    
+    if answers:
+        cache.save_many(answers, tenant_id, kind='chat')
+    return {
+        "questions": len(seen),
+        "already_cached": len(seen) - len(todo),
+        "generated": len(answers),
+        "failed": sum(errors.values()),
+        "errors": errors,
+        "elapsed_s": round(time.perf_counter() - started, 2)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute chat answers for common questions")
+    parser.add_argument("--questions", help="Curated question list (JSON)")
+    parser.add_argument("--top", type=int, default=0, help="Also warm the N most asked questions per subject and grade")
+    parser.add_argument("--days", type=int, default=30, help="Only mine chats from the last N days (0 = all)")
+    parser.add_argument("--grades", nargs="+", default=list(Config.SUBJECTS), choices=list(Config.SUBJECTS))
+    parser.add_argument("--subjects", nargs="+", help="Limit to these subjects")
+    parser.add_argument("--tenant", default=Config.DEFAULT_TENANT, help="Tenant (school) to warm the cache for")
+    parser.add_argument("--concurrency", type=int, help="Provider calls at once (default: the tenant's job limit)")
+    parser.add_argument("--refresh", action="store_true", help="Regenerate answers that are already cached")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the questions that would be warmed")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+    if not args.questions and not args.top:
+        parser.error("give --questions and/or --top")
+    
+    from ai_service import AIService
+    from cache_manager import CacheManager
+    from database import DatabaseManager
+    
+    db = DatabaseManager()
+    try:
+        items = load_questions(args.questions, args.grades, args.subjects) if args.questions else []
+        if args.top:
+            items += mine_questions(db, args.top, args.days, args.tenant, args.grades, args.subjects)
+        if args.dry_run:
+            for subject, grade_level, question in items:
+                print(f"{grade_level}\t{subject}\t{question}")
+            return 0
+        
+        quotas = TenantQuotas(db)
+        cache = CacheManager(db)
+        concurrency = args.concurrency or quotas.max_concurrent(args.tenant)
+        report = warm(AIService(cache=cache), cache, quotas, items, args.tenant, concurrency, args.refresh)
+    finally:
+        db.close()
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Questions: {report['questions']} ({report['already_cached']} already cached)")
+        print(f"Generated: {report['generated']}, failed: {report['failed']} in {report['elapsed_s']} s")
+        for error, count in report["errors"].items():
+            print(f"ERROR {count}x {error}")
+    return 1 if report["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Write-behind buffer for high-volume inserts.
+
+save_chat, save_reflection and save_exam hand their rows to a single
+background thread per database, which commits them in multi-row
+transactions when WRITE_BATCH_SIZE rows are queued or WRITE_FLUSH_SECONDS
+have passed, and once more at interpreter shutdown. A batch holding a row
+someone waits for is committed as soon as the queue is drained instead.
+
+Durability per table (Config.WRITE_DURABILITY):
+
+- chat_sessions: "async". save_chat returns before the commit. A hard
+  crash can lose at most the last flush window of chat rows; the reply
+  itself is still kept in the job's result row.
+- reflections, exams: "group". The caller blocks until the batch holding
+  its row is committed (group commit), so a graded result is never shown
+  to the student before it is durable. Rows already queued with it share
+  the transaction, but the writer never waits for more, so this adds no
+  flush-window latency. The wait is bounded by Config.WRITE_COMMIT_TIMEOUT.
+
+If the writer thread dies, the rows it held and everything still queued
+are inserted synchronously, one transaction per row. Later submits raise
+WriterStoppedError, and DatabaseManager then inserts directly.
+get_write_buffer starts a fresh writer for the next caller.
+"""
+import atexit
+import queue
+import threading
+import time
+from typing import Dict, List
+from config import Config
+
+class WriterStoppedError(RuntimeError):
+    """The writer thread is no longer running; insert synchronously instead"""
+
+class PendingWrite:
+    """Handle for a queued row; result() waits for its commit"""
+    
+    def __init__(self, table: str, data: Dict):
+        self.table = table
+        self.data = data
+        self.id = None
+        self.error = None
+        self._done = threading.Event()
+    
+    def _finish(self, row_id=None, error=None):
+        self.id = row_id
+        self.error = error
+        self._done.set()
+    
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+    
+    def result(self, timeout: float = None):
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Write to {self.table} not committed in time")
+        if self.error:
+            raise self.error
+        return self.id
+
+class _FlushMarker:
+    def __init__(self):
+        self.done = threading.Event()
+
+class WriteBehindBuffer:
+    def __init__(self, db, batch_size: int = Config.WRITE_BATCH_SIZE,
+                 flush_seconds: float = Config.WRITE_FLUSH_SECONDS):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue()
+        self._closed = False
+        self._inflight: List[PendingWrite] = []
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def submit(self, table: str, data: Dict) -> PendingWrite:
+        if self._closed:
+            raise RuntimeError("Write buffer is closed")
+        if not self.alive:
+            raise WriterStoppedError("Write-behind thread is not running")
+        pending = PendingWrite(table, data)
+        self._queue.put(pending)
+        if not self.alive:
+            self._drain()  # it died after the check; nobody else will write this row
+        return pending
+    
+    @property
+    def alive(self) -> bool:
+        return self._thread.is_alive()
+    
+    def pending(self) -> int:
+        return self._queue.qsize()
+    
+    def flush(self, timeout: float = None):
+        """Block until everything queued before this call is committed"""
+        if self._closed:
+            return
+        if not self.alive:
+            self._drain()
+            return
+        marker = _FlushMarker()
+        self._queue.put(marker)
+        marker.done.wait(timeout)
+    
+    def close(self):
+        """Flush remaining rows and stop the writer thread"""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+    
+    def _run(self):
+        try:
+            self._loop()
+        except BaseException:
+            # Whatever killed the writer, rows callers were promised still get written
+            for pending in self._inflight:
+                if not pending.done:
+                    self._write_one(pending)
+            self._drain()
+            raise
+    
+    def _drain(self):
+        """Write whatever is still queued, synchronously (the writer thread is gone)"""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, _FlushMarker):
+                item.done.set()
+            elif item is not None:
+                self._write_one(item)
+    
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch: List[PendingWrite] = []
+            markers: List[_FlushMarker] = []
+            deadline = time.monotonic() + self.flush_seconds
+            while True:
+                if isinstance(item, _FlushMarker):
+                    markers.append(item)
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                if Config.WRITE_DURABILITY.get(item.table) != 'async':
+                    # Its caller is blocked: take only what is queued already
+                    deadline = time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            self._inflight = batch
+            self._write(batch)
+            self._inflight = []
+            for marker in markers:
+                marker.done.set()
+    
+    def _write(self, batch: List[PendingWrite]):
+        if not batch:
+            return
+        try:
+            ids = self.db.insert_rows([(pending.table, pending.data) for pending in batch])
+            for pending, row_id in zip(batch, ids):
+                pending._finish(row_id)
+        except Exception:
+            # Fall back to one transaction per row so a bad row cannot sink the batch
+            for pending in batch:
+                self._write_one(pending)
+    
+    def _write_one(self, pending: PendingWrite):
+        try:
+            pending._finish(self.db.insert_rows([(pending.table, pending.data)])[0])
+        except Exception as e:
+            pending._finish(error=e)
+
+_buffers: Dict[str, WriteBehindBuffer] = {}
+_buffers_lock = threading.Lock()
+
+def get_write_buffer(db) -> WriteBehindBuffer:
+    """One writer thread per database URL, shared by every DatabaseManager in the process"""
+    key = str(db.engine.url)
+    with _buffers_lock:
+        buffer = _buffers.get(key)
+        if buffer is not None and not buffer._closed and not buffer.alive:
+            buffer.flush()  # writes what the dead writer left behind
+            buffer = None
+        if buffer is None or buffer._closed:
+            buffer = _buffers[key] = WriteBehindBuffer(db)
+    return buffer
+
+def close_write_buffer(db):
+    """Flush and stop the writer thread for db's URL, if one is running"""
+    with _buffers_lock:
+        buffer = _buffers.pop(str(db.engine.url), None)
+    if buffer is not None:
+        buffer.close()